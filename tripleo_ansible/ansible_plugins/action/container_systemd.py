@@ -18,15 +18,19 @@
 from __future__ import absolute_import, division, print_function
 __metaclass__ = type
 
-import copy
 import os
+import time
 
 import tenacity
 import yaml
 
 from ansible.errors import AnsibleActionFail
+from ansible.errors import AnsibleUndefinedVariable
 from ansible.plugins.action import ActionBase
+from ansible.template.vars import AnsibleJ2Vars
 from ansible.utils.display import Display
+from jinja2.exceptions import TemplateSyntaxError
+from jinja2.exceptions import UndefinedError
 
 
 DISPLAY = Display()
@@ -44,6 +48,9 @@ description:
     It takes the container config data in entry to figure out how the unit
     files will be configured. It returns a list of services that were
     restarted.
+  - The units are rendered on the controller and written by a single
+    container_systemd_units module run, which also removes the old
+    healthchecks and requires files and reloads systemd when needed.
 requirements:
   - None
 options:
@@ -52,6 +59,15 @@ options:
       - List of container configurations
     type: list
     elements: dict
+  concurrency:
+    default: 1
+    description:
+      - Number of services started or restarted at the same time. Above 1,
+        the services are managed by a single container_systemd_services
+        module run, a service is managed as soon as the tripleo services in
+        its depends_on are, and its readiness is polled with an exponential
+        backoff.
+    type: int
   systemd_healthchecks:
     default: true
     description:
@@ -83,6 +99,13 @@ restarted:
     sample:
       - tripleo_keystone.service
       - tripleo_mysql.service
+service_timings:
+    description: Seconds spent starting or restarting each service
+    returned: always
+    type: dict
+    sample:
+      tripleo_keystone.service: 2.61
+      tripleo_mysql.service: 4.07
 """
 
 
@@ -110,77 +133,6 @@ class ActionModule(ActionBase):
                 ', '.join(missing)))
         return args
 
-    def _cleanup_requires(self, container_names, task_vars):
-        """Cleanup systemd requires files.
-
-        :param container_names: List of container names.
-        :param task_vars: Dictionary of Ansible task variables.
-        """
-        for name in container_names:
-            path = "/etc/systemd/system/tripleo_{}.requires".format(name)
-            if self.debug:
-                DISPLAY.display('Removing {} file'.format(path))
-            results = self._execute_module(
-                module_name='file',
-                module_args=dict(path=path, state='absent'),
-                task_vars=task_vars
-            )
-            if results.get('changed', False):
-                self.changed = True
-
-    def _delete_service(self, name, task_vars):
-        """Stop and disable a systemd service.
-
-        :param name: String for service name to stop and disable.
-        :param task_vars: Dictionary of Ansible task variables.
-        """
-        tvars = copy.deepcopy(task_vars)
-        results = self._execute_module(
-            module_name='systemd',
-            module_args=dict(state='stopped',
-                             name='tripleo_{}_healthcheck.timer'.format(name),
-                             enabled=False,
-                             daemon_reload=False),
-            task_vars=tvars
-        )
-        return results
-
-    def _cleanup_healthchecks(self, container_names, task_vars):
-        """Cleanup systemd healthcheck files.
-
-        :param container_names: List of container names.
-        :param task_vars: Dictionary of Ansible task variables.
-        """
-        systemd_reload = False
-        for cname in container_names:
-            h_path = os.path.join('/etc/systemd/system',
-                                  'tripleo_{}_healthcheck.timer'.format(cname))
-            healthcheck_stat = self._execute_module(
-                module_name='stat',
-                module_args=dict(path=h_path),
-                task_vars=task_vars
-            )
-            if healthcheck_stat.get('stat', {}).get('exists', False):
-                if self.debug:
-                    DISPLAY.display('Cleaning-up systemd healthcheck for '
-                                    '{}'.format(cname))
-                self._delete_service(cname, task_vars)
-                files_ext = ['service', 'timer']
-                for ext in files_ext:
-                    sysd_base = '/etc/systemd/system'
-                    file_path = 'tripleo_{}_healthcheck.{}'.format(cname, ext)
-                    full_path = os.path.join(sysd_base, file_path)
-                    results = self._execute_module(
-                        module_name='file',
-                        module_args=dict(path=full_path, state='absent'),
-                        task_vars=task_vars
-                    )
-                    if results.get('changed', False):
-                        self.changed = True
-                        systemd_reload = True
-        if systemd_reload:
-            self._systemd_reload(task_vars)
-
     def _get_unit_template(self):
         """Return systemd unit template data
 
@@ -207,63 +159,107 @@ class ActionModule(ActionBase):
             data = template_file.read()
         return data
 
-    def _create_units(self, container_config, task_vars):
-        """Create system units and get list of changed services
+    def _render_units(self, container_config):
+        """Render the systemd units of the containers locally.
+
+        The unit template is compiled once and rendered for every container
+        with container_data_unit set to its config.
 
         :param container_config: List of dictionaries for container configs.
-        :param task_vars: Dictionary of Ansible task variables.
-        :returns changed_containers: List of containers which has a new unit.
+        :returns units: Dictionary of unit content by container name.
         """
-        try:
-            remote_user = self._get_remote_user()
-        except Exception:
-            remote_user = task_vars.get('ansible_user')
-            if not remote_user:
-                remote_user = self._play_context.remote_user
-        tmp = self._make_tmp_path(remote_user)
         unit_template = self._get_unit_template()
-        changed_containers = []
+        try:
+            template = self._templar.environment.from_string(unit_template)
+        except TemplateSyntaxError as e:
+            raise AnsibleActionFail('Unable to compile the systemd unit '
+                                    'template: {}'.format(e))
+        newlines = len(unit_template) - len(unit_template.rstrip('\n'))
+        units = {}
         for container in container_config:
-            for name, config in container.items():
-                dest = '/etc/systemd/system/tripleo_{}.service'.format(name)
-                task_vars['container_data_unit'] = container
-                unit = (self._templar.template(unit_template,
-                                               preserve_trailing_newlines=True,
-                                               escape_backslashes=False,
-                                               convert_data=False))
-                del task_vars['container_data_unit']
-                remote_data = self._transfer_data(
-                    self._connection._shell.join_path(tmp, 'source'), unit)
-
-                results = self._execute_module(
-                    module_name='copy',
-                    module_args=dict(src=remote_data,
-                                     dest=dest,
-                                     mode='0644',
-                                     owner='root',
-                                     group='root'),
-                    task_vars=task_vars)
-                if results.get('changed', False):
-                    changed_containers.append(name)
+            jvars = AnsibleJ2Vars(self._templar, template.globals,
+                                  locals={'container_data_unit': container})
+            # like Templar.template, which lookups need
+            cached_context = self._templar.cur_context
+            self._templar.cur_context = template.new_context(jvars,
+                                                             shared=True)
+            try:
+                unit = ''.join(template.root_render_func(
+                    self._templar.cur_context))
+            except (UndefinedError, AnsibleUndefinedVariable) as e:
+                raise AnsibleActionFail('Unable to render the systemd unit '
+                                        'of {}: {}'.format(container, e))
+            finally:
+                self._templar.cur_context = cached_context
+            # preserve_trailing_newlines
+            missing = newlines - (len(unit) - len(unit.rstrip('\n')))
+            if missing > 0:
+                unit += '\n' * missing
+            for name in container:
+                units[name] = unit
+        return units
+
+    def _write_units(self, units, systemd_healthchecks, task_vars):
+        """Write the units and cleanup the old healthchecks and requires.
+
+        A single module run writes the units which changed, removes the
+        requires files and healthchecks of the containers and reloads
+        systemd if needed.
+
+        :param units: Dictionary of unit content by container name.
+        :param systemd_healthchecks: Whether to cleanup the healthchecks.
+        :param task_vars: Dictionary of Ansible task variables.
+        :returns changed_containers: List of containers which has a new unit.
+        """
+        results = self._execute_module(
+            module_name='container_systemd_units',
+            module_args=dict(units=units,
+                             systemd_healthchecks=systemd_healthchecks),
+            task_vars=task_vars
+        )
+        if results.get('failed', False):
+            raise AnsibleActionFail(results.get('msg', 'Failed to write '
+                                                'the systemd units'))
+        if results.get('changed', False):
+            self.changed = True
+        changed_containers = results.get('changed_units', [])
         if self.debug:
+            DISPLAY.display('Systemd healthchecks were cleaned up for: '
+                            '{}'.format(results.get('removed_healthchecks')))
             DISPLAY.display('Systemd unit files were created or updated for: '
                             '{}'.format(changed_containers))
         return changed_containers
 
-    def _systemd_reload(self, task_vars):
-        """Reload systemd to load new units.
+    def _systemd(self, name, state, task_vars):
+        """Set the state of a systemd service once.
 
+        :param name: String for service name to manage.
+        :param state: String for service state.
         :param task_vars: Dictionary of Ansible task variables.
+        :returns: Tuple of whether the service runs and whether it changed.
         """
-        if self.debug:
-            DISPLAY.display('Running systemd daemon reload')
+        # the module may add discovered facts to its variables
+        tvars = dict(task_vars)
         results = self._execute_module(
             module_name='systemd',
-            module_args=dict(daemon_reload=True),
-            task_vars=task_vars
+            module_args=dict(state=state,
+                             name='tripleo_{}.service'.format(name),
+                             enabled=True,
+                             daemon_reload=False),
+            task_vars=tvars
         )
-        if results.get('changed', False):
-            self.changed = True
+        try:
+            started = results['status']['Result'] == 'success'
+        except KeyError:
+            # if 'systemd' task failed to start the service, the 'status'
+            # key doesn't exist, so we'll report the issue if the service
+            # never start after the attempts.
+            started = False
+        return started, results.get('changed', False)
+
+    def _service_changed(self, name):
+        self.changed = True
+        self.restarted.append('tripleo_{}.service'.format(name))
 
     @tenacity.retry(
         reraise=True,
@@ -277,29 +273,20 @@ class ActionModule(ActionBase):
         :param state: String for service state.
         :param task_vars: Dictionary of Ansible task variables.
         """
-        tvars = copy.deepcopy(task_vars)
-        results = self._execute_module(
-            module_name='systemd',
-            module_args=dict(state=state,
-                             name='tripleo_{}.service'.format(name),
-                             enabled=True,
-                             daemon_reload=False),
-            task_vars=tvars
-        )
+        started, changed = self._systemd(name, state, task_vars)
+        if not started:
+            raise AnsibleActionFail('Service {} has not started '
+                                    'yet'.format(name))
+        if changed:
+            self._service_changed(name)
+
+    def _timed(self, func, name, state, task_vars):
+        start = time.time()
         try:
-            if 'Result' in results['status']:
-                if results['status']['Result'] == 'success':
-                    if results.get('changed', False):
-                        self.changed = True
-                        self.restarted.append('tripleo_{}'
-                                              '.service'.format(name))
-                    return
-        except KeyError:
-            # if 'systemd' task failed to start the service, the 'status'
-            # key doesn't exist, so we'll use the final raise to report the
-            # issue if the service never start after the attempts.
-            pass
-        raise AnsibleActionFail('Service {} has not started yet'.format(name))
+            func(name=name, state=state, task_vars=task_vars)
+        finally:
+            self.timings['tripleo_{}.service'.format(name)] = round(
+                time.time() - start, 3)
 
     def _restart_services(self, service_names, task_vars):
         """Restart systemd services.
@@ -311,8 +298,7 @@ class ActionModule(ActionBase):
             if self.debug:
                 DISPLAY.display('Restarting systemd service for '
                                 '{}'.format(name))
-            self._manage_service(name=name, state='restarted',
-                                 task_vars=task_vars)
+            self._timed(self._manage_service, name, 'restarted', task_vars)
 
     def _ensure_started(self, service_names, task_vars):
         """Ensure systemd services are started.
@@ -324,12 +310,67 @@ class ActionModule(ActionBase):
             if self.debug:
                 DISPLAY.display('Ensure that systemd service for '
                                 '{} is started'.format(name))
-            self._manage_service(name=name, state='started',
-                                 task_vars=task_vars)
+            self._timed(self._manage_service, name, 'started', task_vars)
+
+    @staticmethod
+    def _get_dependencies(container_config, names):
+        """Return the services each service has to wait for.
+
+        A service waits for the tripleo services of its depends_on which
+        are managed by this task, as systemd orders them with Wants=.
+
+        :param container_config: List of dictionaries for container configs.
+        :param names: List of the containers whose service is managed.
+        :returns dependencies: Dictionary of container names by name.
+        """
+        managed = set(names)
+        dependencies = dict((name, set()) for name in names)
+        for container in container_config:
+            for name, config in container.items():
+                if name not in managed:
+                    continue
+                for unit in config.get('depends_on') or []:
+                    if (unit.startswith('tripleo_')
+                            and unit.endswith('.service')):
+                        dep = unit[len('tripleo_'):-len('.service')]
+                        if dep in managed and dep != name:
+                            dependencies[name].add(dep)
+        return dependencies
+
+    def _manage_concurrently(self, services, dependencies, task_vars):
+        """Start or restart the services concurrently.
+
+        The services are managed on the host by a single
+        container_systemd_services module run, as the connection can not
+        run modules concurrently.
+
+        :param services: List of tuples of container name and service state.
+        :param dependencies: Dictionary of the containers each one waits for.
+        :param task_vars: Dictionary of Ansible task variables.
+        """
+        if self.debug:
+            DISPLAY.display('Managing systemd services for {}'.format(
+                ', '.join('{} ({})'.format(*s) for s in services)))
+        results = self._execute_module(
+            module_name='container_systemd_services',
+            module_args=dict(
+                services=[dict(name=name, state=state,
+                               depends_on=sorted(dependencies[name]))
+                          for name, state in services],
+                concurrency=self.concurrency),
+            task_vars=task_vars
+        )
+        self.timings.update(results.get('service_timings', {}))
+        for service in results.get('restarted', []):
+            self._service_changed(service[len('tripleo_'):-len('.service')])
+        if results.get('failed', False):
+            raise AnsibleActionFail(results.get('msg', 'Failed to manage '
+                                                'the systemd services'))
 
     def run(self, tmp=None, task_vars=None):
         self.changed = False
         self.restarted = []
+        self.timings = {}
         already_created = []
 
         if task_vars is None:
@@ -343,28 +384,32 @@ class ActionModule(ActionBase):
         container_config = args['container_config']
         systemd_healthchecks = args['systemd_healthchecks']
         self.debug = args['debug']
+        self.concurrency = int(args['concurrency'])
 
         container_names = []
         for container in container_config:
             for name, config in container.items():
                 container_names.append(name)
 
-        self._cleanup_requires(container_names, task_vars)
-
-        if systemd_healthchecks:
-            self._cleanup_healthchecks(container_names, task_vars)
-
-        changed_services = self._create_units(container_config, task_vars)
-        if len(changed_services) > 0:
-            self._systemd_reload(task_vars)
-        self._restart_services(changed_services, task_vars)
+        units = self._render_units(container_config)
+        changed_services = self._write_units(units, systemd_healthchecks,
+                                             task_vars)
         for c in container_names:
             # For services that didn't restart, make sure they're started
             if c not in changed_services:
                 already_created.append(c)
-        if len(already_created) > 0:
-            self._ensure_started(already_created, task_vars)
+        if self.concurrency > 1:
+            services = [(c, 'restarted') for c in changed_services]
+            services.extend((c, 'started') for c in already_created)
+            dependencies = self._get_dependencies(
+                container_config, [c for c, _ in services])
+            self._manage_concurrently(services, dependencies, task_vars)
+        else:
+            self._restart_services(changed_services, task_vars)
+            if len(already_created) > 0:
+                self._ensure_started(already_created, task_vars)
 
         result['changed'] = self.changed
         result['restarted'] = self.restarted
+        result['service_timings'] = self.timings
         return result
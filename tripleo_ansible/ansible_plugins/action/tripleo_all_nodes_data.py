@@ -21,16 +21,27 @@ author:
   - James Slagle (@slagle) <jslagle@redhat.com>
 version_added: '2.8'
 short_description: Renders the all_nodes data for TripleO as group_vars
-notes: []
 description:
   - This module renders the all_nodes data for TripleO as group_vars which are
     then available on overcloud nodes.
 options:
   forks:
     description:
-      - The number of forks to spawn in parallel to compute the data for each
-        service. Defaults to the forks set for ansible.
+      - Unused, the data for all services is now computed in a single pass
+        from an index of the hosts. Kept for backward compatibility.
     required: False
+  compact:
+    description:
+      - Render group_vars/overcloud.json without indentation to reduce its
+        size and the time needed to parse it on every host.
+    required: False
+    default: False
+    type: bool
+notes:
+  - The inputs of the computation are fingerprinted and saved next to the
+    rendered file. When they did not change, nothing is computed nor written
+    and the task reports no change. When only some services changed, only
+    the data of these services is computed again.
 """
 
 EXAMPLES = """
@@ -39,12 +50,13 @@ EXAMPLES = """
 """
 
 
+import hashlib
 import json
-from multiprocessing import Manager, Process
 import os
 import traceback
 
 from ansible.errors import AnsibleError
+from ansible.module_utils.parsing.convert_bool import boolean
 from ansible.plugins.action import ActionBase
 
 try:
@@ -57,6 +69,53 @@ from ansible.utils.display import Display
 
 DISPLAY = Display()
 
+# Fingerprints of the inputs used to render overcloud.json, hidden files are
+# not loaded by ansible from group_vars.
+STATE_FILE = '.overcloud.json.fingerprint'
+
+# all_nodes_extra_map_data keys used to compute the data of a service
+SERVICE_EXTRA_KEYS = ('_node_ips', '_node_names', '_short_node_names',
+                      '_short_bootstrap_node_name', '_bootstrap_node_ip')
+
+
+def _fingerprint(data):
+    return hashlib.sha256(
+        json.dumps(data, sort_keys=True, default=str).encode('utf-8')
+    ).hexdigest()
+
+
+def _as_list(value):
+    if isinstance(value, list):
+        return value
+    return [value]
+
+
+class HostIndex(object):
+    """Per network ip and hostname lookup tables for a set of hosts.
+
+    Every hostvars[host] access goes through the variable manager, so each
+    host is resolved only once and the variables required for all the
+    services are kept in plain dicts.
+    """
+
+    def __init__(self, h_vars, hosts, networks):
+        self.ips = dict((network, {}) for network in networks)
+        self.hostnames = dict((network, {}) for network in networks)
+        self.short_names = {}
+        for host in hosts:
+            host_vars = h_vars[host]
+            self.short_names[host] = host_vars['inventory_hostname']
+            for network in networks:
+                try:
+                    self.ips[network][host] = host_vars[network + '_ip']
+                except KeyError:
+                    pass
+                try:
+                    self.hostnames[network][host] = \
+                        host_vars[network + '_hostname']
+                except KeyError:
+                    pass
+
 
 class ActionModule(ActionBase):
     """Renders the all_nodes data for TripleO as group_vars"""
@@ -72,30 +131,26 @@ class ActionModule(ActionBase):
         service_network = self.service_net_map.get(
             service + '_network', 'ctlplane')
         service_hosts = self.groups.get(service, [])
-        service_node_ips = list(
-            map(lambda host: self.h_vars[host][service_network + '_ip'],
-                service_hosts))
+        network_ips = self.host_index.ips[service_network]
+        service_node_ips = [network_ips[host] for host in service_hosts]
         for extra_node_ip in self.all_nodes_extra_map_data.get(
                 service + '_node_ips', []):
             if extra_node_ip not in service_node_ips:
                 service_node_ips.append(extra_node_ip)
         all_nodes[service + '_node_ips'] = service_node_ips
 
+        network_hostnames = self.host_index.hostnames[service_network]
         if self.nova_additional_cell:
             # <service>_cell_node_names: <list of hostnames>
-            v = service_network + '_hostname'
             service_cell_node_names = \
-                list(map(lambda host: self.h_vars[host][v],
-                         service_hosts))
+                [network_hostnames[host] for host in service_hosts]
             all_nodes[service + '_cell_node_names'] = \
                 service_cell_node_names
         else:
             # <service>_node_names: <list of hostnames>
             DISPLAY.vv("  Computing data for {}_node_names".format(service))
-            v = service_network + '_hostname'
             service_node_names = \
-                list(map(lambda host: self.h_vars[host][v],
-                         service_hosts))
+                [network_hostnames[host] for host in service_hosts]
             for extra_node_name in self.all_nodes_extra_map_data.get(
                     service + '_node_names', []):
                 if extra_node_name not in service_node_names:
@@ -105,59 +160,101 @@ class ActionModule(ActionBase):
         # <service>_short_node_names: <list of hostnames>
         DISPLAY.vv("  Computing data for {}_short_node_names".format(service))
         service_short_node_names = \
-            list(map(lambda host: self.h_vars[host]['inventory_hostname'],
-                     service_hosts))
+            [self.host_index.short_names[host] for host in service_hosts]
         for extra_short_node_name in self.all_nodes_extra_map_data.get(
                 service + '_short_node_names', []):
-            if extra_short_node_name not in service_node_names:
+            if extra_short_node_name not in service_short_node_names:
                 service_short_node_names.append(extra_short_node_name)
         all_nodes[service + '_short_node_names'] = \
             service_short_node_names
 
         # <service>_short_bootstrap_node_name: hostname
+        # NOTE: service_hosts is the inventory group list itself, never
+        # modify it in place as it is shared with every other service.
         DISPLAY.vv("  Computing data for {}_short_bootstrap_node_name".format(service))
         if self.all_nodes_extra_map_data.get(
                 service + '_short_bootstrap_node_name', None):
             v = service + '_short_bootstrap_node_name'
-            service_hosts += self.all_nodes_extra_map_data[v]
-        service_hosts.sort()
+            service_hosts = service_hosts + \
+                _as_list(self.all_nodes_extra_map_data[v])
         if service_hosts:
             all_nodes[service + '_short_bootstrap_node_name'] = \
-                service_hosts[0]
+                min(service_hosts)
 
         # <service>_bootstrap_node_ip: hostname
         DISPLAY.vv("  Computing data for {}_short_bootstrap_node_ip".format(service))
         if self.all_nodes_extra_map_data.get(
                 service + '_bootstrap_node_ip', None):
             v = service + '_bootstrap_node_ip'
-            service_bootstrap_node_ips = \
-                service_node_ips.append(self.all_nodes_extra_map_data[v])
+            service_bootstrap_node_ips = service_node_ips + \
+                _as_list(self.all_nodes_extra_map_data[v])
         else:
             service_bootstrap_node_ips = service_node_ips
         if service_bootstrap_node_ips:
             all_nodes[service + '_bootstrap_node_ip'] = \
                 service_bootstrap_node_ips[0]
 
-    def process_services(self, enabled_services, all_nodes, forks):
-        # This breaks up the enabled_services list into smaller lists with
-        # length equal to the number of forks.
-        enabled_services_length = len(enabled_services)
-        for i in range(0, enabled_services_length, forks):
-            # It would be nice to be able to use multiprocessing.Pool here,
-            # however, that resulted in many pickle errors.
-            # For each smaller list, spawn a process to compute each service in
-            # that chunk.
-            end = i + forks
-            if end > enabled_services_length:
-                end = enabled_services_length
-            processes = [Process(target=self.compute_service,
-                                 args=(enabled_services[x], all_nodes))
-                         for x in range(i, end)]
-            [p.start() for p in processes]
-            [p.join() for p in processes]
-            [p.terminate() for p in processes]
-
-    def compute_all_nodes(self, all_nodes, task_vars):
+    def service_fingerprint(self, service):
+        service_network = self.service_net_map.get(
+            service + '_network', 'ctlplane')
+        service_hosts = self.groups.get(service, [])
+        network_ips = self.host_index.ips.get(service_network, {})
+        network_hostnames = self.host_index.hostnames.get(service_network, {})
+        hosts_data = [(host,
+                       self.host_index.short_names.get(host),
+                       network_ips.get(host),
+                       network_hostnames.get(host))
+                      for host in service_hosts]
+        extra_data = dict(
+            (service + key,
+             self.all_nodes_extra_map_data.get(service + key))
+            for key in SERVICE_EXTRA_KEYS)
+        return _fingerprint([service, service_network,
+                             self.nova_additional_cell, hosts_data,
+                             extra_data])
+
+    def process_services(self, enabled_services, all_nodes, previous=None):
+        previous_services = {}
+        previous_all_nodes = {}
+        if previous:
+            previous_services = previous['state'].get('services', {})
+            previous_all_nodes = previous['all_nodes']
+        self.services_state = {}
+        reused = 0
+        for service in enabled_services:
+            fingerprint = self.service_fingerprints[service]
+            previous_service = previous_services.get(service, {})
+            if (previous_service.get('fingerprint') == fingerprint
+                    and all(k in previous_all_nodes
+                            for k in previous_service.get('keys', []))):
+                for key in previous_service['keys']:
+                    all_nodes[key] = previous_all_nodes[key]
+                self.services_state[service] = previous_service
+                reused += 1
+                continue
+
+            keys = set(all_nodes)
+            try:
+                self.compute_service(service, all_nodes)
+            except KeyError as e:
+                # A host of the service group is missing the network
+                # variables, keep what has been computed so far for this
+                # service and carry on with the others.
+                DISPLAY.warning(
+                    "Unable to compute all_nodes data for {}, no data "
+                    "found for {}".format(service, e))
+            self.services_state[service] = dict(
+                fingerprint=fingerprint,
+                keys=sorted(set(all_nodes) - keys))
+        DISPLAY.vv("Reused data of {} unchanged services".format(reused))
+
+    def compute_all_nodes(self, all_nodes, task_vars, previous=None):
+        """Compute the all_nodes data
+
+        previous is the state and data of the last rendering, when none of
+        the inputs changed since then nothing is computed and False is
+        returned.
+        """
         DISPLAY.vv("Starting compute and render for all_nodes data")
         # Internal Ansible objects for inventory and variables
         inventory = self._task.get_variable_manager()._inventory
@@ -182,9 +279,38 @@ class ActionModule(ActionBase):
 
         all_nodes['enabled_services'] = enabled_services
 
-        forks = self._task.args.get('forks', task_vars['ansible_forks'])
-        DISPLAY.vv("forks set to {}".format(forks))
-        self.process_services(enabled_services, all_nodes, forks)
+        DISPLAY.vv("Indexing hosts data")
+        networks = set(['ctlplane'])
+        hosts = set(self.groups.get(primary_role_name, []))
+        for service in enabled_services:
+            networks.add(self.service_net_map.get(
+                service + '_network', 'ctlplane'))
+            hosts.update(self.groups.get(service, []))
+        self.host_index = HostIndex(self.h_vars, sorted(hosts), networks)
+
+        primary_hosts = self.groups.get(primary_role_name, [])
+        self.service_fingerprints = dict(
+            (service, self.service_fingerprint(service))
+            for service in enabled_services)
+        self.fingerprint = _fingerprint([
+            self.service_fingerprints,
+            self.service_net_map,
+            self.nova_additional_cell,
+            self.all_nodes_extra_map_data,
+            service_vip_vars,
+            net_vip_map,
+            task_vars['deploy_identifier'],
+            task_vars['container_cli'],
+            [(host,
+              self.host_index.short_names.get(host),
+              self.host_index.ips['ctlplane'].get(host))
+             for host in primary_hosts]])
+        if previous and previous['state'].get('fingerprint') == \
+                self.fingerprint:
+            DISPLAY.vv("all_nodes data inputs are unchanged")
+            return False
+
+        self.process_services(enabled_services, all_nodes, previous)
 
         # <service>: service_network
         DISPLAY.vv("Computing data for service_net_map")
@@ -224,39 +350,69 @@ class ActionModule(ActionBase):
         # controller_node_<ips/names>
         # note that these are supposed to be strings, not lists
         DISPLAY.vv("Computing data for controller node ips/names")
-        primary_hosts = self.groups.get(primary_role_name, [])
         all_nodes['controller_node_ips'] = \
-            ','.join(list(map(lambda host: self.h_vars[host]['ctlplane_ip'],
-                              primary_hosts)))
+            ','.join([self.host_index.ips['ctlplane'][host]
+                      for host in primary_hosts])
         all_nodes['controller_node_names'] = \
-            ','.join(list(map(lambda host: self.h_vars[host]['inventory_hostname'],
-                              primary_hosts)))
+            ','.join([self.host_index.short_names[host]
+                      for host in primary_hosts])
 
         DISPLAY.vv("Done")
+        return True
+
+    def load_previous(self, all_nodes_path, state_path):
+        """Load the data and state of the last rendering, if any"""
+        try:
+            with open(state_path) as f:
+                state = json.load(f)
+            with open(all_nodes_path) as f:
+                all_nodes = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        return dict(state=state, all_nodes=all_nodes)
 
     def run(self, tmp=None, task_vars=None):
         """Renders the all_nodes data for TripleO as group_vars"""
 
-        manager = Manager()
-        all_nodes = manager.dict()
+        compact = boolean(self._task.args.get('compact', False))
+        all_nodes = {}
+        changed = False
         try:
-            self.compute_all_nodes(all_nodes, task_vars)
-
-            all_nodes = dict(all_nodes)
-            all_nodes_path = os.path.join(task_vars['playbook_dir'],
-                                          'group_vars', 'overcloud.json')
-            with open(all_nodes_path, 'w') as f:
-                DISPLAY.vv("Rendering all_nodes to {}".format(all_nodes_path))
-                json.dump(all_nodes, f, sort_keys=True, indent=4)
+            group_vars_path = os.path.join(task_vars['playbook_dir'],
+                                           'group_vars')
+            all_nodes_path = os.path.join(group_vars_path, 'overcloud.json')
+            state_path = os.path.join(group_vars_path, STATE_FILE)
+            previous = self.load_previous(all_nodes_path, state_path)
+            unchanged_format = bool(
+                previous and previous['state'].get('compact') == compact)
+
+            if not self.compute_all_nodes(all_nodes, task_vars, previous):
+                if unchanged_format:
+                    DISPLAY.vv("returning")
+                    return dict(changed=False)
+                # Only the output format changed, render the same data
+                all_nodes = previous['all_nodes']
+                self.services_state = previous['state'].get('services', {})
+
+            if not (unchanged_format and previous['all_nodes'] == all_nodes):
+                with open(all_nodes_path, 'w') as f:
+                    DISPLAY.vv("Rendering all_nodes to {}".format(
+                        all_nodes_path))
+                    if compact:
+                        json.dump(all_nodes, f, sort_keys=True,
+                                  separators=(',', ':'))
+                    else:
+                        json.dump(all_nodes, f, sort_keys=True, indent=4)
+                changed = True
+
+            with open(state_path, 'w') as f:
+                json.dump(dict(fingerprint=self.fingerprint,
+                               compact=compact,
+                               services=self.services_state),
+                          f, sort_keys=True)
         except Exception as e:
             DISPLAY.error(traceback.format_exc())
             raise AnsibleError(str(e))
-        finally:
-            manager.shutdown()
-            # multiprocessing can hang the plugin exit if there are still
-            # references to the Manager() object. Even though we have called
-            # .shutdown(), clean up all_nodes just to be safe.
-            all_nodes = None
 
         DISPLAY.vv("returning")
-        return dict(all_nodes=all_nodes)
+        return dict(changed=changed)
@@ -15,11 +15,15 @@
 #    under the License.
 __metaclass__ = type
 
+import collections
+import io
 import os
+import tarfile
 import tempfile
 import yaml
 
 from ansible.errors import AnsibleActionFail
+from ansible.module_utils.parsing.convert_bool import boolean
 from ansible.plugins.action import ActionBase
 from ansible.utils.display import Display
 
@@ -60,6 +64,17 @@ options:
     default: False
     required: False
     type: bool
+  bundled:
+    description:
+      - Send the groups, users, directories and files to the host at once,
+        with the content of the files in a single archive, and apply them
+        with the tripleo_host_prep_apply module instead of running a module
+        for each of them. Items using options tripleo_host_prep_apply does
+        not support, sebooleans and sefcontexts are still applied with their
+        module, in the same order.
+    default: False
+    required: False
+    type: bool
 """
 
 EXAMPLES = """
@@ -101,8 +116,23 @@ EXAMPLES = """
 """
 
 RETURN = """
+results:
+  description: Status of each item applied by tripleo_host_prep_apply
+  returned: when bundled is true
+  type: list
 """
 
+# options of the items tripleo_host_prep_apply supports
+BUNDLED_OPTIONS = {
+    'groups': ('name', 'gid', 'system', 'state'),
+    'users': ('name', 'uid', 'group', 'groups', 'append', 'comment', 'home',
+              'shell', 'system', 'create_home', 'state'),
+    'directories': ('path', 'state', 'mode', 'owner', 'group', 'seuser',
+                    'serole', 'setype', 'selevel'),
+    'files': ('dest', 'content', 'src', 'force', 'mode', 'owner', 'group',
+              'seuser', 'serole', 'setype', 'selevel'),
+}
+
 
 class ActionModule(ActionBase):
     """Tripleo host prep module
@@ -157,9 +187,10 @@ class ActionModule(ActionBase):
             self.fail_result = result
             raise self.PrepTaskFailure()
 
-    def apply_groups(self, task_vars):
+    def apply_groups(self, task_vars, group_data=None):
         """Apply groups to a system"""
-        group_data = self._get_data_type('groups')
+        if group_data is None:
+            group_data = self._get_data_type('groups')
         for group in group_data:
             # create group
             args = group_data[group] or {}
@@ -171,9 +202,10 @@ class ActionModule(ActionBase):
             )
             self._handle_result(group_result)
 
-    def apply_users(self, task_vars):
+    def apply_users(self, task_vars, user_data=None):
         """Apply users to a system"""
-        user_data = self._get_data_type('users')
+        if user_data is None:
+            user_data = self._get_data_type('users')
         for user in user_data:
             # create user
             args = user_data[user] or {}
@@ -185,9 +217,10 @@ class ActionModule(ActionBase):
             )
             self._handle_result(user_result)
 
-    def apply_dirs(self, task_vars):
+    def apply_dirs(self, task_vars, dir_data=None):
         """Create directories on a system"""
-        dir_data = self._get_data_type('directories')
+        if dir_data is None:
+            dir_data = self._get_data_type('directories')
         for dirname in dir_data:
             # create dir
             args = dir_data[dirname] or {}
@@ -201,9 +234,10 @@ class ActionModule(ActionBase):
             )
             self._handle_result(dir_result)
 
-    def apply_files(self, task_vars):
+    def apply_files(self, task_vars, file_data=None):
         """Copy file or file data to a remote system"""
-        file_data = self._get_data_type('files')
+        if file_data is None:
+            file_data = self._get_data_type('files')
         for filename in file_data:
             # create file
             args = file_data[filename] or {}
@@ -255,9 +289,10 @@ class ActionModule(ActionBase):
                         if os.path.exists(tempfile_path):
                             os.remove(tempfile_path)
 
-    def apply_seboolean(self, task_vars):
+    def apply_seboolean(self, task_vars, sebool_data=None):
         """Apply a list of sebooleans"""
-        sebool_data = self._get_data_type('seboolean')
+        if sebool_data is None:
+            sebool_data = self._get_data_type('seboolean')
         for sebool in sebool_data:
             # manage seboolean
             args = sebool_data[sebool] or {}
@@ -269,9 +304,10 @@ class ActionModule(ActionBase):
             )
             self._handle_result(sebool_result)
 
-    def apply_sefcontext(self, task_vars):
+    def apply_sefcontext(self, task_vars, sefctx_data=None):
         """Apply a list of sefcontexts"""
-        sefctx_data = self._get_data_type('sefcontext')
+        if sefctx_data is None:
+            sefctx_data = self._get_data_type('sefcontext')
         for sefctx in sefctx_data:
             # manage sefctx
             args = sefctx_data[sefctx] or {}
@@ -283,6 +319,99 @@ class ActionModule(ActionBase):
             )
             self._handle_result(sefctx_result)
 
+    def _bundle_item(self, data_type, name, args):
+        """Return the tripleo_host_prep_apply args of an item
+
+        :returns: None if the item uses unsupported options
+        """
+        if set(args) - set(BUNDLED_OPTIONS[data_type]):
+            return None
+        args = dict(args)
+        if data_type in ('groups', 'users'):
+            args.setdefault('name', name)
+        elif data_type == 'directories':
+            args.setdefault('path', name)
+            if args.setdefault('state', 'directory') != 'directory':
+                return None
+        elif data_type == 'files':
+            args.setdefault('dest', name)
+            if 'content' in args:
+                data = args.pop('content')
+            elif os.path.isfile(args.get('src', '')):
+                src = args.pop('src')
+                args['src_name'] = os.path.basename(src)
+                with open(src, 'rb') as f:
+                    data = f.read()
+            else:
+                return None
+            args['member'] = 'files/{}'.format(len(self.bundle_files))
+            if not isinstance(data, bytes):
+                data = data.encode('utf-8')
+            self.bundle_files.append((args['member'], data))
+        return args
+
+    def _archive(self):
+        """Return the tar archive of the bundled files content"""
+        archive = io.BytesIO()
+        with tarfile.open(fileobj=archive, mode='w:gz') as tar:
+            for member, data in self.bundle_files:
+                info = tarfile.TarInfo(name=member)
+                info.size = len(data)
+                info.mode = 0o600
+                tar.addfile(info, io.BytesIO(data))
+        return archive.getvalue()
+
+    def _apply_bundle(self, task_vars):
+        """Apply the bundled items with tripleo_host_prep_apply"""
+        if not self.bundle:
+            return
+        args = dict(self.bundle)
+        if self.bundle_files:
+            archive_path = self._connection._shell.join_path(
+                self.remote_tmp, 'host_prep_files.tar.gz')
+            self._transfer_data(remote_path=archive_path,
+                                data=self._archive())
+            self._fixup_perms2((self.remote_tmp, archive_path))
+            args['archive'] = archive_path
+        DISPLAY.vv('Applying bundled {}'.format(', '.join(self.bundle)))
+        bundle_result = self._execute_module(
+            module_name='tripleo_host_prep_apply',
+            module_args=args,
+            task_vars=task_vars
+        )
+        self.bundle = collections.OrderedDict()
+        self.bundle_files = []
+        self.results.extend(bundle_result.get('results', []))
+        self._handle_result(bundle_result)
+
+    def apply_bundled(self, task_vars):
+        """Apply the data with as few module runs as possible
+
+        The supported items are sent to tripleo_host_prep_apply together,
+        until an item needs its own module. The bundle is then applied
+        before that item, so the items are applied in their listed order.
+        """
+        self.bundle = collections.OrderedDict()
+        self.bundle_files = []
+        for data_type, apply_data in (('groups', self.apply_groups),
+                                      ('users', self.apply_users),
+                                      ('directories', self.apply_dirs),
+                                      ('files', self.apply_files),
+                                      ('seboolean', self.apply_seboolean),
+                                      ('sefcontext', self.apply_sefcontext)):
+            data = self._get_data_type(data_type)
+            for name, args in data.items():
+                bundle_args = None
+                if data_type in BUNDLED_OPTIONS:
+                    bundle_args = self._bundle_item(data_type, name,
+                                                    args or {})
+                if bundle_args is None:
+                    self._apply_bundle(task_vars)
+                    apply_data(task_vars, {name: args})
+                else:
+                    self.bundle.setdefault(data_type, []).append(bundle_args)
+        self._apply_bundle(task_vars)
+
     def run(self, tmp=None, task_vars=None):
         self._supports_check_mode = True
         self.changed = False
@@ -297,23 +426,28 @@ class ActionModule(ActionBase):
         self.fail_result = None
         self.host_prep_data = args['host_prep_data']
         self.debug = args['debug']
+        self.results = []
 
         try:
             # create a remote temp for our usage with the files call
             self.remote_tmp = self._make_tmp_path(
                 remote_user=self._play_context.remote_user
             )
-            # Apply the data in a specific order
-            self.apply_groups(task_vars)
-            # users need groups
-            self.apply_users(task_vars)
-            # directories needs users/groups
-            self.apply_dirs(task_vars)
-            # files need directories/users/groups
-            self.apply_files(task_vars)
-            # selinux bits can be applied last
-            self.apply_seboolean(task_vars)
-            self.apply_sefcontext(task_vars)
+            if boolean(args['bundled']):
+                self.apply_bundled(task_vars)
+                result['results'] = self.results
+            else:
+                # Apply the data in a specific order
+                self.apply_groups(task_vars)
+                # users need groups
+                self.apply_users(task_vars)
+                # directories needs users/groups
+                self.apply_dirs(task_vars)
+                # files need directories/users/groups
+                self.apply_files(task_vars)
+                # selinux bits can be applied last
+                self.apply_seboolean(task_vars)
+                self.apply_sefcontext(task_vars)
             # update result with changed flag
             result['changed'] = self.changed
         except self.PrepTaskFailure:
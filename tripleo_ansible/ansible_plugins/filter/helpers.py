@@ -15,11 +15,20 @@
 # under the License.
 
 import ast
+import functools
 import json
 import os
 import re
 
 from ansible import errors
+try:
+    from ansible.module_utils import container_configs
+except ImportError:
+    from tripleo_ansible.ansible_plugins.module_utils import container_configs
+
+
+# containers managed by tripleo* or paunch*
+MANAGED_BY_RE = re.compile(r'tripleo|paunch')
 
 
 # cmp() doesn't exist on python3
@@ -27,6 +36,23 @@ def cmp(a, b):
     return 0 if a == b else 1
 
 
+@functools.lru_cache(maxsize=1024)
+def _parse_config_data(c_data):
+    """Return the data of a config_data label.
+
+    The labels are memoised by content. The memo lives as long as the
+    worker process, it does not help across tasks, only when the filter is
+    evaluated several times by one worker. The result must not be modified.
+    """
+    try:
+        return ast.literal_eval(c_data)
+    except (ValueError, SyntaxError):  # may already be data
+        try:
+            return dict(c_data)  # Confirms c_data is type safe
+        except ValueError:  # c_data is not data
+            return dict()
+
+
 class FilterModule(object):
     def filters(self):
         return {
@@ -105,6 +131,10 @@ class FilterModule(object):
         reasons: no config_data, updated config_data or container not
         part of the global config.
 
+        The config of the containers labelled with a config_digest is
+        compared by digest, config_data is only parsed for the containers
+        created before this label was added.
+
         :param container_infos: list
         :param config: dict
         :param config_id: string
@@ -113,8 +143,11 @@ class FilterModule(object):
         :returns: list
         """
         to_delete = []
-        to_skip = []
+        to_skip = set()
         installed_containers = []
+        # config_data and config_digest labels of the installed containers,
+        # by name
+        c_datas = {}
 
         for c in container_infos:
             c_name = c['Name']
@@ -126,66 +159,72 @@ class FilterModule(object):
 
             # Check containers have a label
             if not labels:
-                to_skip += [c_name]
+                to_skip.add(c_name)
                 continue
 
             # Don't delete containers NOT managed by tripleo* or paunch*
-            elif not re.findall(r"(?=("+'|'.join(['tripleo', 'paunch'])+r"))",
-                                managed_by):
-                to_skip += [c_name]
+            elif not MANAGED_BY_RE.search(managed_by):
+                to_skip.add(c_name)
                 continue
 
             # Only remove containers managed in this config_id
             elif labels.get('config_id') != config_id:
-                to_skip += [c_name]
+                to_skip.add(c_name)
                 continue
 
+            if 'config_data' in labels:
+                c_datas.setdefault(c_name, []).append(
+                    (labels['config_data'], labels.get('config_digest')))
+
             # Remove containers with no config_data
             # e.g. broken config containers
-            elif 'config_data' not in labels and clean_orphans:
-                to_delete += [c_name]
+            elif clean_orphans:
+                to_delete.append(c_name)
 
+        deleted = set(to_delete)
+        installed = set(installed_containers)
         for c_name, config_data in config.items():
             # don't try to remove a container which doesn't exist
-            if c_name not in installed_containers:
+            if c_name not in installed:
                 continue
 
             # already tagged to be removed
-            if c_name in to_delete:
+            if c_name in deleted:
                 continue
 
-            if c_name in to_skip:
+            if c_name in to_skip or not check_config:
                 continue
 
             # Remove containers managed by tripleo-ansible when config_data
             # changed. Since we already cleaned the containers not in config,
             # this check needs to be in that loop.
             # e.g. new TRIPLEO_CONFIG_HASH during a minor update
-            c_datas = list()
-            for c in container_infos:
-                if c_name == c['Name']:
-                    try:
-                        c_datas.append(c['Config']['Labels']['config_data'])
-                    except KeyError:
-                        pass
-
-            # Build c_facts so it can be compared later with config_data
-            for c_data in c_datas:
-                try:
-                    c_data = ast.literal_eval(c_data)
-                except (ValueError, SyntaxError):  # may already be data
+            digest = None
+            for c_data, c_digest in c_datas.get(c_name, []):
+                if c_digest is not None:
+                    if digest is None:
+                        digest = container_configs.config_digest(config_data)
+                    if c_digest != digest:
+                        to_delete.append(c_name)
+                    continue
+
+                # Build c_facts so it can be compared later with config_data
+                if isinstance(c_data, str):
+                    c_data = _parse_config_data(c_data)
+                else:
                     try:
                         c_data = dict(c_data)  # Confirms c_data is type safe
                     except ValueError:  # c_data is not data
                         c_data = dict()
 
-                if cmp(c_data, config_data) != 0 and check_config:
-                    to_delete += [c_name]
+                if cmp(c_data, config_data) != 0:
+                    to_delete.append(c_name)
 
         # Cleanup installed containers that aren't in config anymore.
-        for c in installed_containers:
-            if c not in config.keys() and c not in to_skip and clean_orphans:
-                to_delete += [c]
+        if clean_orphans:
+            for c in installed_containers:
+                if c not in config and c not in to_skip:
+                    to_delete.append(c)
 
         return to_delete
 
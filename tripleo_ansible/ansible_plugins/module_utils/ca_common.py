@@ -15,8 +15,23 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 # Included from: https://github.com/ceph/ceph-ansible/blob/master/module_utils/ca_common.py
+import atexit
 import os
 import datetime
+import time
+import uuid
+
+CONTAINER_VOLUMES = ['/etc/ceph:/etc/ceph:z',
+                     '/var/lib/ceph/:/var/lib/ceph/:z',
+                     '/var/log/ceph/:/var/log/ceph/:z']
+
+# lifetime of an exec session container, in case it is not stopped
+EXEC_SESSION_TIMEOUT = 600
+
+# statistics of the CLI commands run by the module
+CLI_STATS = dict(container_starts=0, commands=0, cli_time=0.0)
+
+_exec_sessions = {}
 
 
 def generate_ceph_cmd(sub_cmd, args, spec_path, user_key=None, cluster='ceph',
@@ -55,11 +70,9 @@ def container_exec(binary, container_image, spec_path=None, interactive=False):
     if interactive:
         command_exec.extend(['--interactive'])
 
-    command_exec.extend(['--rm',
-                         '--net=host',
-                         '-v', '/etc/ceph:/etc/ceph:z',
-                         '-v', '/var/lib/ceph/:/var/lib/ceph/:z',
-                         '-v', '/var/log/ceph/:/var/log/ceph/:z'])
+    command_exec.extend(['--rm', '--net=host'])
+    for volume in CONTAINER_VOLUMES:
+        command_exec.extend(['-v', volume])
 
     if spec_path is not None and len(spec_path) > 0:
         command_exec.extend(['-v', '{}:{}:z'.format(spec_path, spec_path)])
@@ -94,6 +107,90 @@ def pre_generate_ceph_cmd(container_image=None, interactive=False, spec_path=Non
     return cmd
 
 
+def exec_session_enabled():
+    '''
+    Check if the containerized commands run in an exec session
+    '''
+
+    return os.getenv('CEPH_CONTAINER_EXEC_SESSION', '').lower() in \
+        ('1', 'true', 'yes')
+
+
+class ExecSession(object):
+    '''
+    Long lived ceph container running the commands of a module with exec
+    '''
+
+    def __init__(self, module, container_binary, container_image):
+        self.module = module
+        self.container_binary = container_binary
+        self.container_image = container_image
+        self.name = 'ceph-cli-{}'.format(uuid.uuid4().hex[:12])
+        self.running = None
+
+    def start(self):
+        timeout = os.getenv('CEPH_CONTAINER_EXEC_SESSION_TIMEOUT',
+                            EXEC_SESSION_TIMEOUT)
+        cmd = [self.container_binary, 'run', '--detach', '--rm',
+               '--name', self.name, '--net=host']
+        for volume in CONTAINER_VOLUMES:
+            cmd.extend(['-v', volume])
+        cmd.extend(['--entrypoint=sleep', self.container_image, str(timeout)])
+        rc, out, err = self.module.run_command(cmd)
+        CLI_STATS['container_starts'] += 1
+        self.running = rc == 0
+        if self.running:
+            atexit.register(self.stop)
+        return self.running
+
+    def stop(self):
+        # sleep ignores SIGTERM, the container is removed once killed
+        if self.running:
+            self.module.run_command([self.container_binary, 'kill',
+                                     self.name])
+            self.running = False
+
+    def exec_cmd(self, cmd):
+        '''
+        Translate a container_exec command line to run in the session,
+        return None when it needs other volumes than the session ones
+        '''
+
+        entrypoint = [i for i, arg in enumerate(cmd)
+                      if arg.startswith('--entrypoint=')][0]
+        options = cmd[2:entrypoint]
+        volumes = [options[i + 1] for i, arg in enumerate(options)
+                   if arg == '-v']
+        if any(volume not in CONTAINER_VOLUMES for volume in volumes):
+            return None
+        if self.running is None:
+            self.start()
+        if not self.running:
+            return None
+        exec_cmd = [self.container_binary, 'exec']
+        if '--interactive' in options:
+            exec_cmd.append('--interactive')
+        exec_cmd.extend([self.name, cmd[entrypoint].split('=', 1)[1]])
+        exec_cmd.extend(cmd[entrypoint + 2:])
+        return exec_cmd
+
+
+def get_exec_session(module, cmd):
+    '''
+    Return the exec session running a container_exec command line, if any
+    '''
+
+    if not (exec_session_enabled() and len(cmd) > 2 and cmd[1] == 'run'
+            and any(arg.startswith('--entrypoint=') for arg in cmd)):
+        return None
+    entrypoint = [arg for arg in cmd if arg.startswith('--entrypoint=')][0]
+    container_image = cmd[cmd.index(entrypoint) + 1]
+    key = (cmd[0], container_image)
+    if key not in _exec_sessions:
+        _exec_sessions[key] = ExecSession(module, cmd[0], container_image)
+    return _exec_sessions[key]
+
+
 def exec_command(module, cmd, stdin=None):
     '''
     Execute command(s)
@@ -102,12 +199,32 @@ def exec_command(module, cmd, stdin=None):
     binary_data = False
     if stdin:
         binary_data = True
-    rc, out, err = module.run_command(cmd, data=stdin, binary_data=binary_data)
+    startd = time.time()
+    run_cmd = cmd
+    session = get_exec_session(module, cmd)
+    if session is not None:
+        run_cmd = session.exec_cmd(cmd) or cmd
+    if len(run_cmd) > 1 and run_cmd[1] == 'run':
+        CLI_STATS['container_starts'] += 1
+    rc, out, err = module.run_command(run_cmd, data=stdin,
+                                      binary_data=binary_data)
+    CLI_STATS['commands'] += 1
+    CLI_STATS['cli_time'] += time.time() - startd
 
     return rc, cmd, out, err
 
 
-def exit_module(module, out, rc, cmd, err, startd, changed=False):
+def cli_stats():
+    '''
+    Statistics of the CLI commands run so far
+    '''
+
+    stats = dict(CLI_STATS)
+    stats['cli_time'] = round(stats['cli_time'], 3)
+    return stats
+
+
+def exit_module(module, out, rc, cmd, err, startd, changed=False, **kwargs):
     endd = datetime.datetime.now()
     delta = endd - startd
 
@@ -120,7 +237,9 @@ def exit_module(module, out, rc, cmd, err, startd, changed=False):
         stdout=out.rstrip("\r\n"),
         stderr=err.rstrip("\r\n"),
         changed=changed,
+        cli_stats=cli_stats(),
     )
+    result.update(kwargs)
     module.exit_json(**result)
 
 
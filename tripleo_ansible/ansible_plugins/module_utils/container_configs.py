@@ -0,0 +1,98 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# Copyright 2021 Red Hat, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import ast
+import glob
+import hashlib
+import json
+import os
+
+
+def config_digest(config):
+    """Return the digest of a container config.
+
+    The config is serialised to JSON with sorted keys, so that the digest
+    does not depend on the order of the keys.
+    """
+    data = json.dumps(config, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def parse_config_data(label):
+    """Return the config of a config_data container label.
+
+    The label holds the repr of the config, None is returned when it can
+    not be parsed.
+    """
+    try:
+        return ast.literal_eval(label)
+    except (ValueError, SyntaxError, TypeError):
+        return None
+
+
+class ConfigLoader(object):
+    """Load the JSON container configs of a directory.
+
+    The configs are parsed again on every run, a cache of the parsed
+    configs takes as long to read as the configs themselves.
+    """
+
+    def __init__(self, config_dir, config_pattern='*.json', log=None):
+        self.config_dir = config_dir
+        self.config_pattern = config_pattern
+        self.log = log
+        self.parsed = 0
+
+    def _debug(self, msg):
+        if self.log:
+            self.log(msg)
+
+    def load(self, path):
+        """Return the parsed content of a config file"""
+        with open(path, 'r') as f:
+            config = json.load(f)
+        self.parsed += 1
+        return config
+
+    def iter_configs(self, config_overrides=None):
+        """Yield the name and config of every matching config file.
+
+        Configs with overrides are shallow copies with the overrides
+        applied, the other configs are returned as they were loaded.
+        """
+        config_overrides = config_overrides or {}
+        matches = glob.glob(os.path.join(self.config_dir,
+                                         self.config_pattern))
+        for match in sorted(matches):
+            name = os.path.splitext(os.path.basename(match))[0]
+            try:
+                config = self.load(match)
+            except (IOError, OSError):
+                self._debug('{} was not found.'.format(match))
+                continue
+            self._debug('Config found for {}: {}'.format(name, config))
+            if name in config_overrides:
+                config = dict(config)
+                for mk, mv in config_overrides[name].items():
+                    self._debug('Override found for {}: {} will be set to '
+                                '{}'.format(name, mk, mv))
+                    config[mk] = mv
+            yield name, config
+
+    def get_configs(self, config_overrides=None):
+        """Return a dict of all the matching configs by name"""
+        return dict(self.iter_configs(config_overrides))
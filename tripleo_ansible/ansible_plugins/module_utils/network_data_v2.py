@@ -17,9 +17,13 @@
 
 import collections
 import collections.abc
+import hashlib
 import ipaddress
+import json
 import jsonschema
 import os
+import tempfile
+import time
 import yaml
 
 RES_ID = 'physical_resource_id'
@@ -28,6 +32,8 @@ TYPE_SUBNET = 'OS::Neutron::Subnet'
 RES_TYPE = 'resource_type'
 TYPE_SEGMENT = 'OS::Neutron::Segment'
 NET_VIP_SUFFIX = '_virtual_ip'
+NET_MAPS_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache',
+                                  'tripleo-ansible')
 
 DOMAIN_NAME_REGEX = (r'^(?=^.{1,255}$)(?!.*\.\..*)(.{1,63}\.)'
                      r'+(.{0,63}\.?)|(?!\.)(?!.*\.\..*)(^.{1,63}$)'
@@ -478,20 +484,84 @@ def create_name_id_maps(conn):
     cidr_prefix_map = {}
     for net in conn.network.networks():
         tags = tags_to_dict(net.tags)
-        subnets = conn.network.subnets(network_id=net.id)
         net_id_map[net.id] = net.name
         net_name_map[net.name] = dict(
             id=net.id,
-            name_upper=tags.get('tripleo_network_name', net.name)
+            name_upper=tags.get('tripleo_network_name', net.name),
+            subnets=dict()
         )
-        subnets_map = net_name_map[net.name]['subnets'] = dict()
 
-        for s in subnets:
-            subnets_map[s.name] = s.id
-            cidr_prefix_map[s.id] = s.cidr.split('/')[-1]
+    # List the subnets of all the networks at once and join them in memory
+    # instead of listing the subnets of each network.
+    for s in conn.network.subnets():
+        if s.network_id not in net_id_map:
+            continue
+        net_name_map[net_id_map[s.network_id]]['subnets'][s.name] = s.id
+        cidr_prefix_map[s.id] = s.cidr.split('/')[-1]
 
     net_maps = dict(by_id=net_id_map,
                     by_name=net_name_map,
                     cidr_prefix_map=cidr_prefix_map)
 
     return net_maps
+
+
+def get_cloud_name(conn):
+    """Return the name of the cloud of a connection, or OS_CLOUD"""
+    return (getattr(conn.config, 'name', None)
+            or os.environ.get('OS_CLOUD'))
+
+
+def net_maps_cache_path(cloud, stack, run_id, cache_dir=NET_MAPS_CACHE_DIR):
+    key = hashlib.sha256(
+        json.dumps([cloud, stack, run_id]).encode()).hexdigest()
+    return os.path.join(cache_dir, 'net_maps-{}.json'.format(key))
+
+
+def _prune_net_maps_cache(cache_dir, ttl):
+    """Remove the cache files of the runs older than ttl seconds"""
+    now = time.time()
+    for filename in os.listdir(cache_dir):
+        if not filename.startswith('net_maps-'):
+            continue
+        path = os.path.join(cache_dir, filename)
+        try:
+            if now - os.path.getmtime(path) >= ttl:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def get_name_id_maps(conn, stack, run_id=None, ttl=0,
+                     cache_dir=NET_MAPS_CACHE_DIR):
+    """Return the network maps, cached on disk for a run
+
+    The cache is keyed by cloud name, stack and run_id, an identifier of
+    the play run, so a later run lists the networks again. The maps are
+    cached for ttl seconds at most. The cache is not used when ttl is 0,
+    without run_id or when the cloud name is unknown.
+    """
+    cloud = get_cloud_name(conn)
+    if ttl <= 0 or not run_id or not cloud:
+        return create_name_id_maps(conn)
+
+    path = net_maps_cache_path(cloud, stack, run_id, cache_dir)
+    try:
+        if time.time() - os.path.getmtime(path) < ttl:
+            with open(path) as f:
+                return json.load(f)
+    except (OSError, ValueError):
+        pass
+
+    net_maps = create_name_id_maps(conn)
+    try:
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+        _prune_net_maps_cache(cache_dir, ttl)
+        with tempfile.NamedTemporaryFile('w', dir=cache_dir,
+                                         delete=False) as f:
+            json.dump(net_maps, f)
+        os.rename(f.name, path)
+    except OSError:
+        pass
+
+    return net_maps
@@ -19,7 +19,12 @@ from __future__ import absolute_import, division, print_function
 __metaclass__ = type
 
 from ansible.module_utils.basic import AnsibleModule
-from ansible.module_utils.ca_common import is_containerized, container_exec, fatal
+try:
+    from ansible.module_utils.ca_common import is_containerized, container_exec, fatal, \
+                                               exec_command, cli_stats
+except ImportError:
+    from tripleo_ansible.ansible_plugins.module_utils.ca_common import is_containerized, \
+                                       container_exec, fatal, exec_command, cli_stats
 import datetime
 import json
 import yaml
@@ -28,6 +33,7 @@ import struct
 import time
 import base64
 import socket
+import tempfile
 
 
 ANSIBLE_METADATA = {
@@ -57,9 +63,21 @@ options:
     default: ceph
   name:
     description:
-      - name of the CephX key
+      - name of the CephX key, required unless keys is given
     type: str
-    required: true
+    required: false
+  keys:
+    description:
+      - List of CephX keys to create or update in a single module run, with
+        the present state. Each item takes the name, caps, secret (or key),
+        dest, mode, owner and group options, the options of the module are
+        their default values.
+      - The existing keys are listed once, the keys whose secret or caps
+        differ are imported at once from a combined keyring and the keyring
+        files are only written when their content differs.
+    type: list
+    elements: dict
+    required: false
   user:
     description:
       - entity used to perform operation.
@@ -206,9 +224,25 @@ caps:
 - name: fetch cephx keys
   ceph_key:
     state: fetch_initial_keys
+
+- name: create cephx keys in a single module run
+  ceph_key:
+    keys: "{{ keys_to_create }}"
+'''
+
+RETURN = '''
+keys:
+  description: Result of each key, in keys mode
+  returned: when keys is given
+  type: list
+  sample:
+    - name: client.openstack
+      imported: true
+      written: true
+      changed: true
 '''
 
-RETURN = '''#  '''
+KEY_OPTIONS = ('name', 'caps', 'secret', 'dest', 'mode', 'owner', 'group')
 
 
 CEPH_INITIAL_KEYS = ['client.admin',
@@ -408,13 +442,186 @@ def list_keys(cluster, user, user_key_path, container_image=None):
     return cmd_list
 
 
+def import_keyring(cluster, user, user_key_path, path, container_image=None):
+    '''
+    Import the keys of a keyring
+    '''
+
+    cmd_list = []
+
+    args = [
+        'import',
+        '-i',
+        path,
+    ]
+
+    cmd_list.append(generate_ceph_cmd(
+        cluster, args, user, user_key_path, container_image))
+
+    return cmd_list
+
+
+def generate_keyring(name, secret, caps):
+    '''
+    Generate the content of the keyring of a key
+    '''
+
+    lines = ['[{}]'.format(name), '\tkey = {}'.format(secret)]
+    for k in sorted(caps):
+        # same as generate_caps, no empty cap
+        if len(k) == 0:
+            continue
+        lines.append('\tcaps {} = "{}"'.format(k, caps[k]))
+
+    return '\n'.join(lines) + '\n'
+
+
+def parse_keyring(content):
+    '''
+    Parse the keys of a keyring, by entity
+    '''
+
+    keys = {}
+    key = None
+    for line in content.splitlines():
+        line = line.strip()
+        if line.startswith('[') and line.endswith(']'):
+            key = keys.setdefault(line[1:-1], {'key': None, 'caps': {}})
+        elif key is not None and '=' in line:
+            k, v = [x.strip() for x in line.split('=', 1)]
+            if k == 'key':
+                key['key'] = v
+            elif k.startswith('caps '):
+                key['caps'][k[5:].strip()] = v.strip('"')
+
+    return keys
+
+
+def build_keyring_path(cluster, name, dest):
+    '''
+    Build the path of the keyring of a key written to dest
+    '''
+
+    # if dest is not a directory, the user wants to change the file's name
+    # (e,g: /etc/ceph/ceph.mgr.ceph-mon2.keyring)
+    if not os.path.isdir(dest):
+        return dest
+    if 'bootstrap' in dest:
+        # Build a different path for bootstrap keys as there are stored
+        # as /var/lib/ceph/bootstrap-rbd/ceph.keyring
+        keyring_filename = cluster + '.keyring'
+    else:
+        keyring_filename = cluster + "." + name + ".keyring"
+
+    return os.path.join(dest, keyring_filename)
+
+
+def read_file(path):
+    try:
+        with open(path) as f:
+            return f.read()
+    except (IOError, OSError):
+        return None
+
+
+def write_file(module, path, content):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.')
+    with os.fdopen(fd, 'w') as f:
+        f.write(content)
+    module.atomic_move(tmp_path, path)
+
+
+def manage_keys(module, cluster, user, user_key_path, container_image=None):
+    '''
+    Create or update the keys of the keys parameter from a single listing of
+    the existing keys and a single import
+    '''
+
+    rc, cmd, out, err = 0, [], '', ''
+    existing = {}
+    import_key = module.params['import_key']
+    if import_key:
+        rc, cmd, out, err = exec_commands(
+            module, list_keys(cluster, user, user_key_path, container_image))
+        if rc != 0:
+            return rc, cmd, "Couldn't list the keys", err, False, []
+        for key in json.loads(out).get('auth_dump', []):
+            existing[key['entity']] = key
+
+    keys = []
+    for item in module.params['keys']:
+        if 'key' in item and not item.get('secret'):
+            item = dict(item, secret=item['key'])
+        params = dict((k, module.params.get(k)) for k in KEY_OPTIONS)
+        params.update((k, v) for k, v in item.items()
+                      if k in KEY_OPTIONS and v is not None and v != '')
+        if not params['name']:
+            fatal("A key has no name", module)
+        path = build_keyring_path(cluster, params['name'], params['dest'])
+        current = read_file(path)
+        key = existing.get(params['name'])
+        if key is None and current is not None:
+            key = parse_keyring(current).get(params['name'])
+        secret = params['secret'] or (key or {}).get('key')
+        caps = params['caps'] or (key or {}).get('caps')
+        if not caps:
+            fatal("Capabilities must be provided for {} when it doesn't "
+                  "exist".format(params['name']), module)
+        if not secret:
+            secret = generate_secret().decode()
+        caps = dict((k, v) for k, v in caps.items() if len(k) > 0)
+        remote = existing.get(params['name'])
+        keys.append(dict(
+            params, path=path, current=current,
+            content=generate_keyring(params['name'], secret, caps),
+            imported=import_key and (remote is None
+                                     or remote.get('key') != secret
+                                     or remote.get('caps') != caps)))
+
+    to_import = [k for k in keys if k['imported']]
+    if to_import:
+        # next to the user keyring, which is mounted in the containers
+        fd, keyring = tempfile.mkstemp(dir=os.path.dirname(user_key_path),
+                                       prefix='ceph_key')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(''.join(k['content'] for k in to_import))
+            rc, cmd, out, err = exec_commands(
+                module, import_keyring(cluster, user, user_key_path,
+                                       keyring, container_image))
+        finally:
+            os.remove(keyring)
+        if rc != 0:
+            return rc, cmd, "Couldn't import the keys", err, False, []
+
+    changed = bool(to_import)
+    results = []
+    for key in keys:
+        written = key['content'] != key['current']
+        if written:
+            write_file(module, key['path'], key['content'])
+        file_args = module.load_file_common_arguments(module.params)
+        file_args.update(path=key['path'], mode=key['mode'],
+                         owner=key['owner'], group=key['group'])
+        key_changed = module.set_fs_attributes_if_different(
+            file_args, written or key['imported'])
+        changed |= key_changed
+        results.append(dict(name=key['name'], imported=key['imported'],
+                            written=written, changed=key_changed))
+
+    out = '\n'.join('{} has been {}'.format(
+        r['name'], 'imported' if r['imported'] else 'updated')
+        for r in results if r['changed'])
+    return rc, cmd, out, err, changed, results
+
+
 def exec_commands(module, cmd_list):
     '''
     Execute command(s)
     '''
 
     for cmd in cmd_list:
-        rc, out, err = module.run_command(cmd)
+        rc, cmd, out, err = exec_command(module, cmd)
         if rc != 0:
             return rc, cmd, out, err
 
@@ -483,6 +690,8 @@ def run_module():
         argument_spec=yaml.safe_load(DOCUMENTATION)['options'],
         supports_check_mode=True,
         add_file_common_args=True,
+        required_one_of=[['name', 'keys']],
+        mutually_exclusive=[['name', 'keys']],
     )
 
     file_args = module.load_file_common_arguments(module.params)
@@ -533,20 +742,30 @@ def run_module():
     else:
         user_key_path = user_key
 
-    if (state in ["present", "update"]):
-        # if dest is not a directory, the user wants to change the file's name
-        # (e,g: /etc/ceph/ceph.mgr.ceph-mon2.keyring)
-        if not os.path.isdir(dest):
-            file_path = dest
-        else:
-            if 'bootstrap' in dest:
-                # Build a different path for bootstrap keys as there are stored
-                # as /var/lib/ceph/bootstrap-rbd/ceph.keyring
-                keyring_filename = cluster + '.keyring'
-            else:
-                keyring_filename = cluster + "." + name + ".keyring"
-            file_path = os.path.join(dest, keyring_filename)
+    if module.params.get('keys') is not None:
+        if state not in ["present", "update"]:
+            fatal("keys is only supported with the present state", module)
+        rc, cmd, out, err, changed, results = manage_keys(
+            module, cluster, user, user_key_path, container_image)
+        endd = datetime.datetime.now()
+        result = dict(
+            cmd=cmd,
+            start=str(startd),
+            end=str(endd),
+            delta=str(endd - startd),
+            rc=rc,
+            stdout=out.rstrip("\r\n"),
+            stderr=err.rstrip("\r\n"),
+            changed=changed,
+            keys=results,
+            cli_stats=cli_stats(),
+        )
+        if rc != 0:
+            module.fail_json(msg='non-zero return code', **result)
+        module.exit_json(**result)
 
+    if (state in ["present", "update"]):
+        file_path = build_keyring_path(cluster, name, dest)
         file_args['path'] = file_path
 
         if import_key:
@@ -577,6 +796,7 @@ def run_module():
                         if rc != 0:
                             result["stdout"] = "Couldn't fetch the key {0} at " \
                                                "{1}.".format(name, file_path)
+                            result['cli_stats'] = cli_stats()
                             module.exit_json(**result)
                         result["stdout"] = "fetched the key {0} at " \
                                            "{1}.".format(name, file_path)
@@ -585,6 +805,7 @@ def run_module():
                                        "need to be updated.".format(name)
                     result["rc"] = 0
                     module.set_fs_attributes_if_different(file_args, False)
+                    result['cli_stats'] = cli_stats()
                     module.exit_json(**result)
         else:
             if os.path.isfile(file_path) and not secret or not caps:
@@ -592,6 +813,7 @@ def run_module():
                                    "secret *and* caps when import_key " \
                                    "is {2}".format(name, dest, import_key)
                 result["rc"] = 0
+                result['cli_stats'] = cli_stats()
                 module.exit_json(**result)
         if (key_exist == 0 and (secret != _secret or caps != _caps)) or key_exist != 0: # noqa E501
             rc, cmd, out, err = exec_commands(module, create_key(
@@ -600,6 +822,7 @@ def run_module():
             if rc != 0:
                 result["stdout"] = "Couldn't create or update {0}".format(name)
                 result["stderr"] = err
+                result['cli_stats'] = cli_stats()
                 module.exit_json(**result)
             module.set_fs_attributes_if_different(file_args, False)
             changed = True
@@ -620,6 +843,7 @@ def run_module():
         if rc != 0:
             result["stdout"] = "skipped, since {0} does not exist".format(name)
             result['rc'] = 0
+            result['cli_stats'] = cli_stats()
             module.exit_json(**result)
 
     elif state == "list":
@@ -637,6 +861,7 @@ def run_module():
             result["stdout"] = "failed to retrieve ceph keys"
             result["sdterr"] = err
             result['rc'] = 0
+            result['cli_stats'] = cli_stats()
             module.exit_json(**result)
 
         entities = lookup_ceph_initial_entities(module, out)
@@ -685,6 +910,7 @@ def run_module():
         stdout=out.rstrip("\r\n"),
         stderr=err.rstrip("\r\n"),
         changed=changed,
+        cli_stats=cli_stats(),
     )
 
     if rc != 0:
@@ -19,11 +19,18 @@ from __future__ import absolute_import, division, print_function
 __metaclass__ = type
 
 from ansible.module_utils.basic import AnsibleModule
-from ansible.module_utils.ca_common import generate_ceph_cmd, \
+try:
+    from ansible.module_utils.ca_common import generate_ceph_cmd, \
                                                pre_generate_ceph_cmd, \
                                                is_containerized, \
                                                exec_command, \
                                                exit_module
+except ImportError:
+    from tripleo_ansible.ansible_plugins.module_utils.ca_common import generate_ceph_cmd, \
+                                       pre_generate_ceph_cmd, \
+                                       is_containerized, \
+                                       exec_command, \
+                                       exit_module
 import datetime
 import json
 import yaml
@@ -53,9 +60,21 @@ options:
     type: str
   name:
     description:
-      - name of the Ceph pool
-    required: true
+      - name of the Ceph pool, required unless pools is given
+    required: false
     type: str
+  pools:
+    description:
+      - List of pools to manage in a single module run. Each item takes
+        the name, state (present or absent), size, min_size, pg_num,
+        pgp_num, pg_autoscale_mode, target_size_ratio, pool_type (or type),
+        erasure_profile, rule_name, expected_num_objects and application
+        options, the options of the module are their default values.
+      - The existing pools are listed once and only the commands needed to
+        create, update or remove the pools are run.
+    required: false
+    type: list
+    elements: dict
   state:
     description:
       If 'present' is used, the module creates a pool if it doesn't exist
@@ -146,9 +165,29 @@ pools:
         pool_type: "{{ item.pool_type }}"
         pg_autoscale_mode: "{{ item.pg_autoscale_mode }}"
       with_items: "{{ pools }}"
+
+    - name: create the pools in a single module run
+      ceph_pool:
+        pools: "{{ pools }}"
 '''
 
-RETURN = '''#  '''
+RETURN = '''
+pools:
+  description: Result of each pool, in pools mode
+  returned: when pools is given
+  type: list
+  sample:
+    - name: foo
+      changed: true
+      rc: 0
+      stdout: ''
+      stderr: ''
+'''
+
+POOL_OPTIONS = ('name', 'state', 'size', 'min_size', 'pg_num', 'pgp_num',
+                'pg_autoscale_mode', 'target_size_ratio', 'pool_type',
+                'erasure_profile', 'rule_name', 'expected_num_objects',
+                'application')
 
 
 def check_pool_exist(cluster,
@@ -326,6 +365,22 @@ def get_pool_details(module,
     return rc, cmd, out, err
 
 
+def get_running_pools(out):
+    '''
+    Index the output of 'osd pool ls detail' by pool name, with the same
+    details as get_pool_details
+    '''
+
+    pools = {}
+    for details in json.loads(out.strip()):
+        details['target_size_ratio'] = \
+            details['options'].get('target_size_ratio')
+        application = list(details.get('application_metadata', {}).keys())
+        details['application'] = application[0] if application else ''
+        pools[details['pool_name']] = details
+    return pools
+
+
 def compare_pool_config(user_pool_config, running_pool_details):
     '''
     Compare user input config pool details with current running pool details
@@ -490,48 +545,42 @@ def update_pool(module, cluster, name,
     return rc, cmd, out, err
 
 
-def run_module():
-    module = AnsibleModule(
-        argument_spec=yaml.safe_load(DOCUMENTATION)['options'],
-        supports_check_mode=True,
-    )
+def build_user_pool_config(params):
+    '''
+    Build the pool config from the module or pool item parameters
+    '''
 
-    # Gather module parameters in variables
-    cluster = module.params.get('cluster')
-    name = module.params.get('name')
-    state = module.params.get('state')
-    details = module.params.get('details')
-    size = module.params.get('size')
-    min_size = module.params.get('min_size')
-    pg_num = module.params.get('pg_num')
-    pgp_num = module.params.get('pgp_num')
-    pg_autoscale_mode = module.params.get('pg_autoscale_mode')
-    target_size_ratio = module.params.get('target_size_ratio')
-    application = module.params.get('application')
-
-    if (module.params.get('pg_autoscale_mode').lower() in
+    name = params.get('name')
+    size = params.get('size')
+    min_size = params.get('min_size')
+    pg_num = params.get('pg_num')
+    pgp_num = params.get('pgp_num')
+    target_size_ratio = params.get('target_size_ratio')
+    application = params.get('application')
+
+    if (params.get('pg_autoscale_mode').lower() in
             ['true', 'on', 'yes']):
         pg_autoscale_mode = 'on'
-    elif (module.params.get('pg_autoscale_mode').lower() in
+    elif (params.get('pg_autoscale_mode').lower() in
           ['false', 'off', 'no']):
         pg_autoscale_mode = 'off'
     else:
         pg_autoscale_mode = 'warn'
 
-    if module.params.get('pool_type') == '1':
+    if params.get('pool_type') == '1':
         pool_type = 'replicated'
-    elif module.params.get('pool_type') == '3':
+    elif params.get('pool_type') == '3':
         pool_type = 'erasure'
     else:
-        pool_type = module.params.get('pool_type')
+        pool_type = params.get('pool_type')
 
-    if not module.params.get('rule_name'):
+    if not params.get('rule_name'):
         rule_name = 'replicated_rule' if pool_type == 'replicated' else None
     else:
-        rule_name = module.params.get('rule_name')
+        rule_name = params.get('rule_name')
 
-    erasure_profile = module.params.get('erasure_profile')
-    expected_num_objects = module.params.get('expected_num_objects')
+    erasure_profile = params.get('erasure_profile')
+    expected_num_objects = params.get('expected_num_objects')
     user_pool_config = {
         'pool_name': {'value': name},
         'pg_num': {'value': pg_num, 'cli_set_opt': 'pg_num'},
@@ -548,6 +597,143 @@ def run_module():
         'size': {'value': size, 'cli_set_opt': 'size'},
         'min_size': {'value': min_size}
     }
+    return user_pool_config
+
+
+def manage_pool(module,
+                cluster,
+                user,
+                user_key,
+                user_pool_config,
+                running_pool_details,
+                container_image=None):
+    '''
+    Create a pool or update it if its running details, None when it does
+    not exist, differ from its config
+    '''
+
+    name = user_pool_config['pool_name']['value']
+    rc, cmd, out, err = 0, [], '', ''
+    changed = False
+    if running_pool_details is not None:
+        user_pool_config['pg_placement_num'] = {'value': str(running_pool_details['pg_placement_num']), 'cli_set_opt': 'pgp_num'}  # noqa: E501
+        delta = compare_pool_config(user_pool_config,
+                                    running_pool_details)
+        if len(delta) > 0:
+            keys = list(delta.keys())
+            details = running_pool_details
+            if details['erasure_code_profile'] and 'size' in keys:
+                del delta['size']
+            if details['pg_autoscale_mode'] == 'on':
+                delta.pop('pg_num', None)
+                delta.pop('pgp_num', None)
+
+            if len(delta) == 0:
+                out = "Skipping pool {}.\nUpdating either 'size' on an erasure-coded pool " \
+                      "or 'pg_num'/'pgp_num' on a pg autoscaled pool is incompatible".format(name)
+            else:
+                rc, cmd, out, err = update_pool(module,
+                                                cluster,
+                                                name,
+                                                user,
+                                                user_key,
+                                                delta,
+                                                container_image=container_image)  # noqa: E501
+                if rc == 0:
+                    changed = True
+        else:
+            out = "Pool {} already exists and there is nothing to update.".format(name)  # noqa: E501
+    else:
+        rc, cmd, out, err = exec_command(module,
+                                         create_pool(cluster,
+                                                     name,
+                                                     user,
+                                                     user_key,
+                                                     user_pool_config=user_pool_config,  # noqa: E501
+                                                     container_image=container_image))  # noqa: E501
+        if user_pool_config['application']['value']:
+            rc, _, _, _ = exec_command(module,
+                                       enable_application_pool(cluster,
+                                                               name,
+                                                               user_pool_config['application']['value'],  # noqa: E501
+                                                               user,
+                                                               user_key,
+                                                               container_image=container_image))  # noqa: E501
+        if user_pool_config['min_size']['value']:
+            # not implemented yet
+            pass
+        changed = True
+    return rc, cmd, out, err, changed
+
+
+def manage_pools(module, cluster, user, user_key, container_image=None):
+    '''
+    Create, update or remove the pools of the pools parameter from a single
+    listing of the existing pools, stopping at the first failure
+    '''
+
+    results = []
+    rc, cmd, out, err = exec_command(module,
+                                     list_pools(cluster,
+                                                user,
+                                                user_key,
+                                                True,
+                                                container_image=container_image))  # noqa: E501
+    if rc != 0:
+        return rc, cmd, "Couldn't list pool(s) present on the cluster", err, False, results  # noqa: E501
+    running_pools = get_running_pools(out)
+
+    changed = False
+    for pool in module.params['pools']:
+        if 'type' in pool and 'pool_type' not in pool:
+            pool = dict(pool, pool_type=pool['type'])
+        params = dict((k, module.params.get(k)) for k in POOL_OPTIONS)
+        params.update((k, str(v)) for k, v in pool.items()
+                      if k in POOL_OPTIONS and v is not None)
+        name = params['name']
+        if not name:
+            return 1, cmd, '', 'A pool has no name', changed, results
+        pool_changed = False
+        if params['state'] == 'absent':
+            rc, cmd, out, err = 0, [], '', ''
+            if name in running_pools:
+                rc, cmd, out, err = exec_command(module,
+                                                 remove_pool(cluster,
+                                                             name,
+                                                             user,
+                                                             user_key,
+                                                             container_image=container_image))  # noqa: E501
+                pool_changed = rc == 0
+            else:
+                out = "Skipped, since pool {} doesn't exist".format(name)
+        else:
+            rc, cmd, out, err, pool_changed = manage_pool(
+                module, cluster, user, user_key,
+                build_user_pool_config(params), running_pools.get(name),
+                container_image=container_image)
+        changed |= pool_changed
+        results.append(dict(name=name, changed=pool_changed, rc=rc,
+                            stdout=out.strip(), stderr=err.strip()))
+        if rc != 0:
+            break
+
+    out = '\n'.join(r['stdout'] for r in results if r['stdout'])
+    return rc, cmd, out, err, changed, results
+
+
+def run_module():
+    module = AnsibleModule(
+        argument_spec=yaml.safe_load(DOCUMENTATION)['options'],
+        supports_check_mode=True,
+        required_one_of=[['name', 'pools']],
+        mutually_exclusive=[['name', 'pools']],
+    )
+
+    # Gather module parameters in variables
+    cluster = module.params.get('cluster')
+    name = module.params.get('name')
+    state = module.params.get('state')
+    details = module.params.get('details')
 
     if module.check_mode:
         module.exit_json(
@@ -570,6 +756,14 @@ def run_module():
     keyring_filename = cluster + '.' + user + '.keyring'
     user_key = os.path.join("/etc/ceph/", keyring_filename)
 
+    if module.params.get('pools') is not None:
+        if state == 'list':
+            module.fail_json(msg="state list is not supported with pools")
+        rc, cmd, out, err, changed, results = manage_pools(
+            module, cluster, user, user_key, container_image=container_image)
+        exit_module(module=module, out=out, rc=rc, cmd=cmd, err=err,
+                    startd=startd, changed=changed, pools=results)
+
     if state == "present":
         rc, cmd, out, err = exec_command(module,
                                          check_pool_exist(cluster,
@@ -577,60 +771,21 @@ def run_module():
                                                           user,
                                                           user_key,
                                                           container_image=container_image))  # noqa: E501
+        running_pool_details = None
         if rc == 0:
             running_pool_details = get_pool_details(module,
                                                     cluster,
                                                     name,
                                                     user,
                                                     user_key,
-                                                    container_image=container_image)  # noqa: E501
-            user_pool_config['pg_placement_num'] = {'value': str(running_pool_details[2]['pg_placement_num']), 'cli_set_opt': 'pgp_num'}  # noqa: E501
-            delta = compare_pool_config(user_pool_config,
-                                        running_pool_details[2])
-            if len(delta) > 0:
-                keys = list(delta.keys())
-                details = running_pool_details[2]
-                if details['erasure_code_profile'] and 'size' in keys:
-                    del delta['size']
-                if details['pg_autoscale_mode'] == 'on':
-                    delta.pop('pg_num', None)
-                    delta.pop('pgp_num', None)
-
-                if len(delta) == 0:
-                    out = "Skipping pool {}.\nUpdating either 'size' on an erasure-coded pool " \
-                          "or 'pg_num'/'pgp_num' on a pg autoscaled pool is incompatible".format(name)
-                else:
-                    rc, cmd, out, err = update_pool(module,
-                                                    cluster,
-                                                    name,
-                                                    user,
-                                                    user_key,
-                                                    delta,
-                                                    container_image=container_image)  # noqa: E501
-                    if rc == 0:
-                        changed = True
-            else:
-                out = "Pool {} already exists and there is nothing to update.".format(name)  # noqa: E501
-        else:
-            rc, cmd, out, err = exec_command(module,
-                                             create_pool(cluster,
-                                                         name,
-                                                         user,
-                                                         user_key,
-                                                         user_pool_config=user_pool_config,  # noqa: E501
-                                                         container_image=container_image))  # noqa: E501
-            if user_pool_config['application']['value']:
-                rc, _, _, _ = exec_command(module,
-                                           enable_application_pool(cluster,
-                                                                   name,
-                                                                   user_pool_config['application']['value'],  # noqa: E501
-                                                                   user,
-                                                                   user_key,
-                                                                   container_image=container_image))  # noqa: E501
-            if user_pool_config['min_size']['value']:
-                # not implemented yet
-                pass
-            changed = True
+                                                    container_image=container_image)[2]  # noqa: E501
+        rc, cmd, out, err, changed = manage_pool(module,
+                                                 cluster,
+                                                 user,
+                                                 user_key,
+                                                 build_user_pool_config(module.params),  # noqa: E501
+                                                 running_pool_details,
+                                                 container_image=container_image)  # noqa: E501
 
     elif state == "list":
         rc, cmd, out, err = exec_command(module,
@@ -18,9 +18,11 @@ __metaclass__ = type
 
 from ansible.module_utils.basic import AnsibleModule
 from ansible.module_utils.parsing.convert_bool import boolean
+try:
+    from ansible.module_utils import container_configs
+except ImportError:
+    from tripleo_ansible.ansible_plugins.module_utils import container_configs
 
-import glob
-import json
 import os
 import yaml
 
@@ -116,20 +118,10 @@ class ContainerConfigDataManager(object):
 
         # Generate dict from JSON files that match search pattern
         if os.path.exists(config_path):
-            matched_configs = glob.glob(os.path.join(config_path,
-                                                     config_pattern))
-            config_dict = {}
-            for mc in matched_configs:
-                name = os.path.splitext(os.path.basename(mc))[0]
-                config = json.loads(self._slurp(mc))
-                if self.debug:
-                    self.module.debug('Config found for {}: {}'.format(name,
-                                                                       config))
-                config_dict.update({name: config})
-
-            # Merge the config dict with given overrides
-            self.results['configs'] = self._merge_with_overrides(
-                    config_dict, config_overrides)
+            loader = container_configs.ConfigLoader(
+                config_path, config_pattern,
+                log=self.module.debug if self.debug else None)
+            self.results['configs'] = loader.get_configs(config_overrides)
         else:
             self.module.debug(
                 msg='{} does not exists, skipping step'.format(config_path))
@@ -138,39 +130,6 @@ class ContainerConfigDataManager(object):
         # Returns data
         self.module.exit_json(**self.results)
 
-    def _merge_with_overrides(self, config, merge_with=None):
-        """Merge config with a given dict of overrides.
-
-        :param config: dictionary of configs
-        :param merge_with: dictionary of overrides
-        :return: dict
-        """
-        merged_dict = config
-        if merge_with is None:
-            merge_with = {}
-        for k in merge_with.keys():
-            if k in config:
-                for mk, mv in merge_with[k].items():
-                    if self.debug:
-                        self.module.debug('Override found for {}: {} will be '
-                                          'set to {}'.format(k, mk, mv))
-                    merged_dict[k][mk] = mv
-                break
-        return merged_dict
-
-    def _slurp(self, path):
-        """Slurps a file and return its content.
-
-        :param path: string
-        :returns: string
-        """
-        if os.path.exists(path):
-            f = open(path, 'r')
-            return f.read()
-        else:
-            self.module.warn('{} was not found.'.format(path))
-            return ''
-
 
 def main():
     module = AnsibleModule(
@@ -137,6 +137,7 @@ class ContainerPuppetManager:
         puppet_config = args['puppet_config']
         update_config_hash_only = args['update_config_hash_only']
         self.config_vol_prefix = args['config_vol_prefix']
+        self._config_hashes = {}
 
         if not update_config_hash_only:
             data = json.loads(self._slurp(puppet_config))
@@ -155,8 +156,8 @@ class ContainerPuppetManager:
             self._cleanup_old_configs()
 
             # Make sure config_path exists
-            # Note: it'll cleanup old configs before creating new ones.
-            self._create_dir(config_path)
+            if not self._exists(config_path):
+                os.makedirs(config_path)
 
             # Generate the container configs
             config = self._get_config(self._merge_volumes_configs(data))
@@ -164,6 +165,10 @@ class ContainerPuppetManager:
                 config_dest = os.path.join(config_path, k + '.json')
                 self._update_container_config(config_dest, v)
 
+            # Cleanup the configs which are not generated anymore
+            self._cleanup_stale_configs(
+                config_path, [k + '.json' for k in config])
+
         # Update container-startup-config with new config hashes
         self._update_hashes()
 
@@ -388,14 +393,21 @@ class ContainerPuppetManager:
         if self._exists(path):
             os.remove(path)
 
-    def _create_dir(self, path):
-        """Creates a directory.
+    def _cleanup_stale_configs(self, path, keep):
+        """Remove the entries of a directory which are not to be kept.
 
         :param path: string
+        :param keep: list
         """
-        if self._exists(path):
-            self._remove_dir(path)
-        os.makedirs(path)
+        for entry in os.listdir(path):
+            if entry in keep:
+                continue
+            entry_path = os.path.join(path, entry)
+            if os.path.isdir(entry_path):
+                self._remove_dir(entry_path)
+            else:
+                self._remove_file(entry_path)
+            self.results['changed'] = True
 
     def _find(self, path, pattern='*.json'):
         """Returns a list of files in a directory.
@@ -429,24 +441,46 @@ class ContainerPuppetManager:
     def _update_container_config(self, path, config):
         """Update a container config.
 
+        The file is atomically replaced, and only when its content changed.
+        Its mode is enforced either way.
+
         :param path: string
         :param config: string
         """
-        f = open(path, 'wb')
-        f.write(json.dumps(config, indent=2).encode('utf-8'))
-        os.chmod(path, 0o600)
+        data = json.dumps(config, indent=2).encode('utf-8')
+        if self._exists(path):
+            with open(path, 'rb') as f:
+                unchanged = f.read() == data
+            if unchanged:
+                os.chmod(path, 0o600)
+                return
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+                                        prefix='.' + os.path.basename(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.chmod(tmp_path, 0o600)
+            os.rename(tmp_path, path)
+        except Exception:
+            self._remove_file(tmp_path)
+            raise
         self.results['changed'] = True
 
     def _get_config_hash(self, config_volume):
         """Returns a config hash from a config_volume.
 
+        Hashes are read once per run for each config volume.
+
         :param config_volume: string
         :returns: string
         """
-        hashfile = "%s.md5sum" % config_volume
-        hash_data = ''
-        if self._exists(hashfile):
-            return self._slurp(hashfile).strip('\n')
+        if config_volume not in self._config_hashes:
+            hashfile = "%s.md5sum" % config_volume
+            config_hash = None
+            if self._exists(hashfile):
+                config_hash = self._slurp(hashfile).strip('\n')
+            self._config_hashes[config_volume] = config_hash
+        return self._config_hashes[config_volume]
 
     def _get_config_base(self, prefix, volume):
         """Returns a config base path for a specific volume.
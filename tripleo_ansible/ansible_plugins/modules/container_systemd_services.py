@@ -0,0 +1,263 @@
+#!/usr/bin/python
+# Copyright 2021 Red Hat, Inc.
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+__metaclass__ = type
+
+from ansible.module_utils.basic import AnsibleModule
+
+import threading
+import time
+import yaml
+
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+
+
+ANSIBLE_METADATA = {
+    'metadata_version': '1.1',
+    'status': ['preview'],
+    'supported_by': 'community'
+}
+
+
+DOCUMENTATION = '''
+---
+module: container_systemd_services
+short_description: Start or restart the systemd services of containers
+version_added: "2.9"
+author:
+  - "TripleO team"
+description:
+  - Enables and starts or restarts the tripleo_<name>.service units of
+    containers, up to concurrency services at the same time. A service is
+    managed as soon as the services it depends on are, and it is polled
+    until it runs with an exponential backoff. The first attempt sets the
+    requested state, the next ones only make sure that the service is
+    started, so a service which is slow to come up is not restarted again.
+options:
+  services:
+    description:
+      - List of the services to manage, in the order they are managed when
+        they do not depend on each other.
+    required: true
+    type: list
+    elements: dict
+    suboptions:
+      name:
+        description:
+          - Name of the container.
+        required: true
+        type: str
+      state:
+        description:
+          - State of the service.
+        default: started
+        choices:
+          - started
+          - restarted
+        type: str
+      depends_on:
+        description:
+          - Names of the containers of this list whose service has to run
+            before this one is managed.
+        default: []
+        type: list
+        elements: str
+  concurrency:
+    description:
+      - Number of services started or restarted at the same time.
+    default: 1
+    type: int
+  poll_timeout:
+    description:
+      - Seconds a service is polled for before the module fails.
+    default: 20
+    type: int
+'''
+
+RETURN = '''
+restarted:
+  description: Services which were started or restarted, in the order of
+    the services option
+  returned: always
+  type: list
+  sample:
+    - tripleo_keystone.service
+service_timings:
+  description: Seconds spent starting or restarting each service
+  returned: always
+  type: dict
+  sample:
+    tripleo_keystone.service: 2.61
+'''
+
+EXAMPLES = '''
+- name: Start container systemd services
+  container_systemd_services:
+    concurrency: 4
+    services:
+      - name: mysql
+        state: restarted
+      - name: nova_api
+        depends_on:
+          - mysql
+'''
+
+# readiness polling of the services
+POLL_MULTIPLIER = 0.5
+POLL_MAX_WAIT = 8
+
+
+class ServiceError(Exception):
+    pass
+
+
+class SystemdServices(object):
+    """Start or restart the systemd services of containers"""
+
+    def __init__(self, module):
+        self.module = module
+        self.systemctl = module.get_bin_path('systemctl', True)
+        self.poll_timeout = module.params['poll_timeout']
+        self.lock = threading.Lock()
+        self.changed = set()
+        self.timings = {}
+
+    def _systemctl(self, *args):
+        return self.module.run_command([self.systemctl] + list(args))
+
+    def _enable(self, unit):
+        rc, out, err = self._systemctl('is-enabled', unit)
+        if out.strip() == 'enabled':
+            return False
+        if not self.module.check_mode:
+            self._systemctl('enable', unit)
+        return True
+
+    def _set_state(self, unit, state):
+        if state == 'started':
+            rc, out, err = self._systemctl('is-active', unit)
+            if out.strip() == 'active':
+                return False
+        if self.module.check_mode:
+            return True
+        rc, out, err = self._systemctl(
+            'restart' if state == 'restarted' else 'start', unit)
+        return rc == 0
+
+    def _started(self, unit):
+        if self.module.check_mode:
+            return True
+        rc, out, err = self._systemctl('show', '--property=Result', unit)
+        return out.strip() == 'Result=success'
+
+    def manage(self, name, state):
+        """Manage a service and poll it until it runs.
+
+        :param name: String for container name.
+        :param state: String for service state.
+        """
+        unit = 'tripleo_{}.service'.format(name)
+        start = time.time()
+        delay = POLL_MULTIPLIER
+        try:
+            changed = self._enable(unit)
+            while True:
+                changed |= self._set_state(unit, state)
+                if self._started(unit):
+                    break
+                if time.time() - start >= self.poll_timeout:
+                    raise ServiceError('Service {} has not started '
+                                       'yet'.format(name))
+                time.sleep(delay)
+                delay = min(delay * 2, POLL_MAX_WAIT)
+                state = 'started'
+        finally:
+            with self.lock:
+                self.timings[unit] = round(time.time() - start, 3)
+        if changed:
+            with self.lock:
+                self.changed.add(name)
+
+    def manage_all(self, services, concurrency):
+        """Manage the services concurrently, in dependency order.
+
+        :param services: List of dictionaries of the services.
+        :param concurrency: Number of services managed at the same time.
+        """
+        order = dict((s['name'], i) for i, s in enumerate(services))
+        states = dict((s['name'], s['state']) for s in services)
+        waiting = dict((s['name'], set(s['depends_on']) & set(order)
+                        - set([s['name']])) for s in services)
+        dependents = dict((name, []) for name in states)
+        for name, deps in waiting.items():
+            for dep in deps:
+                dependents[dep].append(name)
+
+        with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as exc:
+            running = {}
+
+            def submit(names):
+                for name in sorted(names, key=order.get):
+                    del waiting[name]
+                    future = exc.submit(self.manage, name, states[name])
+                    running[future] = name
+
+            submit([name for name, deps in waiting.items() if not deps])
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                ready = []
+                for future in done:
+                    name = running.pop(future)
+                    # stop scheduling at the first failure, the services
+                    # already running are waited for on exit
+                    future.result()
+                    for dependent in dependents[name]:
+                        waiting[dependent].discard(name)
+                        if not waiting[dependent]:
+                            ready.append(dependent)
+                submit(ready)
+
+        if waiting:
+            raise ServiceError('Circular dependencies between services: '
+                               '{}'.format(', '.join(sorted(waiting))))
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec=yaml.safe_load(DOCUMENTATION)['options'],
+        supports_check_mode=True,
+    )
+    services = module.params['services']
+    systemd_services = SystemdServices(module)
+    order = dict((s['name'], i) for i, s in enumerate(services))
+    try:
+        systemd_services.manage_all(services, module.params['concurrency'])
+    except ServiceError as e:
+        failed = str(e)
+    else:
+        failed = None
+    restarted = ['tripleo_{}.service'.format(name) for name in
+                 sorted(systemd_services.changed, key=order.get)]
+    result = dict(changed=bool(restarted), restarted=restarted,
+                  service_timings=systemd_services.timings)
+    if failed:
+        module.fail_json(msg=failed, **result)
+    module.exit_json(**result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+#!/usr/bin/python
+# Copyright 2021 Red Hat, Inc.
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+__metaclass__ = type
+
+from ansible.module_utils.basic import AnsibleModule
+
+import os
+import tempfile
+import yaml
+
+
+ANSIBLE_METADATA = {
+    'metadata_version': '1.1',
+    'status': ['preview'],
+    'supported_by': 'community'
+}
+
+
+DOCUMENTATION = '''
+---
+module: container_systemd_units
+short_description: Write the systemd units of containers
+version_added: "2.9"
+author:
+  - "TripleO team"
+description:
+  - Writes the systemd service units rendered by the container_systemd
+    action, removes the old requires files and healthchecks of the
+    containers and reloads systemd once if anything changed.
+options:
+  units:
+    description:
+      - Dictionary of container names and the content of their
+        tripleo_<name>.service unit. Only the units whose content changed
+        are written.
+    required: true
+    type: dict
+  systemd_healthchecks:
+    description:
+      - Whether or not we cleanup the old healthchecks with SystemD.
+    default: true
+    type: bool
+  unit_dir:
+    description:
+      - Directory of the systemd units.
+    default: /etc/systemd/system
+    type: str
+'''
+
+RETURN = '''
+changed_units:
+  description: Names of the containers whose unit was created or updated
+  returned: always
+  type: list
+  sample:
+    - keystone
+removed_healthchecks:
+  description: Names of the containers whose healthcheck was removed
+  returned: always
+  type: list
+  sample:
+    - keystone
+'''
+
+EXAMPLES = '''
+- name: Write container systemd units
+  container_systemd_units:
+    units:
+      keystone: |
+        [Unit]
+        Description=keystone container
+'''
+
+
+class SystemdUnits(object):
+    """Write the systemd units of containers"""
+
+    def __init__(self, module):
+        self.module = module
+        self.unit_dir = module.params['unit_dir']
+        self.changed = False
+        self.reload = False
+
+    def _path(self, filename):
+        return os.path.join(self.unit_dir, filename)
+
+    def _systemctl(self, *args, check=True):
+        if self.module.check_mode:
+            return
+        systemctl = self.module.get_bin_path('systemctl', True)
+        rc, out, err = self.module.run_command([systemctl] + list(args))
+        if rc != 0 and check:
+            self.module.fail_json(
+                msg='systemctl {} failed: {}'.format(' '.join(args),
+                                                     err or out),
+                rc=rc, stdout=out, stderr=err)
+
+    def _remove(self, path):
+        if not os.path.exists(path):
+            return False
+        if not self.module.check_mode:
+            try:
+                os.remove(path)
+            except OSError as e:
+                self.module.fail_json(
+                    msg='Unable to remove {}: {}'.format(path, e))
+        self.changed = True
+        return True
+
+    def cleanup_requires(self, names):
+        for name in names:
+            self._remove(self._path('tripleo_{}.requires'.format(name)))
+
+    def cleanup_healthchecks(self, names):
+        removed = []
+        for name in names:
+            timer = 'tripleo_{}_healthcheck.timer'.format(name)
+            if not os.path.exists(self._path(timer)):
+                continue
+            # the timer may not be loaded anymore
+            self._systemctl('stop', timer, check=False)
+            self._systemctl('disable', timer, check=False)
+            for ext in ('service', 'timer'):
+                if self._remove(self._path(
+                        'tripleo_{}_healthcheck.{}'.format(name, ext))):
+                    self.reload = True
+            removed.append(name)
+        return removed
+
+    def write_units(self, units):
+        changed_units = []
+        for name, content in units.items():
+            path = self._path('tripleo_{}.service'.format(name))
+            data = content.encode('utf-8')
+            try:
+                with open(path, 'rb') as f:
+                    changed = f.read() != data
+            except (IOError, OSError):
+                changed = True
+            if changed:
+                changed_units.append(name)
+                if not self.module.check_mode:
+                    fd, tmp_path = tempfile.mkstemp(dir=self.unit_dir)
+                    with os.fdopen(fd, 'wb') as f:
+                        f.write(data)
+                    self.module.atomic_move(tmp_path, path)
+            if os.path.exists(path):
+                file_args = self.module.load_file_common_arguments(
+                    dict(path=path, mode='0644', owner='root',
+                         group='root'), path=path)
+                changed = self.module.set_fs_attributes_if_different(
+                    file_args, changed)
+            self.changed |= changed
+        if changed_units:
+            self.reload = True
+        return changed_units
+
+    def daemon_reload(self):
+        if self.reload:
+            self._systemctl('daemon-reload')
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec=yaml.safe_load(DOCUMENTATION)['options'],
+        supports_check_mode=True,
+    )
+    units = module.params['units']
+    systemd_units = SystemdUnits(module)
+    systemd_units.cleanup_requires(units)
+    removed_healthchecks = []
+    if module.params['systemd_healthchecks']:
+        removed_healthchecks = systemd_units.cleanup_healthchecks(units)
+    changed_units = systemd_units.write_units(units)
+    systemd_units.daemon_reload()
+    module.exit_json(changed=systemd_units.changed,
+                     changed_units=changed_units,
+                     removed_healthchecks=removed_healthchecks)
+
+
+if __name__ == '__main__':
+    main()
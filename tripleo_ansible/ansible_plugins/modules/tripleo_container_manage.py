@@ -17,14 +17,21 @@ __metaclass__ = type
 
 from ansible.module_utils.basic import AnsibleModule
 from ansible.module_utils.parsing.convert_bool import boolean
+try:
+    from ansible.module_utils import container_configs
+except ImportError:
+    from tripleo_ansible.ansible_plugins.module_utils import container_configs
 
-import glob
+import builtins
 import os
+import threading
 import time
 import yaml
 import json
 
+from concurrent.futures import FIRST_COMPLETED
 from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
 
 ANSIBLE_METADATA = {
     'metadata_version': '1.1',
@@ -77,6 +84,20 @@ options:
       - Number of podman actions to run at the same time
     type: int
     default: 1
+  scheduler:
+    description:
+      - How the containers are scheduled. With start_order, all the
+        containers of a start_order are done before the containers of the
+        next start_order begin. With dependencies, a container starts as
+        soon as the containers it depends on are done, the target container
+        of an exec action, its volumes_from containers and the containers
+        listed in its depends_on key. Containers without dependencies start
+        right away, by start_order.
+    type: str
+    default: start_order
+    choices:
+      - start_order
+      - dependencies
   debug:
     description:
       - Enable debug
@@ -106,6 +127,203 @@ class ExecFailure(Exception):
         return f"ERROR: {self.msg}\nstderr: {self.stderr}"
 
 
+# option type: (expected type, convertible type, conversion)
+OPTS_COERCIONS = {
+    'list': (list, str, lambda v: [v]),
+    'bool': (bool, str, boolean),
+    'int': (int, str, int),
+    'str': (str, int, str),
+    'dict': (dict, None, None),
+}
+
+
+class ContainerOptsNormalizer:
+    """Convert THT container configs to podman_container options.
+
+    The defaults, the aliases and the type conversions of
+    ARGUMENTS_SPEC_CONTAINER are computed once and reused for every
+    container.
+    """
+
+    # THT option -> podman_container option
+    RENAMES = (
+        ('volumes', 'volume'),
+        ('environment', 'env'),
+        ('check_interval', 'healthcheck_interval'),
+        ('remove', 'rm'),
+        ('stop_grace_period', 'stop_timeout'),
+    )
+
+    def __init__(self, spec, module=None, debug=False):
+        self.module = module
+        self.debug = debug
+        self.defaults = dict((k, v.get('default')) for k, v in spec.items())
+        self.aliases = {}
+        self.coercions = {}
+        for k, v in spec.items():
+            for alias in v.get('aliases', []):
+                self.aliases[alias] = k
+            opt_type = v.get('type')
+            if opt_type in ['raw', 'path']:
+                self.coercions[k] = None
+            else:
+                self.coercions[k] = self._coercion(k, opt_type)
+
+    @staticmethod
+    def _coercion(key, opt_type):
+        expected, convertible, convert = OPTS_COERCIONS.get(
+            opt_type, (getattr(builtins, opt_type), None, None))
+
+        def coerce(name, value):
+            if isinstance(value, expected):
+                return value
+            if convertible is not None and isinstance(value, convertible):
+                return convert(value)
+            raise TypeError(f"Container {name} option ({key}, {value}) is "
+                            f"not type {opt_type} is {type(value)}")
+        return coerce
+
+    def translate(self, opts):
+        """Rename the THT options to their podman_container name"""
+        for tht_key, key in self.RENAMES:
+            if tht_key in opts:
+                opts[key] = opts.pop(tht_key)
+        if 'healthcheck' in opts and isinstance(opts['healthcheck'], dict):
+            opts['healthcheck'] = opts['healthcheck'].get('test', None)
+        if 'restart' in opts:
+            # NOTE(mwhahaha): converation from tripleo format to podman as
+            # systemd handles this restart config
+            opts['restart'] = False
+        return opts
+
+    def normalize(self, opts):
+        """Return the podman_container options of a THT container config"""
+        opts = self.translate(dict(opts))
+        container_opts = dict(self.defaults)
+        for k in [k for k in opts if k in self.aliases]:
+            container_opts[self.aliases[k]] = opts.pop(k)
+        container_opts.update(opts)
+
+        # convert data types since magic ansible option conversion doesn't
+        # occur here.
+        for k, v in container_opts.items():
+            if v is None:
+                continue
+            if k not in self.coercions:
+                if self.debug:
+                    self.module.debug(f"Container opt '{k}' is unknown")
+                continue
+            coerce = self.coercions[k]
+            if coerce is not None:
+                container_opts[k] = coerce(container_opts['name'], v)
+        return container_opts
+
+
+class PodmanSnapshot:
+    """Shared view of the state of all the containers.
+
+    The state of every container is fetched with a single podman ps and
+    podman inspect. Workers waiting for a container state share the same
+    snapshot, which is refreshed with an exponential backoff while someone
+    waits on it, or right away once it has been invalidated.
+    """
+
+    def __init__(self, module, min_delay=0.5, max_delay=6):
+        self.module = module
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.containers = {}
+        self.generation = 0
+        self.stale = True
+        self.refreshing = False
+        self.cond = threading.Condition()
+
+    def _fetch(self):
+        containers = {}
+        rc, out, err = self.module.run_command(
+            ['podman', 'ps', '-a', '--format', '{{.Names}}'])
+        names = out.split() if rc == 0 else []
+        if names:
+            # a container removed in between makes podman return an error
+            # while still printing the other containers
+            rc, out, err = self.module.run_command(
+                ['podman', 'container', 'inspect'] + names)
+            try:
+                for data in json.loads(out):
+                    containers[data['Name']] = data
+            except ValueError:
+                self.module.debug(f"Unable to inspect containers: {err}")
+        return containers
+
+    def refresh(self):
+        with self.cond:
+            if self.refreshing:
+                # someone else is fetching it already, use its result
+                generation = self.generation
+                while self.generation == generation and self.refreshing:
+                    self.cond.wait()
+                return
+            self.refreshing = True
+        containers = {}
+        try:
+            containers = self._fetch()
+        finally:
+            with self.cond:
+                self.containers = containers
+                self.generation += 1
+                self.stale = False
+                self.refreshing = False
+                self.cond.notify_all()
+
+    def get(self, name):
+        """Return the inspect data of a container, or None.
+
+        The snapshot is only fetched when it never was, so the data can be
+        older than the last invalidation.
+        """
+        with self.cond:
+            fetched = self.generation > 0
+        if not fetched:
+            self.refresh()
+        with self.cond:
+            return self.containers.get(name)
+
+    def invalidate(self):
+        """Make the next waiter refresh the snapshot"""
+        with self.cond:
+            self.stale = True
+            self.cond.notify_all()
+
+    def wait_for(self, name, predicate, timeout=60):
+        """Wait for the state of a container to match a predicate.
+
+        Returns True when predicate(inspect data) matched before timeout.
+        """
+        deadline = time.monotonic() + timeout
+        delay = self.min_delay
+        seen = None
+        while True:
+            with self.cond:
+                refresh = self.stale or self.generation == seen
+            if refresh:
+                self.refresh()
+            with self.cond:
+                seen = self.generation
+                data = self.containers.get(name)
+            if data is not None and predicate(data):
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            self.module.debug(f"{name} is not in the expected state, "
+                              "waiting...")
+            with self.cond:
+                # woken up early by a refresh or an invalidation
+                if self.generation == seen and not self.stale:
+                    self.cond.wait(min(delay, remaining))
+            delay = min(delay * 2, self.max_delay)
+
+
 class TripleoContainerManage:
     """Notes about this module.
 
@@ -127,40 +345,47 @@ class TripleoContainerManage:
         self.config_patterns = args.get('config_patterns')
         self.config_overrides = args['config_overrides']
         self.log_base_path = args.get('log_base_path')
+        self.scheduler = args.get('scheduler', 'start_order')
         self.debug = args.get('debug')
+        self.timings = {}
+        self.podman_calls = 0
+        self._count_podman_calls()
+        self.snapshot = PodmanSnapshot(self.module)
+        self.normalizer = ContainerOptsNormalizer(
+            ARGUMENTS_SPEC_CONTAINER, self.module, self.debug)
 
         self.run()
 
         self.module.exit_json(**self.results)
 
-    # container_config_data.py without overrides
+    def _count_podman_calls(self):
+        run_command = self.module.run_command
+        lock = threading.Lock()
+
+        def counted_run_command(args, *a, **kw):
+            if isinstance(args, (list, tuple)) and args:
+                executable = args[0]
+            else:
+                executable = str(args).split(' ', 1)[0]
+            if isinstance(executable, bytes):
+                executable = executable.decode()
+            if os.path.basename(executable) == 'podman':
+                with lock:
+                    self.podman_calls += 1
+            return run_command(args, *a, **kw)
+
+        self.module.run_command = counted_run_command
+
     def _get_configs(self):
-        configs = {}
         if not os.path.exists(self.config_dir):
             self.module.warn('Configuration directory does not exist '
                              f'{self.config_dir}')
-            return configs
-
-        matches = glob.glob(os.path.join(self.config_dir,
-                                         self.config_patterns))
-        for match in matches:
-            name = os.path.splitext(os.path.basename(match))[0]
-            with open(match, 'r') as data:
-                config = json.loads(data.read())
-            if self.debug:
-                self.module.debug(f'Config found for {name}: {config}')
-            configs.update({name: config})
-
-        # handle overrides similar to container_config_data
-        if self.config_overrides:
-            for k in self.config_overrides.keys():
-                if k in configs:
-                    for mk, mv in self.config_overrides[k].items():
-                        if self.debug:
-                            self.module.debug(f'Override found for {k}: {mk} '
-                                              f'will be set to {mv}')
-                        configs[k][mk] = mv
-        return configs
+            return {}
+
+        loader = container_configs.ConfigLoader(
+            self.config_dir, self.config_patterns,
+            log=self.module.debug if self.debug else None)
+        return loader.get_configs(self.config_overrides)
 
     def _get_version(self):
         rc, out, err = self.module.run_command(['podman', b'--version'])
@@ -168,59 +393,6 @@ class TripleoContainerManage:
             self.module.fail_json(msg='Can not determine podman version')
         return out.split('versio')[1].strip()
 
-    def _container_opts_defaults(self):
-        default = {}
-        opts = ARGUMENTS_SPEC_CONTAINER
-        for k, v in opts.items():
-            if 'default' in v:
-                default[k] = v['default']
-            else:
-                default[k] = None
-        return default
-
-    def _container_opts_update(self, container_opts):
-        opts_dict = self._container_opts_defaults()
-        aliases = {}
-        for k, v in ARGUMENTS_SPEC_CONTAINER.items():
-            if 'aliases' in v:
-                for alias in v['aliases']:
-                    aliases[alias] = k
-        for k in list(container_opts):
-            if k in aliases:
-                key = aliases[k]
-                opts_dict[key] = container_opts[k]
-                container_opts.pop(k)
-        opts_dict.update(container_opts)
-        return opts_dict
-
-    def _container_opts_types(self, container_opts):
-        # convert data types since magic ansible option conversion doesn't
-        # occur here.
-        for k, v in container_opts.items():
-            if v is None:
-                continue
-            if ARGUMENTS_SPEC_CONTAINER.get(k) is None:
-                if self.debug:
-                    self.module.debug(f"Container opt '{k}' is unknown")
-                continue
-            opt_type = ARGUMENTS_SPEC_CONTAINER.get(k).get('type')
-            if opt_type in ['raw', 'path']:
-                continue
-            if not isinstance(v, eval(opt_type)):
-                if isinstance(v, str) and opt_type == 'list':
-                    container_opts[k] = [v]
-                elif isinstance(v, str) and opt_type == 'bool':
-                    container_opts[k] = boolean(v)
-                elif isinstance(v, str) and opt_type == 'int':
-                    container_opts[k] = int(v)
-                elif isinstance(v, int) and opt_type == 'str':
-                    container_opts[k] = str(v)
-                else:
-                    raise TypeError(f"Container {container_opts['name']} "
-                                    f"option ({k}, {v}) is not "
-                                    f"type {opt_type} is {type(v)}")
-        return container_opts
-
     def _list_or_dict_arg(self, data, cmd, key, arg):
         """Utility to build a command and its argument with list or dict data.
 
@@ -241,21 +413,11 @@ class TripleoContainerManage:
                 if v:
                     cmd.append(f'{arg}={v}')
 
-    def check_running_container(self, name, retries=10):
-        count = 0
-        running = False
-        while not running and count < retries:
-            cmd = ['podman', 'inspect', name]
-            rc, out, err = self.module.run_command(cmd)
-            if rc == 0:
-                data = json.loads(out)[0]
-                running = data.get('State', {}).get('Running', False)
-                if running:
-                    return True
-            self.module.debug(f"{name} is not running, waiting...")
-            count = count + 1
-            time.sleep(6)
-        return False
+    def check_running_container(self, name, timeout=60):
+        return self.snapshot.wait_for(
+            name,
+            lambda data: data.get('State', {}).get('Running', False),
+            timeout=timeout)
 
     def exec_container(self, name, config):
         # check to see if the container we're going to exec into is running
@@ -277,16 +439,35 @@ class TripleoContainerManage:
             return False
         return True
 
+    def needs_config_digest(self, name, config):
+        """Whether to label a container with the digest of its config.
+
+        Adding a label recreates a container, so the containers created
+        before the config_digest label existed only get it once their
+        config changed, when they are recreated anyway.
+        """
+        data = self.snapshot.get(name)
+        if data is None:
+            return True
+        labels = (data.get('Config') or {}).get('Labels') or {}
+        if 'config_digest' in labels:
+            return True
+        return container_configs.parse_config_data(
+            labels.get('config_data')) != config
+
     def manage_container(self, name, config):
+        labels = {
+            'config_id': self.config_id,
+            'container_name': name,
+            'managed_by': 'tripleo_ansible',
+            'config_data': config,
+        }
+        if self.needs_config_digest(name, config):
+            labels['config_digest'] = container_configs.config_digest(config)
         opts = {
             'name': name,
             'state': "started",
-            'label': {
-                'config_id': self.config_id,
-                'container_name': name,
-                'managed_by': 'tripleo_ansible',
-                'config_data': config
-            },
+            'label': labels,
             'conmon_pidfile': f"/run/{name}.pid",
             'debug': self.debug,
             'log_driver': 'k8s-file',
@@ -294,28 +475,10 @@ class TripleoContainerManage:
             'log_opt': {"path": f"{self.log_base_path}/{name}.log"},
         }
         opts.update(config)
-        # do horible things to convert THT format to ansible module format
-        if 'volumes' in opts:
-            opts['volume'] = opts.pop('volumes')
-        if 'environment' in opts:
-            opts['env'] = opts.pop('environment')
-        if 'healthcheck' in opts and isinstance(opts['healthcheck'], dict):
-            opts['healthcheck'] = opts['healthcheck'].get('test', None)
-        if 'check_interval' in opts:
-            opts['healthcheck_interval'] = opts.pop('check_interval')
-        if 'remove' in opts:
-            opts['rm'] = opts.pop('remove')
-        if 'restart' in opts:
-            # NOTE(mwhahaha): converation from tripleo format to podman as
-            # systemd handles this restart config
-            opts['restart'] = False
-        if 'stop_grace_period' in opts:
-            opts['stop_timeout'] = opts.pop('stop_grace_period')
 
         success = True
         try:
-            container_opts = self._container_opts_update(opts)
-            container_opts = self._container_opts_types(container_opts)
+            container_opts = self.normalizer.normalize(opts)
             PodmanManager(self.module, container_opts).execute()
         except ExecFailure as e:
             print(e)
@@ -327,10 +490,14 @@ class TripleoContainerManage:
         name, config = data
         action = config.get('action', 'create')
         success = False
+        start = time.monotonic()
         if action == 'exec':
             success = self.exec_container(name, config)
         else:
             success = self.manage_container(name, config)
+            # the state of the containers changed
+            self.snapshot.invalidate()
+        self.timings[name] = time.monotonic() - start
         return (name, success)
 
     def check_failures(self, results):
@@ -350,11 +517,91 @@ class TripleoContainerManage:
             data[start_order].append((k, configs.get(k)))
         return data
 
+    def get_dependencies(self, configs):
+        """Return the containers each container has to wait for."""
+        dependencies = dict((name, set()) for name in configs)
+        if self.scheduler == 'start_order':
+            # every container waits for the previous start_order
+            previous = []
+            data = self.batch_start_order(configs)
+            for start_order in sorted(data.keys()):
+                names = [name for name, _ in data[start_order]]
+                for name in names:
+                    dependencies[name].update(previous)
+                previous = names
+            return dependencies
+
+        for name, config in configs.items():
+            hints = list(config.get('volumes_from') or [])
+            hints.extend(config.get('depends_on') or [])
+            if config.get('action') == 'exec':
+                hints.append(config['command'][0])
+            # only the containers managed here can be waited for
+            dependencies[name].update(
+                h for h in hints if h in configs and h != name)
+        return dependencies
+
+    def get_critical_path(self, dependencies):
+        """Return the longest chain of dependent containers by wall time."""
+        paths = {}
+
+        def path(name):
+            if name not in paths:
+                longest = (0, [])
+                for dep in dependencies[name]:
+                    longest = max(longest, path(dep))
+                paths[name] = (longest[0] + self.timings.get(name, 0),
+                               longest[1] + [name])
+            return paths[name]
+
+        critical_path = max((path(name) for name in dependencies),
+                            default=(0, []))
+        return dict(length=round(critical_path[0], 3),
+                    containers=critical_path[1])
+
+    def run_scheduled(self, configs, dependencies):
+        """Run each container as soon as its dependencies are done.
+
+        Returns the results of the containers which were run.
+        """
+        waiting = dict((name, set(deps))
+                       for name, deps in dependencies.items())
+        dependents = dict((name, []) for name in dependencies)
+        for name, deps in dependencies.items():
+            for dep in deps:
+                dependents[dep].append(name)
+
+        def priority(name):
+            return (configs[name].get('start_order', 0), name)
+
+        results = []
+        with ThreadPoolExecutor(max_workers=self.concurrency) as exc:
+            running = {}
+
+            def submit(names):
+                for name in sorted(names, key=priority):
+                    del waiting[name]
+                    future = exc.submit(self.run_container,
+                                        (name, configs[name]))
+                    running[future] = name
+
+            submit([name for name, deps in waiting.items() if not deps])
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                ready = []
+                for future in done:
+                    name = running.pop(future)
+                    results.append(future.result())
+                    for dependent in dependents[name]:
+                        waiting[dependent].discard(name)
+                        if not waiting[dependent]:
+                            ready.append(dependent)
+                submit(ready)
+        return results
+
     def run(self):
         configs = self._get_configs()
-        # sort configs by start_order
-        # launch containers?
-        data = self.batch_start_order(configs)
+        dependencies = self.get_dependencies(configs)
         failed = []
 
         def exe_fail_json(**kwargs):
@@ -364,13 +611,21 @@ class TripleoContainerManage:
         # to handle those all at once at the end
         orig_fail = self.module.fail_json
         self.module.fail_json = exe_fail_json
-        # loop through keys sorted
-        for start_order in sorted(data.keys()):
-            with ThreadPoolExecutor(max_workers=self.concurrency) as exc:
-                results = exc.map(self.run_container, data[start_order])
-            failed.extend(self.check_failures(results))
+        results = self.run_scheduled(configs, dependencies)
+        failed.extend(self.check_failures(results))
         self.module.fail_json = orig_fail
+        self.results['podman_calls'] = self.podman_calls
+
+        not_run = sorted(set(configs) - set(name for name, _ in results))
+        if not_run:
+            self.module.fail_json(
+                msg=f"Circular dependencies between containers: "
+                    f"{', '.join(not_run)}")
 
+        self.results['container_timings'] = dict(
+            (name, round(elapsed, 3))
+            for name, elapsed in self.timings.items())
+        self.results['critical_path'] = self.get_critical_path(dependencies)
         if len(failed) > 0:
             self.module.fail_json(
                 msg=f"Failed containers: {', '.join(failed)}")
@@ -0,0 +1,353 @@
+#!/usr/bin/python
+# Copyright 2021 Red Hat, Inc.
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+__metaclass__ = type
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils._text import to_bytes
+from ansible.module_utils.parsing.convert_bool import boolean
+
+import grp
+import os
+import pwd
+import tarfile
+import tempfile
+import yaml
+
+
+ANSIBLE_METADATA = {
+    'metadata_version': '1.1',
+    'status': ['preview'],
+    'supported_by': 'community'
+}
+
+
+DOCUMENTATION = '''
+---
+module: tripleo_host_prep_apply
+short_description: Apply the host prep data bundled by tripleo_host_prep
+version_added: "2.9"
+author:
+  - "TripleO team"
+description:
+  - Applies groups, users, directories and files to the host in a single
+    module run, in this order. It is used by the tripleo_host_prep action in
+    bundled mode and only supports the options of the group, user, file and
+    copy modules listed below, the action applies the items using other
+    options with their module.
+  - Processing stops at the first item which fails.
+options:
+  groups:
+    description:
+      - List of groups, supporting the name, gid, system and state options
+        of the group module.
+    type: list
+    elements: dict
+    default: []
+  users:
+    description:
+      - List of users, supporting the name, uid, group, groups, append,
+        comment, home, shell, system, create_home and state options of the
+        user module.
+    type: list
+    elements: dict
+    default: []
+  directories:
+    description:
+      - List of directories, supporting the path, state (directory), mode,
+        owner, group, seuser, serole, setype and selevel options of the file
+        module.
+    type: list
+    elements: dict
+    default: []
+  files:
+    description:
+      - List of files, supporting the dest, force, mode, owner, group,
+        seuser, serole, setype and selevel options of the copy module. The
+        content of a file is the archive member named by its member key.
+        When dest is a directory, the file is created in it with the name
+        given by src_name.
+    type: list
+    elements: dict
+    default: []
+  archive:
+    description:
+      - Path of the tar archive holding the content of the files.
+    type: str
+'''
+
+RETURN = '''
+results:
+  description: Status of each item applied
+  returned: always
+  type: list
+  sample:
+    - type: directories
+      name: /var/log/containers/nova
+      changed: true
+      failed: false
+'''
+
+EXAMPLES = '''
+- name: Apply host prep data
+  tripleo_host_prep_apply:
+    groups:
+      - name: foobar
+        gid: 1233
+    users:
+      - name: foo
+        uid: 1233
+        group: foobar
+    directories:
+      - path: /var/tmp/foo
+        mode: "0700"
+    files:
+      - dest: /var/tmp/foo/bar
+        member: files/0
+        mode: "0644"
+    archive: /tmp/ansible-tmp/host_prep_files.tar.gz
+'''
+
+FS_OPTIONS = ('mode', 'owner', 'group', 'seuser', 'serole', 'setype',
+              'selevel')
+
+
+class HostPrepFailure(Exception):
+    """exception to stop processing"""
+
+
+class HostPrep(object):
+    """Apply the host prep items locally"""
+
+    def __init__(self, module):
+        self.module = module
+        self.results = []
+        self.changed = False
+        self._archive = None
+
+    def _run(self, cmd):
+        cmd[0] = self.module.get_bin_path(cmd[0], True)
+        if self.module.check_mode:
+            return
+        rc, out, err = self.module.run_command(cmd)
+        if rc != 0:
+            raise HostPrepFailure('{} failed: {}'.format(
+                ' '.join(cmd), err or out))
+
+    def _file_args(self, args, path):
+        fs_args = dict((k, args[k]) for k in FS_OPTIONS if k in args)
+        fs_args['path'] = path
+        return self.module.load_file_common_arguments(fs_args, path=path)
+
+    def _member(self, name):
+        if self._archive is None:
+            self._archive = tarfile.open(self.module.params['archive'])
+        return self._archive.extractfile(name).read()
+
+    def apply_group(self, args):
+        name = args['name']
+        try:
+            group = grp.getgrnam(name)
+        except KeyError:
+            group = None
+        gid = args.get('gid')
+        if args.get('state', 'present') == 'absent':
+            if group is None:
+                return False
+            cmd = ['groupdel', name]
+        elif group is None:
+            cmd = ['groupadd']
+            if gid is not None:
+                cmd.extend(['-g', str(gid)])
+            if boolean(args.get('system', False)):
+                cmd.append('-r')
+            cmd.append(name)
+        elif gid is not None and int(gid) != group.gr_gid:
+            cmd = ['groupmod', '-g', str(gid), name]
+        else:
+            return False
+        self._run(cmd)
+        return True
+
+    def apply_user(self, args):
+        name = args['name']
+        try:
+            user = pwd.getpwnam(name)
+        except KeyError:
+            user = None
+        if args.get('state', 'present') == 'absent':
+            if user is None:
+                return False
+            self._run(['userdel', name])
+            return True
+
+        groups = args.get('groups')
+        if isinstance(groups, str):
+            groups = groups.split(',')
+        if groups is not None:
+            groups = [g.strip() for g in groups if g and g.strip()]
+
+        if user is None:
+            cmd = ['useradd']
+            for option, flag in (('uid', '-u'), ('group', '-g'),
+                                 ('comment', '-c'), ('home', '-d'),
+                                 ('shell', '-s')):
+                if args.get(option) is not None:
+                    cmd.extend([flag, str(args[option])])
+            if groups:
+                cmd.extend(['-G', ','.join(groups)])
+            if boolean(args.get('system', False)):
+                cmd.append('-r')
+            if boolean(args.get('create_home', True)):
+                cmd.append('-m')
+            else:
+                cmd.append('-M')
+            cmd.append(name)
+            self._run(cmd)
+            return True
+
+        cmd = ['usermod']
+        if args.get('uid') is not None and int(args['uid']) != user.pw_uid:
+            cmd.extend(['-u', str(args['uid'])])
+        group = args.get('group')
+        if group is not None:
+            try:
+                gid = int(group)
+            except ValueError:
+                try:
+                    gid = grp.getgrnam(group).gr_gid
+                except KeyError:
+                    raise HostPrepFailure(
+                        'Group {} does not exist'.format(group))
+            if gid != user.pw_gid:
+                cmd.extend(['-g', str(group)])
+        for option, flag, current in (('comment', '-c', user.pw_gecos),
+                                      ('home', '-d', user.pw_dir),
+                                      ('shell', '-s', user.pw_shell)):
+            if args.get(option) is not None and args[option] != current:
+                cmd.extend([flag, str(args[option])])
+        if groups is not None:
+            current = set(g.gr_name for g in grp.getgrall()
+                          if name in g.gr_mem)
+            wanted = set(groups)
+            wanted.discard(grp.getgrgid(user.pw_gid).gr_name)
+            if boolean(args.get('append', False)):
+                if not wanted.issubset(current):
+                    cmd.extend(['-a', '-G', ','.join(sorted(wanted))])
+            elif wanted != current:
+                cmd.extend(['-G', ','.join(sorted(wanted))])
+        if len(cmd) == 1:
+            return False
+        cmd.append(name)
+        self._run(cmd)
+        return True
+
+    def apply_directory(self, args):
+        path = args['path']
+        b_path = to_bytes(path, errors='surrogate_or_strict')
+        file_args = self._file_args(args, path)
+        changed = False
+        if os.path.exists(b_path):
+            if not os.path.isdir(b_path):
+                raise HostPrepFailure(
+                    '{} already exists and is not a directory'.format(path))
+        elif self.module.check_mode:
+            return True
+        else:
+            # like the file module, the missing parents get the same
+            # attributes
+            curpath = ''
+            for dirname in path.strip('/').split('/'):
+                curpath = '/'.join([curpath, dirname])
+                if not os.path.isabs(path):
+                    curpath = curpath.lstrip('/')
+                b_curpath = to_bytes(curpath, errors='surrogate_or_strict')
+                if not os.path.exists(b_curpath):
+                    os.mkdir(b_curpath)
+                    changed = True
+                    tmp_file_args = file_args.copy()
+                    tmp_file_args['path'] = curpath
+                    changed = self.module.set_fs_attributes_if_different(
+                        tmp_file_args, changed, expand=False)
+        return self.module.set_fs_attributes_if_different(
+            file_args, changed, expand=False)
+
+    def apply_file(self, args):
+        dest = args['dest']
+        if os.path.isdir(dest):
+            if not args.get('src_name'):
+                raise HostPrepFailure(
+                    'Destination {} is a directory'.format(dest))
+            dest = os.path.join(dest, args['src_name'])
+        dest_dir = os.path.dirname(dest) or '.'
+        if not os.path.isdir(dest_dir):
+            raise HostPrepFailure(
+                'Destination directory {} does not exist'.format(dest_dir))
+
+        changed = False
+        data = self._member(args['member'])
+        exists = os.path.exists(dest)
+        if not exists or boolean(args.get('force', True)):
+            if exists:
+                with open(dest, 'rb') as f:
+                    changed = f.read() != data
+            else:
+                changed = True
+        if changed and self.module.check_mode:
+            return True
+        if changed:
+            fd, tmp_path = tempfile.mkstemp(dir=dest_dir)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            self.module.atomic_move(tmp_path, dest)
+        return self.module.set_fs_attributes_if_different(
+            self._file_args(args, dest), changed, expand=False)
+
+    def apply(self):
+        for data_type, key, func in (('groups', 'name', self.apply_group),
+                                     ('users', 'name', self.apply_user),
+                                     ('directories', 'path',
+                                      self.apply_directory),
+                                     ('files', 'dest', self.apply_file)):
+            for args in self.module.params[data_type]:
+                item = {'type': data_type, 'name': args[key],
+                        'changed': False, 'failed': False}
+                self.results.append(item)
+                try:
+                    item['changed'] = func(args)
+                except (HostPrepFailure, IOError, OSError, KeyError) as e:
+                    item['failed'] = True
+                    item['msg'] = str(e)
+                    raise HostPrepFailure('Failed to apply {} {}: {}'.format(
+                        data_type, args[key], e))
+                self.changed |= item['changed']
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec=yaml.safe_load(DOCUMENTATION)['options'],
+        supports_check_mode=True,
+    )
+    host_prep = HostPrep(module)
+    try:
+        host_prep.apply()
+    except HostPrepFailure as e:
+        module.fail_json(msg=str(e), changed=host_prep.changed,
+                         results=host_prep.results)
+    module.exit_json(changed=host_prep.changed, results=host_prep.results)
+
+
+if __name__ == '__main__':
+    main()
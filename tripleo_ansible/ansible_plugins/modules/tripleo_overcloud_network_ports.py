@@ -15,6 +15,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
 from concurrent import futures
 import metalsmith
 import yaml
@@ -119,6 +120,19 @@ options:
     description:
       - Mapping of instance hostnames to role name
     type: dict
+  net_maps_cache_key:
+    description:
+      - Identifier of the play run the network and subnet maps of the cloud
+        are cached on disk for, to be reused by the next network modules of
+        the same run. The cache is keyed by cloud name, stack and this
+        identifier. The maps are not cached when it is not set
+    type: str
+  net_maps_cache_ttl:
+    description:
+      - Maximum number of seconds the network and subnet maps are cached
+        for. Set to 0 to disable the cache
+    type: int
+    default: 0
 '''
 
 RETURN = '''
@@ -364,8 +378,23 @@ def delete_removed_nets(result, conn, instance, net_maps, inst_ports):
         result['changed'] = True
 
 
+def get_ports_by_hostname(conn, stack):
+    """Index the ports of the stack by dns_name
+
+    'dns_name' is not a valid attribute for filtering, listing the ports of
+    the stack once and slicing them per instance avoids downloading every
+    port of the stack for every instance.
+    """
+    ports_by_hostname = collections.defaultdict(list)
+    for port in conn.network.ports(
+            tags=['tripleo_stack_name={}'.format(stack)]):
+        ports_by_hostname[port.dns_name].append(port)
+
+    return ports_by_hostname
+
+
 def _provision_ports(result, conn, stack, instance, net_maps, ports_by_node,
-                     ironic_uuid, role):
+                     ironic_uuid, role, hostname_ports=None):
     hostname = instance['hostname']
     network_config = instance.get('network_config', {})
     tags = ['tripleo_stack_name={}'.format(stack),
@@ -373,10 +402,15 @@ def _provision_ports(result, conn, stack, instance, net_maps, ports_by_node,
     # TODO(hjensas): This can be moved below the ironic_uuid condition in
     # later release when all upgraded deployments has had the
     # tripleo_ironic_uuid tag added
-    inst_ports = conn.network.ports(tags=tags)
-    # NOTE(hjensas): 'dns_name' is not a valid attribute for filtering, so we
-    # have to do it manually.
-    inst_ports = [port for port in inst_ports if port.dns_name == hostname]
+    if hostname_ports is None:
+        inst_ports = conn.network.ports(tags=tags)
+        # NOTE(hjensas): 'dns_name' is not a valid attribute for filtering,
+        # so we have to do it manually.
+        inst_ports = [port for port in inst_ports
+                      if port.dns_name == hostname]
+    else:
+        inst_ports = [port for port in hostname_ports
+                      if tags[1] in port.tags]
 
     if ironic_uuid:
         tags.append('tripleo_ironic_uuid={}'.format(ironic_uuid))
@@ -399,22 +433,32 @@ def _provision_ports(result, conn, stack, instance, net_maps, ports_by_node,
     ports_by_node[hostname] = inst_ports
 
 
-def _unprovision_ports(result, conn, stack, instance, ironic_uuid):
+def _unprovision_ports(result, conn, stack, instance, ironic_uuid,
+                       hostname_ports=None):
     hostname = instance['hostname']
     tags = ['tripleo_stack_name={}'.format(stack)]
     if ironic_uuid:
         tags.append('tripleo_ironic_uuid={}'.format(ironic_uuid))
-    inst_ports = conn.network.ports(tags=tags)
-    # NOTE(hjensas): 'dns_name' is not a valid attribute for filtering, so we
-    # have to do it manually.
-    inst_ports = [port for port in inst_ports if port.dns_name == hostname]
+    if hostname_ports is None:
+        inst_ports = conn.network.ports(tags=tags)
+        # NOTE(hjensas): 'dns_name' is not a valid attribute for filtering,
+        # so we have to do it manually.
+        inst_ports = [port for port in inst_ports
+                      if port.dns_name == hostname]
+    else:
+        inst_ports = [port for port in hostname_ports
+                      if set(tags).issubset(port.tags)]
 
     # TODO(hjensas): This can be removed in later release when all upgraded
     # deployments has had the tripleo_ironic_uuid tag added.
     if not inst_ports:
-        tags = ['tripleo_stack_name={}'.format(stack)]
-        inst_ports = conn.network.ports(tags=tags)
-        inst_ports = [port for port in inst_ports if port.dns_name == hostname]
+        if hostname_ports is None:
+            tags = ['tripleo_stack_name={}'.format(stack)]
+            inst_ports = conn.network.ports(tags=tags)
+            inst_ports = [port for port in inst_ports
+                          if port.dns_name == hostname]
+        else:
+            inst_ports = hostname_ports
 
     if inst_ports:
         delete_ports(conn, inst_ports)
@@ -461,6 +505,7 @@ def manage_instances_ports(result, conn, stack, instances, concurrency, state,
 
     validate_instance_nets_in_net_map(instances, net_maps)
     ports_by_node = dict()
+    ports_by_hostname = get_ports_by_hostname(conn, stack)
 
     provision_jobs = []
     exceptions = []
@@ -478,7 +523,8 @@ def manage_instances_ports(result, conn, stack, instances, concurrency, state,
                              net_maps,
                              ports_by_node,
                              ironic_uuid,
-                             role)
+                             role,
+                             ports_by_hostname.get(instance['hostname'], []))
                 )
             elif state == 'absent':
                 provision_jobs.append(
@@ -487,7 +533,8 @@ def manage_instances_ports(result, conn, stack, instances, concurrency, state,
                              conn,
                              stack,
                              instance,
-                             ironic_uuid)
+                             ironic_uuid,
+                             ports_by_hostname.get(instance['hostname'], []))
                 )
 
     for job in futures.as_completed(provision_jobs):
@@ -594,7 +641,9 @@ def run_module():
     try:
         _, conn = openstack_cloud_from_module(module)
 
-        net_maps = n_utils.create_name_id_maps(conn)
+        net_maps = n_utils.get_name_id_maps(
+            conn, stack, module.params['net_maps_cache_key'],
+            module.params['net_maps_cache_ttl'])
 
         if state == 'present' and uuid_by_hostname:
             tag_metalsmith_managed_ports(result, conn, concurrency, stack,
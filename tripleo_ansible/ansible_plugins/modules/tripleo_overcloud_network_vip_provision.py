@@ -87,6 +87,19 @@ options:
          concurrency limit
     type: int
     default: 0
+  net_maps_cache_key:
+    description:
+      - Identifier of the play run the network and subnet maps of the cloud
+        are cached on disk for, to be reused by the next network modules of
+        the same run. The cache is keyed by cloud name, stack and this
+        identifier. The maps are not cached when it is not set
+    type: str
+  net_maps_cache_ttl:
+    description:
+      - Maximum number of seconds the network and subnet maps are cached
+        for. Set to 0 to disable the cache
+    type: int
+    default: 0
 author:
     - Harald Jensås <hjensas@redhat.com>
 '''
@@ -221,7 +234,9 @@ def run_module():
 
     try:
         _, conn = openstack_cloud_from_module(module)
-        net_maps = n_utils.create_name_id_maps(conn)
+        net_maps = n_utils.get_name_id_maps(
+            conn, stack, module.params['net_maps_cache_key'],
+            module.params['net_maps_cache_ttl'])
         validate_vip_nets_in_net_map(vip_data, net_maps)
 
         # no limit on concurrency, create a worker for every vip
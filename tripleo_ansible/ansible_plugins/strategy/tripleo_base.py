@@ -14,6 +14,11 @@
 # under the License.
 __metaclass__ = type
 
+import collections
+import json
+import os
+import time
+
 from ansible.errors import AnsibleError
 from ansible.module_utils._text import to_text
 from ansible.playbook.included_file import IncludedFile
@@ -31,6 +36,189 @@ DOCUMENTATION = '''
 
 display = Display()
 
+# Set to a file path to enable the strategy profiler
+PROFILE_ENV = 'TRIPLEO_STRATEGY_PROFILE'
+
+# Maximum number of compiled includes kept by the include cache
+INCLUDE_CACHE_SIZE = 256
+
+_timer = getattr(time, 'perf_counter', time.time)
+
+
+class _NoopPhase(object):
+    """Phase context manager used when profiling is disabled"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+NOOP_PHASE = _NoopPhase()
+
+
+class _Phase(object):
+    """Time a phase of the strategy"""
+
+    __slots__ = ('profiler', 'name', 'host', 'task', 'start')
+
+    def __init__(self, profiler, name, host, task):
+        self.profiler = profiler
+        self.name = name
+        self.host = host
+        self.task = task
+
+    def __enter__(self):
+        self.start = _timer()
+        return self
+
+    def __exit__(self, *args):
+        self.profiler.add(self.name, _timer() - self.start, self.host,
+                          self.task)
+        return False
+
+
+class StrategyProfiler(object):
+    """Time breakdown of the strategy phases per host and per task.
+
+    The phases are the iterator bookkeeping, the templating, the queuing of
+    tasks, the processing of includes and the time spent waiting on the
+    workers results. It is enabled by setting TRIPLEO_STRATEGY_PROFILE to a
+    file path, the profile of each play is then appended to it as a JSON
+    line, and to the same path with a .folded suffix as collapsed stacks
+    which can be fed to flamegraph.pl.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.enabled = bool(path)
+        self.totals = collections.defaultdict(float)
+        self.counts = collections.defaultdict(int)
+        self.hosts = collections.defaultdict(
+            lambda: collections.defaultdict(float))
+        self.tasks = collections.defaultdict(
+            lambda: collections.defaultdict(float))
+        self.counters = collections.defaultdict(int)
+        self.start = _timer()
+
+    def phase(self, name, host=None, task=None):
+        """Return a context manager timing a phase"""
+        if not self.enabled:
+            return NOOP_PHASE
+        return _Phase(self, name, host, task)
+
+    def add(self, name, elapsed, host=None, task=None):
+        self.totals[name] += elapsed
+        self.counts[name] += 1
+        if host is not None:
+            self.hosts[str(host)][name] += elapsed
+        if task is not None:
+            self.tasks[task.get_name()][name] += elapsed
+
+    def incr(self, name, value=1):
+        self.counters[name] += value
+
+    def profile(self, play=None):
+        """Return the profile as a dict"""
+        return {
+            'play': str(play) if play is not None else None,
+            'wall_time': _timer() - self.start,
+            'totals': dict(self.totals),
+            'counts': dict(self.counts),
+            'counters': dict(self.counters),
+            'hosts': dict((k, dict(v)) for k, v in self.hosts.items()),
+            'tasks': dict((k, dict(v)) for k, v in self.tasks.items()),
+        }
+
+    def folded(self, play=None):
+        """Return the profile as collapsed stacks, in microseconds"""
+        root = str(play or 'play').replace(';', ':').replace(' ', '_')
+        lines = []
+        for host, phases in sorted(self.hosts.items()):
+            for name, elapsed in sorted(phases.items()):
+                lines.append('{};{};{} {}'.format(
+                    root, host.replace(';', ':'), name,
+                    int(elapsed * 1000000)))
+        # time spent outside of any host
+        for name, elapsed in sorted(self.totals.items()):
+            per_host = sum(p.get(name, 0) for p in self.hosts.values())
+            if elapsed - per_host > 0:
+                lines.append('{};{} {}'.format(
+                    root, name, int((elapsed - per_host) * 1000000)))
+        return lines
+
+    def dump(self, play=None):
+        """Append the profile of a play to the profile files"""
+        if not self.enabled:
+            return
+        try:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(self.profile(play), sort_keys=True))
+                f.write('\n')
+            with open(self.path + '.folded', 'a') as f:
+                for line in self.folded(play):
+                    f.write(line + '\n')
+        except (IOError, OSError) as e:
+            display.warning('Unable to write the strategy profile to '
+                            '{}: {}'.format(self.path, e))
+
+
+def _include_key(include):
+    """Return the cache key of an included file.
+
+    It matches what makes two IncludedFile equal: the file, its arguments
+    and variables and the include task itself.
+    """
+    signature = json.dumps([include._args, include._vars], sort_keys=True,
+                           default=repr)
+    return (include._filename, signature, bool(include._is_role),
+            include._task._uuid, include._task._parent._uuid)
+
+
+class IncludeCache(object):
+    """Compiled and tag filtered blocks of the included files.
+
+    The free strategy processes the results of the hosts as they come, so
+    the same include gets loaded and compiled again for every batch of
+    hosts reaching it. The blocks are shared by all the hosts of an include
+    anyway, so they are kept here for the later batches, and for the later
+    plays of the run which reuse the same tasks (serial batches).
+    Included roles are not kept, loading them registers their handlers in
+    the play.
+    """
+
+    def __init__(self, size=INCLUDE_CACHE_SIZE):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._blocks = collections.OrderedDict()
+
+    def get(self, include):
+        key = _include_key(include)
+        blocks = self._blocks.get(key)
+        if blocks is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._blocks.pop(key)
+        self._blocks[key] = blocks
+        return blocks
+
+    def set(self, include, blocks):
+        self._blocks[_include_key(include)] = blocks
+        while len(self._blocks) > self.size:
+            self._blocks.popitem(last=False)
+
+    def clear(self):
+        self._blocks.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+# shared by the strategies of all the plays of the run
+INCLUDE_CACHE = IncludeCache()
+
 
 class TripleoBase(StrategyBase):
 
@@ -46,9 +234,18 @@ class TripleoBase(StrategyBase):
         self._strat_results = []
         self.noop_task = None
         self._fail_cache = {}
+        # failed hosts by role, kept up to date from the results
+        self._failures_iterator = None
+        self._failed_by_role = {}
+        self._failure_counts = {}
+        self._tqm_failed_count = 0
+        # number of hosts by group, for a groups dict of the inventory
+        self._groups_dict = None
+        self._group_sizes = {}
         # these were defined in 2.9
         self._has_hosts_cache = False
         self._has_hosts_cache_all = False
+        self._profiler = StrategyProfiler(os.environ.get(PROFILE_ENV))
 
     def _print(self, msg, host=None, level=1):
         # host needs to be a string or bad things happen. LP#1904917
@@ -109,8 +306,7 @@ class TripleoBase(StrategyBase):
         percent, role = self._get_fail_percent(host)
         current_failed = current_failures.get(role, 1)
 
-        groups = self._inventory.get_groups_dict()
-        group_count = len(groups.get(role, []))
+        group_count = self._get_group_size(role)
         if group_count == 0:
             return True
         failed_percent = (current_failed / group_count) * 100
@@ -118,17 +314,96 @@ class TripleoBase(StrategyBase):
             return True
         return False
 
-    def _get_current_failures(self):
-        """Return the number of failures per role"""
-        failures = {}
-        for host, _ in self._iterator.get_failed_hosts().items():
-            host_obj = self._inventory.get_host(host)
-            per, role = self._get_fail_percent(host_obj)
-            if role in failures:
-                failures[role] += 1
+    def _get_group_size(self, role):
+        """Return the number of hosts of a group
+
+        The inventory replaces its groups dict when it changes, the sizes
+        are only computed again then.
+        """
+        groups = self._inventory.get_groups_dict()
+        if groups is not self._groups_dict:
+            self._groups_dict = groups
+            self._group_sizes = {}
+        if role not in self._group_sizes:
+            self._group_sizes[role] = len(groups.get(role, []))
+        return self._group_sizes[role]
+
+    def _reset_failures(self):
+        """Count the failures from the iterator again on the next check"""
+        self._failures_iterator = None
+
+    def _update_failures(self, hosts):
+        """Update the failures per role of hosts
+
+        Only the hosts which got a result since the last update can have
+        failed or recovered, the other hosts keep their state. When more
+        hosts failed or recovered than were given, the failures are counted
+        from the iterator again.
+        """
+        if self._failures_iterator is not self._iterator:
+            # counted from the iterator on the next check
+            return
+        hosts = list(hosts)
+        failed_count = len(self._tqm._failed_hosts)
+        if abs(failed_count - self._tqm_failed_count) > len(hosts):
+            self._reset_failures()
+            return
+        self._tqm_failed_count = failed_count
+        for host in hosts:
+            per, role = self._get_fail_percent(host)
+            failed = self._failed_by_role.setdefault(role, set())
+            if self._iterator.is_failed(host):
+                failed.add(host.name)
+            else:
+                failed.discard(host.name)
+            if failed:
+                self._failure_counts[role] = len(failed)
             else:
-                failures[role] = 1
-        return failures
+                self._failure_counts.pop(role, None)
+
+    @staticmethod
+    def _run_once_failed(results):
+        """Whether a failed run_once task marked all the hosts failed
+
+        The hosts of the play are then marked failed without a result.
+        """
+        return any(res._task.run_once and res.is_failed()
+                   and not res._task.ignore_errors for res in results)
+
+    def _update_result_failures(self, results):
+        """Update the failures per role of the hosts of results"""
+        results = list(results)
+        if self._run_once_failed(results):
+            self._reset_failures()
+            return
+        self._update_failures(res._host for res in results)
+
+    def _get_current_failures(self):
+        """Return the number of failures per role
+
+        The failures are counted from the iterator once per play, or after
+        _reset_failures, and then kept up to date by _update_failures.
+        """
+        if self._failures_iterator is not self._iterator:
+            self._failures_iterator = self._iterator
+            self._failed_by_role = {}
+            self._failure_counts = {}
+            self._tqm_failed_count = len(self._tqm._failed_hosts)
+            for host in self._iterator.get_failed_hosts():
+                host_obj = self._inventory.get_host(host)
+                per, role = self._get_fail_percent(host_obj)
+                self._failed_by_role.setdefault(role, set()).add(host)
+            for role, failed in self._failed_by_role.items():
+                self._failure_counts[role] = len(failed)
+        return self._failure_counts
+
+    def _execute_meta(self, task, play_context, iterator, target_host):
+        results = super(TripleoBase, self)._execute_meta(
+            task, play_context, iterator, target_host)
+        if task.args.get('_raw_params') == 'clear_host_errors':
+            # the failures of all the hosts may have been cleared
+            self._reset_failures()
+        return results
 
     def _get_task_errors_fatal(self, task, templar):
         """Return parsed any_errors_fatal from a task"""
@@ -145,6 +420,49 @@ class TripleoBase(StrategyBase):
         It will return False if there was a failure during the include
         """
         self._debug('process_includes...')
+        with self._profiler.phase('includes'):
+            return self._process_includes(host_results, noop)
+
+    def _compile_include(self, include):
+        """Load an included file and return its tag filtered blocks"""
+        if include._is_role:
+            ir = self._copy_included_file(include)
+            new_blocks, handler_blocks = ir.get_block_list(
+                play=self._iterator._play,
+                variable_manager=self._variable_manager,
+                loader=self._loader)
+        else:
+            new_blocks = self._load_included_file(
+                include, iterator=self._iterator)
+        final_blocks = []
+        for block in new_blocks:
+            vars_params = {'play': self._iterator._play,
+                           'task': block._parent}
+            # ansible <2.9 compatibility
+            if self._has_hosts_cache:
+                vars_params['_hosts'] = self._hosts_cache
+            if self._has_hosts_cache_all:
+                vars_params['_hosts_all'] = self._hosts_cache_all
+
+            task_vars = self._variable_manager.get_vars(**vars_params)
+            final_blocks.append(block.filter_tagged_tasks(task_vars))
+        return final_blocks
+
+    def _include_failed_hosts(self, include):
+        """Return the hosts of an include which are marked failed"""
+        return [host for host in include._hosts
+                if host.get_name() in self._tqm._failed_hosts]
+
+    def _include_loaded(self, include, blocks):
+        """Account an include served from the cache like a loaded one"""
+        # loading an empty file is not accounted
+        if not blocks:
+            return
+        for host in include._hosts:
+            self._tqm._stats.increment('ok', host.name)
+        self._tqm.send_callback('v2_playbook_on_include', include)
+
+    def _process_includes(self, host_results, noop=False):
         include_files = IncludedFile.process_include_results(
                 host_results,
                 iterator=self._iterator,
@@ -158,41 +476,48 @@ class TripleoBase(StrategyBase):
             return include_success
 
         all_blocks = dict((host, []) for host in self._hosts_left)
+        failed_hosts = []
         for include in include_files:
             self._debug('Adding include...{}'.format(include))
             try:
-                if include._is_role:
-                    ir = self._copy_included_file(include)
-                    new_blocks, handler_blocks = ir.get_block_list(
-                        play=self._iterator._play,
-                        variable_manager=self._variable_manager,
-                        loader=self._loader)
+                final_blocks = None
+                # loading a role adds its handlers to the play, which is a
+                # new copy for every serial batch, so roles are not cached
+                if not include._is_role:
+                    final_blocks = INCLUDE_CACHE.get(include)
+                if final_blocks is None:
+                    if not include._is_role:
+                        self._profiler.incr('include_cache_misses')
+                    marked = self._include_failed_hosts(include)
+                    final_blocks = self._compile_include(include)
+                    # a failed load returns no blocks like an empty file,
+                    # but marks the hosts of the include failed
+                    load_failed = [
+                        host for host in self._include_failed_hosts(include)
+                        if host not in marked]
+                    if load_failed:
+                        failed_hosts.extend(load_failed)
+                    elif not include._is_role:
+                        INCLUDE_CACHE.set(include, final_blocks)
                 else:
-                    new_blocks = self._load_included_file(
-                        include, iterator=self._iterator)
-                for block in new_blocks:
-                    vars_params = {'play': self._iterator._play,
-                                   'task': block._parent}
-                    # ansible <2.9 compatibility
-                    if self._has_hosts_cache:
-                        vars_params['_hosts'] = self._hosts_cache
-                    if self._has_hosts_cache_all:
-                        vars_params['_hosts_all'] = self._hosts_cache_all
-
-                    task_vars = self._variable_manager.get_vars(**vars_params)
-                    final_block = block.filter_tagged_tasks(task_vars)
-
-                    for host in self._hosts_left:
-                        if host in include._hosts:
-                            all_blocks[host].append(final_block)
+                    self._profiler.incr('include_cache_hits')
+                    self._include_loaded(include, final_blocks)
+
+                for host in include._hosts:
+                    if host in all_blocks:
+                        all_blocks[host].extend(final_blocks)
             except AnsibleError as e:
                 for host in include._hosts:
                     self._tqm._failed_hosts[host.get_name()] = True
                     self._iterator.mark_host_failed(host)
+                failed_hosts.extend(include._hosts)
                 display.error(to_text(e), wrap_text=False)
                 include_success = False
                 continue
+        self._update_failures(failed_hosts)
 
+        self._debug('Include cache: {} hits, {} misses'.format(
+            INCLUDE_CACHE.hits, INCLUDE_CACHE.misses))
         for host in self._hosts_left:
             self._iterator.add_tasks(host, all_blocks[host])
 
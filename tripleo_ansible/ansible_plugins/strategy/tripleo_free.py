@@ -14,6 +14,7 @@
 # under the License.
 __metaclass__ = type
 
+import collections
 import os
 import time
 
@@ -54,12 +55,26 @@ DOCUMENTATION = '''
           will fail at the end of the play but there is no assurance that
           the task will actually complete successfully for a given playbook
           execution. Other tasks will continue on the other hosts.
+        - Setting TRIPLEO_FREE_WAKEUP=event in the environment makes the
+          strategy wait for the workers results and only advance the hosts
+          which got one, instead of polling all the hosts.
     version_added: "2.9"
     author: Alex Schultz <aschultz@redhat.com>
 '''
 
 display = Display()
 
+# Set to 'event' to advance the hosts as their results come in instead of
+# polling all the hosts
+WAKEUP_ENV = 'TRIPLEO_FREE_WAKEUP'
+
+# Maximum time to wait for a result before looking at all the hosts again
+EVENT_TIMEOUT = 1.0
+
+# jinja2 start delimiters, a string without any of them is not a template,
+# see Templar.is_possibly_template
+TEMPLATE_MARKERS = ('{%', '{{', '{#')
+
 
 class TripleoFreeBreak(Exception):
     """Exception used to break loops"""
@@ -71,6 +86,83 @@ class TripleoFreeContinue(Exception):
     pass
 
 
+class _ResultsQueue(collections.deque):
+    """Results deque waking up the strategy when a result comes in
+
+    The results thread of the base strategy appends the results while
+    holding the results lock, which is a condition.
+    """
+
+    def __init__(self, condition):
+        super(_ResultsQueue, self).__init__()
+        self._condition = condition
+
+    def append(self, item):
+        super(_ResultsQueue, self).append(item)
+        self._condition.notify_all()
+
+
+def _is_static(value):
+    """Return whether templating the value returns it as is"""
+    if isinstance(value, str):
+        return not any(marker in value for marker in TEMPLATE_MARKERS)
+    return value is None or isinstance(value, (bool, int))
+
+
+class _LazyTemplar(object):
+    """Templar of a host, only created when something is templated"""
+
+    def __init__(self, loader, variables):
+        self._loader = loader
+        self._variables = variables
+        self._templar = None
+
+    def __getattr__(self, name):
+        if self._templar is None:
+            self._templar = Templar(loader=self._loader,
+                                    variables=self._variables)
+        return getattr(self._templar, name)
+
+
+class TaskTemplateCache(object):
+    """Templated attributes of the tasks which are the same for every host.
+
+    The name, throttle, run_once and any_errors_fatal of a task are rarely
+    templates. When the raw value of one is not, templating it gives the
+    same result for every host, which is kept here by task.
+    """
+
+    def __init__(self, profiler=None):
+        self.hits = 0
+        self.misses = 0
+        self._profiler = profiler
+        self._values = {}
+
+    def _incr(self, name):
+        if self._profiler is not None:
+            self._profiler.incr(name)
+
+    def template(self, task, attr, templar, convert=None, **kwargs):
+        """Return the templated and converted value of a task attribute"""
+        value = getattr(task, attr, None)
+        if not _is_static(value):
+            value = templar.template(value, **kwargs)
+            return convert(value) if convert else value
+
+        key = (task._uuid, attr, value)
+        try:
+            result = self._values[key]
+        except KeyError:
+            result = convert(value) if convert else value
+            self._values[key] = result
+            self.misses += 1
+            self._incr('template_cache_misses')
+            return result
+        self.hits += 1
+        self._incr('template_cache_hits')
+        return result
+
+
 class StrategyModule(BASE.TripleoBase):
 
     # this strategy handles throttling
@@ -81,6 +173,12 @@ class StrategyModule(BASE.TripleoBase):
         self._last_host = 0
         self._workers_free = 0
         self._run_once_tasks = set()
+        self._event_driven = os.environ.get(WAKEUP_ENV) == 'event'
+        self._ready_hosts = collections.deque()
+        self._ready_set = set()
+        self._template_cache = TaskTemplateCache(self._profiler)
+        if self._event_driven:
+            self._results = _ResultsQueue(self._results_lock)
 
     def _filter_notified_hosts(self, notified_hosts):
         """Filter notified hosts"""
@@ -100,6 +198,23 @@ class StrategyModule(BASE.TripleoBase):
             self._debug('resetting last host')
             self._last_host = 0
 
+    def _set_ready(self, host, first=False):
+        """Queue a host which may be able to advance"""
+        if host in self._ready_set:
+            return
+        self._ready_set.add(host)
+        if first:
+            self._ready_hosts.appendleft(host)
+        else:
+            self._ready_hosts.append(host)
+
+    def _wait_for_results(self, timeout):
+        """Wait for a result, return False if none came in time"""
+        with self._results_lock:
+            if not self._results:
+                self._results_lock.wait(timeout)
+            return bool(self._results)
+
     def _check_throttle(self, throttle, task):
         """Check if we should throttle"""
         if throttle > 0:
@@ -121,6 +236,7 @@ class StrategyModule(BASE.TripleoBase):
         function returns True if there were failures and False if
         there are no failures.
         """
+        self._update_result_failures(results)
         fail_lookup = self._get_current_failures()
         if self._any_errors_fatal:
             for res in results:
@@ -135,9 +251,7 @@ class StrategyModule(BASE.TripleoBase):
         self._debug('_send_task_callback...')
         name = task.name
         try:
-            task.name = to_text(templar.template(task.name,
-                                                 fail_on_undefined=False),
-                                nonstring='empty')
+            task.name = self._template_name(task, templar)
         except Exception:
             self._debug('templating failed')
         self._tqm.send_callback('v2_playbook_on_task_start',
@@ -145,6 +259,20 @@ class StrategyModule(BASE.TripleoBase):
                                 is_conditional=False)
         task.name = name
 
+    def _template_name(self, task, templar):
+        return self._template_cache.template(
+            task, 'name', templar,
+            lambda name: to_text(name, nonstring='empty'),
+            fail_on_undefined=False)
+
+    def _get_task_errors_fatal(self, task, templar):
+        """Return parsed any_errors_fatal from a task"""
+        return self._template_cache.template(
+            task, 'any_errors_fatal', templar,
+            lambda value: task.get_validated_value(
+                'any_errors_fatal', task._valid_attrs['any_errors_fatal'],
+                value, None))
+
     def _advance_host(self, host, task):
         """Advance the host's task as necessary"""
         self._debug('_advance_host {}'.format(host))
@@ -160,39 +288,45 @@ class StrategyModule(BASE.TripleoBase):
         if self._has_hosts_cache_all:
             vars_params['_hosts_all'] = self._hosts_cache_all
 
-        task_vars = self._variable_manager.get_vars(**vars_params)
-        templar = Templar(loader=self._loader, variables=task_vars)
-
-        # if task has a throttle attribute, check throttle e.g. ansible > 2.9
-        throttle = getattr(task, 'throttle', None)
-        if throttle is not None:
-            try:
-                throttle = int(templar.template(throttle))
-            except Exception as e:
-                raise AnsibleError("Failed to throttle: {}".format(e),
-                                   obj=task._df,
-                                   orig_exc=e)
-            if self._check_throttle(throttle, task):
-                raise TripleoFreeBreak()
+        with self._profiler.phase('templating', host, task):
+            task_vars = self._variable_manager.get_vars(**vars_params)
+            # the attributes of the task are seldom templates
+            templar = _LazyTemplar(self._loader, task_vars)
+
+            # if task has a throttle attribute, check throttle
+            # e.g. ansible > 2.9
+            throttle = getattr(task, 'throttle', None)
+            if throttle is not None:
+                try:
+                    throttle = self._template_cache.template(
+                        task, 'throttle', templar, int)
+                except Exception as e:
+                    raise AnsibleError("Failed to throttle: {}".format(e),
+                                       obj=task._df,
+                                       orig_exc=e)
+        if throttle is not None and self._check_throttle(throttle, task):
+            raise TripleoFreeBreak()
 
         # _blocked_hosts is used in the base strategy to keep track of hosts in
         # that have tasks in queue
         self._blocked_hosts[host_name] = True
 
         # Refetch the task without peek
-        (_, task) = self._iterator.get_next_task_for_host(host)
+        with self._profiler.phase('iterator', host, task):
+            (_, task) = self._iterator.get_next_task_for_host(host)
         action = self._get_action(task)
 
-        try:
-            task.name = to_text(templar.template(task.name,
-                                                 fail_on_undefined=False),
-                                nonstring='empty')
-        except Exception:
-            display.warning('templating of task name failed', host=host_name)
+        with self._profiler.phase('templating', host, task):
+            try:
+                task.name = self._template_name(task, templar)
+            except Exception:
+                display.warning('templating of task name failed',
+                                host=host_name)
 
-        # run once doesn't work with free because we run all of them
-        run_once = (templar.template(task.run_once) or action
-                    and getattr(action, 'BYPASS_HOST_LOOP', False))
+            # run once doesn't work with free because we run all of them
+            run_once = (self._template_cache.template(
+                task, 'run_once', templar) or action
+                and getattr(action, 'BYPASS_HOST_LOOP', False))
 
         if run_once:
             display.warning('tripleo_free run_once does not ensure a task '
@@ -231,7 +365,9 @@ class StrategyModule(BASE.TripleoBase):
                                     'with the tripleo_free strategy.')
                     self._any_errors_fatal = True
                 self._send_task_callback(task, templar)
-                self._queue_task(host, task, task_vars, self._play_context)
+                with self._profiler.phase('queue', host, task):
+                    self._queue_task(host, task, task_vars,
+                                     self._play_context)
                 self._workers_free -= 1
                 del task_vars
         return True
@@ -249,7 +385,9 @@ class StrategyModule(BASE.TripleoBase):
 
             self._increment_last_host()
 
-            (s, t) = self._iterator.get_next_task_for_host(host, peek=True)
+            with self._profiler.phase('iterator', host):
+                (s, t) = self._iterator.get_next_task_for_host(host,
+                                                               peek=True)
             self._print("host: {}, task: {}".format(host, t))
 
             if host_name not in self._tqm._unreachable_hosts and t:
@@ -278,8 +416,14 @@ class StrategyModule(BASE.TripleoBase):
                 self._debug('We hit the start host, break our loop')
                 break
 
+        return result | self._process_results()
+
+    def _process_results(self):
+        """Process the pending results of the workers"""
+        result = self._tqm.RUN_OK
         self._debug('pending results....')
-        results = self._process_pending_results(self._iterator)
+        with self._profiler.phase('results'):
+            results = self._process_pending_results(self._iterator)
         self._debug('results: {}'.format(results))
         self._strat_results.extend(results)
 
@@ -289,11 +433,69 @@ class StrategyModule(BASE.TripleoBase):
             result |= self._tqm.RUN_FAILED_BREAK_PLAY
 
         self._workers_free += len(results)
+        if self._event_driven:
+            # pinned hosts get the next free workers
+            for res in results:
+                self._set_ready(res._host, first=self._host_pinned)
         self._debug('update connections....')
         self.update_active_connections(results)
 
         return result
 
+    def process_events(self):
+        """Run the tasks of the hosts ready to advance
+
+        Unlike process_work, only the hosts which got a result are looked
+        at, and when none of them can advance we wait for the results of
+        the workers instead of polling.
+        """
+        self._debug('process_events....')
+        self._strat_results = []
+        hosts_left = set(self._hosts_left)
+        while self._ready_hosts and self._workers_free > 0:
+            host = self._ready_hosts.popleft()
+            self._ready_set.discard(host)
+            host_name = host.get_name()
+            if host not in hosts_left:
+                continue
+
+            with self._profiler.phase('iterator', host):
+                (s, t) = self._iterator.get_next_task_for_host(host,
+                                                               peek=True)
+            self._print("host: {}, task: {}".format(host, t))
+            if host_name in self._tqm._unreachable_hosts or not t:
+                self._debug('{} is unreachable or no task'.format(host_name))
+                continue
+            self._has_work = True
+            if self._blocked_hosts.get(host_name, False):
+                # it will be ready again with its result
+                self._print('{} still blocked'.format(host_name))
+                continue
+
+            try:
+                self._advance_host(host, t)
+            except TripleoFreeBreak:
+                self._set_ready(host, first=True)
+                break
+            except TripleoFreeContinue:
+                self._set_ready(host)
+                continue
+            if not self._blocked_hosts.get(host_name, False):
+                # meta tasks are run right away
+                self._set_ready(host)
+
+        if self._pending_results > 0:
+            self._has_work = True
+            if not (self._ready_hosts and self._workers_free > 0):
+                with self._profiler.phase('wait'):
+                    if not self._wait_for_results(EVENT_TIMEOUT):
+                        # look again at all the hosts in case one was
+                        # unblocked by something else than a result
+                        for host in self._hosts_left:
+                            self._set_ready(host)
+
+        return self._process_results()
+
     def run(self, iterator, play_context):
         """Run out strategy"""
         self._iterator = iterator
@@ -310,6 +512,13 @@ class StrategyModule(BASE.TripleoBase):
         if getattr(self, '_set_hosts_cache_all', False):
             self._has_hosts_cache_all = True
 
+        # the hosts left are only known once the hosts cache is set
+        if self._event_driven:
+            self._ready_hosts.clear()
+            self._ready_set.clear()
+            for host in self.get_hosts_left(self._iterator):
+                self._set_ready(host)
+
         # while we still have tasks and ansible is still running
         while self._has_work and not self._tqm._terminated:
             self._has_work = False
@@ -328,7 +537,10 @@ class StrategyModule(BASE.TripleoBase):
                         result = False
                     break
                 # do work
-                result |= self.process_work()
+                if self._event_driven:
+                    result |= self.process_events()
+                else:
+                    result |= self.process_work()
                 # handle includes
                 include_result = self.process_includes(self._strat_results)
                 if self._any_errors_fatal and not include_result:
@@ -343,13 +555,19 @@ class StrategyModule(BASE.TripleoBase):
                               "{}".format(e))
                 return self._tqm.RUN_UNKNOWN_ERROR
 
+            if self._event_driven:
+                # process_events waits for the results
+                continue
             self._debug('sleeping... {}'.format(
                 C.DEFAULT_INTERNAL_POLL_INTERVAL)
             )
-            time.sleep(C.DEFAULT_INTERNAL_POLL_INTERVAL)
+            with self._profiler.phase('sleep'):
+                time.sleep(C.DEFAULT_INTERNAL_POLL_INTERVAL)
 
         # wait for any pending results
-        _ = self._wait_on_pending_results(iterator)
+        with self._profiler.phase('results'):
+            _ = self._wait_on_pending_results(iterator)
+        self._profiler.dump(self._iterator._play)
 
         # call parent run to handle status
         return super(StrategyModule, self).run(self._iterator,
@@ -20,7 +20,6 @@ import time
 from ansible import constants as C
 from ansible.errors import AnsibleAssertionError
 from ansible.executor.play_iterator import PlayIterator
-from ansible.module_utils.six import iteritems
 from ansible.playbook.block import Block
 from ansible.playbook.task import Task
 from ansible.template import Templar
@@ -73,6 +72,17 @@ class StrategyModule(BASE.TripleoBase):
 
     def __init__(self, *args, **kwargs):
         super(StrategyModule, self).__init__(*args, **kwargs)
+        # next task of the hosts, peeked from _index_iterator
+        self._index_iterator = None
+        self._host_tasks = {}
+        # (cur_block, run_state) of the hosts with a task and the names of
+        # the hosts by (cur_block, run_state)
+        self._host_keys = {}
+        self._host_buckets = {}
+        # hosts to peek again, their state changed since the last wave
+        self._changed_hosts = set()
+        self._host_order = {}
+        self._hosts_by_name = {}
 
     def _create_noop_task(self):
         """Create noop task"""
@@ -83,86 +93,102 @@ class StrategyModule(BASE.TripleoBase):
         noop_task.set_loader(self._iterator._play._loader)
         return noop_task
 
-    def _advance_hosts(self, hosts, host_tasks, cur_block, cur_state):
+    def _reset_host_index(self):
+        """Peek the next task of all the hosts again on the next wave"""
+        self._index_iterator = None
+
+    def _unindex_host(self, name):
+        """Remove a host from its bucket"""
+        key = self._host_keys.pop(name, None)
+        if key is not None:
+            bucket = self._host_buckets[key]
+            bucket.discard(name)
+            if not bucket:
+                del self._host_buckets[key]
+
+    def _index_host(self, host):
+        """Peek the next task of a host and file it in its bucket"""
+        self._unindex_host(host.name)
+        with self._profiler.phase('iterator', host):
+            state_task = self._iterator.get_next_task_for_host(host,
+                                                               peek=True)
+        self._host_tasks[host.name] = state_task
+        if state_task and state_task[1]:
+            s = self._iterator.get_active_state(state_task[0])
+            key = (s.cur_block, s.run_state)
+            self._host_keys[host.name] = key
+            self._host_buckets.setdefault(key, set()).add(host.name)
+
+    def _update_host_index(self, hosts):
+        """Peek the next task of the hosts whose state changed"""
+        self._debug('_update_host_index...')
+        if self._index_iterator is not self._iterator:
+            self._index_iterator = self._iterator
+            self._host_tasks = {}
+            self._host_keys = {}
+            self._host_buckets = {}
+            self._host_order = {}
+            self._changed_hosts = set()
+        # hosts only leave once unreachable, after returning a result
+        if len(hosts) != len(self._host_order):
+            self._host_order = dict((host.name, i)
+                                    for i, host in enumerate(hosts))
+            self._hosts_by_name = dict((host.name, host) for host in hosts)
+            for name in list(self._host_tasks):
+                if name not in self._host_order:
+                    del self._host_tasks[name]
+                    self._unindex_host(name)
+            self._changed_hosts.update(
+                host for host in hosts if host.name not in self._host_tasks)
+
+        for host in self._changed_hosts:
+            if host.name in self._host_order:
+                self._index_host(host)
+        self._changed_hosts = set()
+
+    def _advance_hosts(self, cur_block, cur_state):
         """Move hosts to next task"""
         self._debug('_advance_hosts...')
-        noop_task = self._create_noop_task()
         returns = []
-        for host in hosts:
-            host_state_task = host_tasks.get(host.name)
-            if host_state_task is None:
-                continue
-            (s, t) = host_state_task
+        names = sorted(self._host_buckets[(cur_block, cur_state)],
+                       key=self._host_order.get)
+        for name in names:
+            host = self._hosts_by_name[name]
+            (s, t) = self._host_tasks[name]
             self._print('task: {}'.format(t))
-            s = self._iterator.get_active_state(s)
-            if t is None:
-                continue
             self._print('task.action: {}'.format(t.action))
-            if s.run_state == cur_state and s.cur_block == cur_block:
+            with self._profiler.phase('iterator', host, t):
                 _ = self._iterator.get_next_task_for_host(host)
-                returns.append((host, t))
-            else:
-                returns.append((host, noop_task))
+            self._changed_hosts.add(host)
+            returns.append((host, t))
         return returns
 
     def _get_next_tasks(self, hosts):
-        """Get next set of tasks"""
-        self._debug('_get_next_tasks...')
-        host_tasks = {}
-        task_counts = {}
-
-        self._debug('populate next tasks for all hosts')
-        for host in hosts:
-            host_tasks[host.name] = self._iterator.get_next_task_for_host(
-                host, peek=True)
+        """Get next set of tasks
 
-        self._debug('organize tasks by state')
-        host_tasks_to_run = [(host, state_task)
-                             for host, state_task in iteritems(host_tasks)
-                             if state_task and state_task[1]]
+        The next task of the hosts is kept in an index by block and run
+        state, only the hosts which were advanced since the last wave are
+        peeked again.
+        """
+        self._debug('_get_next_tasks...')
+        self._update_host_index(hosts)
 
         # figure out our current block
-        if host_tasks_to_run:
-            try:
-                lowest_cur_block = min(
-                    (self._iterator.get_active_state(s).cur_block
-                     for h, (s, t) in host_tasks_to_run
-                     if s.run_state != PlayIterator.ITERATING_COMPLETE))
-            except ValueError:
-                lowest_cur_block = None
-        else:
-            lowest_cur_block = None
-
-        # build counts for tasks by run state
-        for (k, v) in host_tasks_to_run:
-            (s, t) = v
-            s = self._iterator.get_active_state(s)
-            if s.cur_block > lowest_cur_block:
-                continue
-
-            # count up tasks based on state, we only care about:
-            # PlayIterator.ITERATING_SETUP
-            # PlayIterator.ITERATING_TASKS
-            # PlayIterator.ITERATING_RESCUE
-            # PlayIterator.ITERATING_ALWAYS
-            if not task_counts.get(s.run_state):
-                task_counts[s.run_state] = 1
-            else:
-                task_counts[s.run_state] += 1
-
-        # Iterate through the different task states we care about
-        # to execute them in a specific order. If there are tasks
-        # in that state, we run all those tasks and then noop the
-        # rest of the hosts with tasks not currently in that state
-        for state_type in [PlayIterator.ITERATING_SETUP,
-                           PlayIterator.ITERATING_TASKS,
-                           PlayIterator.ITERATING_RESCUE,
-                           PlayIterator.ITERATING_ALWAYS]:
-            if state_type in task_counts:
-                return self._advance_hosts(hosts,
-                                           host_tasks,
-                                           lowest_cur_block,
-                                           state_type)
+        blocks = [cur_block for (cur_block, run_state) in self._host_buckets
+                  if run_state != PlayIterator.ITERATING_COMPLETE]
+        if blocks:
+            lowest_cur_block = min(blocks)
+
+            # Iterate through the different task states we care about
+            # to execute them in a specific order. If there are tasks
+            # in that state, we run all those tasks, the rest of the
+            # hosts wait for the next wave.
+            for state_type in [PlayIterator.ITERATING_SETUP,
+                               PlayIterator.ITERATING_TASKS,
+                               PlayIterator.ITERATING_RESCUE,
+                               PlayIterator.ITERATING_ALWAYS]:
+                if (lowest_cur_block, state_type) in self._host_buckets:
+                    return self._advance_hosts(lowest_cur_block, state_type)
 
         # all done so move on by returning None for the next task in
         # the return value.
@@ -225,19 +251,22 @@ class StrategyModule(BASE.TripleoBase):
         if self._has_hosts_cache_all:
             vars_params['_hosts_all'] = self._hosts_cache_all
 
-        task_vars = self._variable_manager.get_vars(**vars_params)
+        with self._profiler.phase('templating', host, task):
+            task_vars = self._variable_manager.get_vars(**vars_params)
 
-        self.add_tqm_variables(task_vars, play=self._iterator._play)
-        templar = Templar(loader=self._loader, variables=task_vars)
+            self.add_tqm_variables(task_vars, play=self._iterator._play)
+            templar = Templar(loader=self._loader, variables=task_vars)
 
-        run_once = (templar.template(task.run_once) or action
-                    and getattr(action, 'BYPASS_HOST_LOOP', False))
+            run_once = (templar.template(task.run_once) or action
+                        and getattr(action, 'BYPASS_HOST_LOOP', False))
 
         if task.action == 'meta':
             results.extend(self._execute_meta(task,
                                               self._play_context,
                                               self._iterator,
                                               host))
+            # meta tasks may change the state of any host
+            self._reset_host_index()
             if (task.args.get('_raw_params', None) not in ('noop',
                                                            'reset_connection',
                                                            'end_host')):
@@ -248,15 +277,17 @@ class StrategyModule(BASE.TripleoBase):
         else:
             self._send_task_callback(task, templar)
             self._blocked_hosts[host.get_name()] = True
-            self._queue_task(host, task, task_vars, self._play_context)
+            with self._profiler.phase('queue', host, task):
+                self._queue_task(host, task, task_vars, self._play_context)
             del task_vars
 
         if run_once:
             raise TripleoLinearRunOnce()
 
         max_passes = max(1, int(len(self._tqm._workers) * 0.1))
-        results.extend(self._process_pending_results(
-            self._iterator, max_passes=max_passes))
+        with self._profiler.phase('results'):
+            results.extend(self._process_pending_results(
+                self._iterator, max_passes=max_passes))
         return results
 
     def _process_failures(self):
@@ -295,10 +326,14 @@ class StrategyModule(BASE.TripleoBase):
             except (TripleoLinearTerminated, TripleoLinearRunOnce):
                 break
         if self._pending_results > 0:
-            results.extend(self._wait_on_pending_results(
-                self._iterator))
+            with self._profiler.phase('results'):
+                results.extend(self._wait_on_pending_results(
+                    self._iterator))
 
         self._strat_results.extend(results)
+        if self._run_once_failed(results):
+            # the hosts waiting in other buckets changed state too
+            self._reset_host_index()
         self.update_active_connections(results)
 
         return result
@@ -334,6 +369,7 @@ class StrategyModule(BASE.TripleoBase):
 
                 failed_hosts = []
                 unreachable_hosts = []
+                self._update_result_failures(self._strat_results)
                 fail_lookup = self._get_current_failures()
                 for res in self._strat_results:
                     if ((res.is_failed() or res._task.action == 'meta')
@@ -358,6 +394,7 @@ class StrategyModule(BASE.TripleoBase):
                         and (failed_hosts >= hosts_left)):
                     self._tqm.send_callback(
                         'v2_playbook_on_no_hosts_remaining')
+                    self._profiler.dump(iterator._play)
                     return result
             except (IOError, EOFError) as e:
                 display.warning("Exception while in task loop: {}".format(e))
@@ -366,6 +403,8 @@ class StrategyModule(BASE.TripleoBase):
             self._debug('sleeping... {}'.format(
                 C.DEFAULT_INTERNAL_POLL_INTERVAL)
             )
-            time.sleep(C.DEFAULT_INTERNAL_POLL_INTERVAL)
+            with self._profiler.phase('sleep'):
+                time.sleep(C.DEFAULT_INTERNAL_POLL_INTERVAL)
 
+        self._profiler.dump(iterator._play)
         return super(StrategyModule, self).run(iterator, play_context, result)
@@ -13,6 +13,12 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+
 from ansible.plugins import loader
 
 from oslotest import base
@@ -33,3 +39,41 @@ def load_module_utils(*args):
 
 class TestCase(base.BaseTestCase):
     """Test case base class for all unit tests."""
+
+
+class PlaybookTestCase(TestCase):
+    """Test case base class running playbooks with the tripleo plugins."""
+
+    def setUp(self):
+        super(PlaybookTestCase, self).setUp()
+        self.playbook = shutil.which('ansible-playbook')
+        if not self.playbook:
+            self.skipTest('ansible-playbook is not installed')
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+    def write_file(self, path, content):
+        path = os.path.join(self.tmp_dir, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def run_playbook(self, play, hosts, env=None):
+        """Run a playbook on local hosts and return its stats by host"""
+        plugins = os.path.join(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__))), 'ansible_plugins')
+        play_env = dict(os.environ)
+        play_env.update({
+            'ANSIBLE_STRATEGY_PLUGINS': os.path.join(plugins, 'strategy'),
+            'ANSIBLE_STDOUT_CALLBACK': 'json',
+            'ANSIBLE_LOCAL_TEMP': self.tmp_dir,
+            'ANSIBLE_NOCOLOR': '1',
+        })
+        play_env.update(env or {})
+        out = subprocess.check_output(
+            [self.playbook, '-i', ','.join(hosts) + ',', '-c', 'local',
+             self.write_file('play.yml', play)],
+            env=play_env, cwd=self.tmp_dir)
+        return json.loads(out)['stats']
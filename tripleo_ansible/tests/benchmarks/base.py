@@ -0,0 +1,43 @@
+# Copyright 2020 Red Hat, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Helpers shared by the benchmark scripts.
+
+The benchmarks are not collected by the unit tests runner, they are meant to
+be run by hand, e.g.::
+
+    python -m tripleo_ansible.tests.benchmarks.bench_tripleo_all_nodes_data
+"""
+
+import time
+
+
+def best_of(func, repeat=3):
+    """Return the best wall time, in seconds, of ``repeat`` calls of func"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def print_table(headers, rows):
+    widths = [max(len(str(v)) for v in column)
+              for column in zip(headers, *rows)]
+    line = '  '.join('{:>%d}' % w for w in widths)
+    print(line.format(*headers))
+    for row in rows:
+        print(line.format(*row))
@@ -0,0 +1,112 @@
+# Copyright 2021 Red Hat, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Load time of a step directory by ConfigLoader, with per file caches.
+
+The configs are written like the THT startup configs, one indented JSON file
+per container. The cached modes keep a sidecar per config file, keyed by the
+mtime, size and inode of the file, in JSON or pickle; their timings are the
+ones of a warm cache, every file being unchanged since the previous run.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+
+from tripleo_ansible.ansible_plugins.module_utils import container_configs
+from tripleo_ansible.tests.benchmarks import base
+from tripleo_ansible.tests.benchmarks import bench_tripleo_container_manage
+
+
+class SidecarLoader(container_configs.ConfigLoader):
+    """Keep the parsed config of every file in a sidecar file"""
+
+    dumps = staticmethod(json.dumps)
+    loads = staticmethod(json.loads)
+    mode = ''
+
+    def __init__(self, config_dir, cache_dir):
+        super(SidecarLoader, self).__init__(config_dir)
+        self.cache_dir = cache_dir
+
+    def load(self, path):
+        stat = os.stat(path)
+        key = [stat.st_mtime_ns, stat.st_size, stat.st_ino]
+        sidecar = os.path.join(self.cache_dir, hashlib.sha1(
+            path.encode('utf-8')).hexdigest())
+        try:
+            with open(sidecar, 'r' + self.mode) as f:
+                entry = self.loads(f.read())
+            if entry['key'] == key:
+                return entry['config']
+        except (IOError, OSError, ValueError):
+            pass
+        config = super(SidecarLoader, self).load(path)
+        with open(sidecar, 'w' + self.mode) as f:
+            f.write(self.dumps({'key': key, 'config': config}))
+        return config
+
+
+class PickleSidecarLoader(SidecarLoader):
+
+    dumps = staticmethod(pickle.dumps)
+    loads = staticmethod(pickle.loads)
+    mode = 'b'
+
+
+def build(count):
+    config_dir = tempfile.mkdtemp()
+    for i in range(count):
+        config = bench_tripleo_container_manage.fake_config(i)
+        path = os.path.join(config_dir, '{}.json'.format(config['name']))
+        with open(path, 'w') as f:
+            json.dump(config, f, indent=2)
+    return config_dir
+
+
+def main():
+    rows = []
+    for count in (50, 200, 1000):
+        config_dir = build(count)
+        cache_dir = tempfile.mkdtemp()
+        try:
+            loaders = (
+                ('parse', container_configs.ConfigLoader(config_dir)),
+                ('json sidecar', SidecarLoader(config_dir, cache_dir)),
+                ('pickle sidecar', PickleSidecarLoader(
+                    config_dir, os.path.join(cache_dir, 'pickle'))),
+            )
+            os.makedirs(os.path.join(cache_dir, 'pickle'))
+            for mode, loader in loaders:
+                # warm the sidecars
+                loader.get_configs()
+                timing = base.best_of(loader.get_configs, repeat=5)
+                loader.parsed = 0
+                loader.get_configs()
+                rows.append((count, mode, loader.parsed,
+                             '{:.4f}'.format(timing),
+                             '{:.1f}'.format(timing / count * 1e6)))
+        finally:
+            shutil.rmtree(config_dir)
+            shutil.rmtree(cache_dir)
+    base.print_table(('configs', 'mode', 'parsed', 'wall s', 'us/config'),
+                     rows)
+
+
+if __name__ == '__main__':
+    main()
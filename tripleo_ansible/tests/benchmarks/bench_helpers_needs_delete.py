@@ -0,0 +1,155 @@
+# Copyright 2021 Red Hat, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Run time of the needs_delete filter against podman_container_info data.
+
+The indexed and digest columns are what a task pays: the filter runs once per
+task, in a new worker process, so the memo of the parsed config_data labels
+starts empty. The warm memo column reuses the labels parsed by the previous
+runs of the same process, which only happens when a worker evaluates the
+filter several times.
+"""
+
+import ast
+import re
+
+from tripleo_ansible.ansible_plugins.filter import helpers
+from tripleo_ansible.ansible_plugins.module_utils import container_configs
+from tripleo_ansible.tests.benchmarks import base
+from tripleo_ansible.tests.benchmarks.bench_tripleo_container_manage import (
+    fake_config)
+
+CONFIG_ID = 'tripleo_step4'
+
+
+def fake_container_infos(count, digest=False):
+    """podman_container_info output, with a config change every 10"""
+    config = {}
+    container_infos = []
+    for i in range(count):
+        name = 'service_{}'.format(i)
+        config[name] = fake_config(i)
+        config_data = dict(config[name])
+        if i % 10 == 0:
+            config_data['environment'] = {'TRIPLEO_CONFIG_HASH': 'b' * 32}
+        labels = {
+            'config_id': CONFIG_ID,
+            'container_name': name,
+            'managed_by': 'tripleo_ansible',
+            'config_data': repr(config_data),
+        }
+        if digest:
+            labels['config_digest'] = container_configs.config_digest(
+                config_data)
+        container_infos.append({
+            'Id': '{:064x}'.format(i),
+            'Name': name,
+            'State': {'Status': 'running', 'Running': True},
+            'Config': {
+                'Hostname': 'overcloud-controller-0',
+                'Image': config_data['image'],
+                'Labels': labels,
+            },
+        })
+    return container_infos, config
+
+
+def legacy_needs_delete(container_infos, config, config_id,
+                        clean_orphans=False, check_config=True):
+    """What needs_delete did before"""
+    to_delete = []
+    to_skip = []
+    installed_containers = []
+    for c in container_infos:
+        c_name = c['Name']
+        installed_containers.append(c_name)
+        labels = c['Config'].get('Labels') or dict()
+        managed_by = labels.get('managed_by', 'unknown').lower()
+        if not labels:
+            to_skip += [c_name]
+            continue
+        elif not re.findall(r"(?=("+'|'.join(['tripleo', 'paunch'])+r"))",
+                            managed_by):
+            to_skip += [c_name]
+            continue
+        elif labels.get('config_id') != config_id:
+            to_skip += [c_name]
+            continue
+        elif 'config_data' not in labels and clean_orphans:
+            to_delete += [c_name]
+    for c_name, config_data in config.items():
+        if (c_name not in installed_containers or c_name in to_delete
+                or c_name in to_skip):
+            continue
+        c_datas = list()
+        for c in container_infos:
+            if c_name == c['Name']:
+                try:
+                    c_datas.append(c['Config']['Labels']['config_data'])
+                except KeyError:
+                    pass
+        for c_data in c_datas:
+            try:
+                c_data = ast.literal_eval(c_data)
+            except (ValueError, SyntaxError):
+                try:
+                    c_data = dict(c_data)
+                except ValueError:
+                    c_data = dict()
+            if helpers.cmp(c_data, config_data) != 0 and check_config:
+                to_delete += [c_name]
+    for c in installed_containers:
+        if c not in config.keys() and c not in to_skip and clean_orphans:
+            to_delete += [c]
+    return to_delete
+
+
+def main():
+    filters = helpers.FilterModule()
+    rows = []
+    for count in (100, 1000):
+        container_infos, config = fake_container_infos(count)
+        expected = legacy_needs_delete(container_infos, config, CONFIG_ID,
+                                       clean_orphans=True)
+        assert expected == filters.needs_delete(
+            container_infos, config, CONFIG_ID, clean_orphans=True)
+
+        def cold(infos=container_infos):
+            helpers._parse_config_data.cache_clear()
+            filters.needs_delete(infos, config, CONFIG_ID,
+                                 clean_orphans=True)
+
+        digest_infos, _ = fake_container_infos(count, digest=True)
+        assert expected == filters.needs_delete(
+            digest_infos, config, CONFIG_ID, clean_orphans=True)
+
+        rows.append((count,
+                     '{:.4f}'.format(base.best_of(
+                         lambda: legacy_needs_delete(
+                             container_infos, config, CONFIG_ID,
+                             clean_orphans=True))),
+                     '{:.4f}'.format(base.best_of(cold)),
+                     '{:.4f}'.format(base.best_of(
+                         lambda: filters.needs_delete(
+                             container_infos, config, CONFIG_ID,
+                             clean_orphans=True))),
+                     '{:.4f}'.format(base.best_of(
+                         lambda: cold(digest_infos)))))
+    base.print_table(('containers', 'legacy s', 'indexed s', 'warm memo s',
+                      'digest s'), rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+# Copyright 2020 Red Hat, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Run time of the all_nodes data computation against services and nodes"""
+
+import mock
+
+from tripleo_ansible.ansible_plugins.action import tripleo_all_nodes_data
+from tripleo_ansible.tests.benchmarks import base
+
+NETWORKS = ['ctlplane', 'internal_api', 'storage', 'storage_mgmt', 'tenant',
+            'external']
+ROLES = ['Controller', 'Compute', 'CephStorage']
+
+
+def fake_overcloud(nodes, services):
+    groups = dict((role, []) for role in ROLES)
+    hostvars = {}
+    for i in range(nodes):
+        role = ROLES[i % len(ROLES)]
+        host = '{}-{}'.format(role.lower(), i)
+        groups[role].append(host)
+        hostvars[host] = {'inventory_hostname': host}
+        for net_idx, network in enumerate(NETWORKS):
+            hostvars[host][network + '_ip'] = '10.{}.{}.{}'.format(
+                net_idx, i // 250, i % 250)
+            hostvars[host][network + '_hostname'] = '{}.{}.localdomain'.format(
+                host, network)
+
+    enabled_services = []
+    service_net_map = {}
+    for i in range(services):
+        service = 'service_{}'.format(i)
+        enabled_services.append(service)
+        groups[service] = list(groups[ROLES[i % len(ROLES)]])
+        service_net_map[service + '_network'] = NETWORKS[i % len(NETWORKS)]
+
+    task_vars = {
+        'service_net_map': service_net_map,
+        'nova_additional_cell': False,
+        'all_nodes_extra_map_data': {},
+        'net_vip_map': {},
+        'enabled_services': enabled_services,
+        'primary_role_name': 'Controller',
+        'deploy_identifier': '1234',
+        'container_cli': 'podman',
+    }
+    return groups, hostvars, task_vars
+
+
+def run(nodes, services):
+    groups, hostvars, task_vars = fake_overcloud(nodes, services)
+    task = mock.MagicMock()
+    var_manager = task.get_variable_manager.return_value
+    var_manager._inventory.get_groups_dict.return_value = groups
+    var_manager.get_vars.return_value = {'hostvars': hostvars}
+    action = tripleo_all_nodes_data.ActionModule(
+        task, None, None, None, None, None)
+
+    def compute():
+        vars = dict(task_vars,
+                    enabled_services=list(task_vars['enabled_services']))
+        action.compute_all_nodes({}, vars)
+
+    return base.best_of(compute)
+
+
+def main():
+    rows = []
+    for nodes in (10, 100, 300, 1000):
+        for services in (50, 250):
+            rows.append((nodes, services,
+                         '{:.4f}'.format(run(nodes, services))))
+    base.print_table(('nodes', 'services', 'seconds'), rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+# Copyright 2021 Red Hat, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Normalisation time of THT container configs to podman options"""
+
+from tripleo_ansible.ansible_plugins.modules import (
+    tripleo_container_manage as plugin)
+from tripleo_ansible.tests.benchmarks import base
+
+
+def fake_config(i):
+    name = 'service_{}'.format(i)
+    return {
+        'name': name,
+        'state': 'started',
+        'label': {'config_id': 'tripleo_step4', 'container_name': name,
+                  'managed_by': 'tripleo_ansible'},
+        'conmon_pidfile': '/run/{}.pid'.format(name),
+        'log_driver': 'k8s-file',
+        'log_opt': {'path': '/var/log/containers/stdouts/{}.log'.format(
+            name)},
+        'image': 'quay.io/tripleomaster/openstack-{}:current'.format(name),
+        'net': 'host',
+        'privileged': 'false',
+        'restart': 'always',
+        'user': 42,
+        'start_order': i % 4,
+        'stop_grace_period': '300',
+        'healthcheck': {'test': '/openstack/healthcheck'},
+        'check_interval': 60,
+        'environment': {'KOLLA_CONFIG_STRATEGY': 'COPY_ALWAYS',
+                        'TRIPLEO_CONFIG_HASH': 'a' * 32},
+        'volumes': ['/etc/hosts:/etc/hosts:ro',
+                    '/etc/localtime:/etc/localtime:ro',
+                    '/var/lib/kolla/config_files/{}.json:'
+                    '/var/lib/kolla/config_files/config.json:ro'.format(name),
+                    '/var/lib/config-data/puppet-generated/{}:'
+                    '/var/lib/kolla/config_files/src:ro'.format(name),
+                    '/var/log/containers/{}:/var/log/{}:z'.format(name, name)],
+    }
+
+
+def main():
+    rows = []
+    for count in (100, 300, 1000):
+        configs = [fake_config(i) for i in range(count)]
+
+        def normalize():
+            # built once per module run
+            normalizer = plugin.ContainerOptsNormalizer(
+                plugin.ARGUMENTS_SPEC_CONTAINER)
+            for config in configs:
+                normalizer.normalize(config)
+
+        seconds = base.best_of(normalize)
+        rows.append((count, '{:.4f}'.format(seconds),
+                     '{:.1f}'.format(seconds / count * 1e6)))
+    base.print_table(('configs', 'seconds', 'us/config'), rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+# Copyright 2021 Red Hat, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Task dispatch latency of tripleo_free, polling vs event driven.
+
+The workers are simulated by a thread finishing every task after a fixed
+delay, the latency is the time between a task result and the dispatch of
+the next task of the same host.
+"""
+
+import collections
+import heapq
+import threading
+import time
+
+from ansible import constants as C
+
+from tripleo_ansible.ansible_plugins.strategy import tripleo_free
+from tripleo_ansible.ansible_plugins.strategy.tripleo_base import (
+    StrategyProfiler)
+from tripleo_ansible.tests.benchmarks import base
+
+TASKS = 5
+TASK_TIME = 0.05
+
+
+class FakeHost(object):
+
+    def __init__(self, name):
+        self.name = name
+
+    def get_name(self):
+        return self.name
+
+
+class FakeTqm(object):
+    RUN_OK = 0
+    RUN_FAILED_BREAK_PLAY = 4
+    _unreachable_hosts = {}
+    _terminated = False
+
+
+class FakeIterator(object):
+
+    def __init__(self, hosts):
+        self.position = dict((host, 0) for host in hosts)
+
+    def get_next_task_for_host(self, host, peek=False):
+        position = self.position[host]
+        if position >= TASKS:
+            return (None, None)
+        if not peek:
+            self.position[host] += 1
+        return (None, 'task-{}'.format(position))
+
+
+class FakeResult(object):
+
+    def __init__(self, host):
+        self._host = host
+        self.done = time.perf_counter()
+
+
+class FakeWorkers(threading.Thread):
+    """Finish the queued tasks after TASK_TIME"""
+
+    def __init__(self, strategy):
+        super(FakeWorkers, self).__init__()
+        self.daemon = True
+        self.strategy = strategy
+        self.queue = []
+        self.lock = threading.Lock()
+        self.stopped = False
+
+    def submit(self, host):
+        with self.lock:
+            heapq.heappush(self.queue,
+                           (time.perf_counter() + TASK_TIME, id(host), host))
+
+    def run(self):
+        while not self.stopped:
+            now = time.perf_counter()
+            done = []
+            with self.lock:
+                while self.queue and self.queue[0][0] <= now:
+                    done.append(heapq.heappop(self.queue)[2])
+            for host in done:
+                with self.strategy._results_lock:
+                    self.strategy._results.append(FakeResult(host))
+            time.sleep(0.0005)
+
+
+class BenchStrategy(tripleo_free.StrategyModule):
+
+    def _advance_host(self, host, task):
+        self._blocked_hosts[host.get_name()] = True
+        self._iterator.get_next_task_for_host(host)
+        previous = self.finished.pop(host, None)
+        if previous is not None:
+            self.latencies.append(time.perf_counter() - previous)
+        self._pending_results += 1
+        self._workers_free -= 1
+        self.workers.submit(host)
+
+    def _process_pending_results(self, iterator):
+        results = []
+        with self._results_lock:
+            while self._results:
+                results.append(self._results.popleft())
+        for res in results:
+            self._blocked_hosts[res._host.get_name()] = False
+            self.finished[res._host] = res.done
+        self._pending_results -= len(results)
+        return results
+
+    def _check_failures(self, results):
+        return False
+
+    def update_active_connections(self, results):
+        pass
+
+
+def build(count, event_driven):
+    strategy = BenchStrategy.__new__(BenchStrategy)
+    hosts = [FakeHost('overcloud-{}'.format(i)) for i in range(count)]
+    strategy._tqm = FakeTqm()
+    strategy._iterator = FakeIterator(hosts)
+    strategy._hosts_left = hosts
+    strategy._last_host = 0
+    strategy._workers_free = count
+    strategy._host_pinned = False
+    strategy._blocked_hosts = {}
+    strategy._pending_results = 0
+    strategy._results_lock = threading.Condition(threading.Lock())
+    strategy._profiler = StrategyProfiler()
+    strategy._event_driven = event_driven
+    strategy._ready_hosts = collections.deque()
+    strategy._ready_set = set()
+    if event_driven:
+        strategy._results = tripleo_free._ResultsQueue(
+            strategy._results_lock)
+        for host in hosts:
+            strategy._set_ready(host)
+    else:
+        strategy._results = collections.deque()
+    strategy.finished = {}
+    strategy.latencies = []
+    strategy.workers = FakeWorkers(strategy)
+    return strategy
+
+
+def run(strategy):
+    """Same loop as StrategyModule.run"""
+    strategy.workers.start()
+    cpu = time.thread_time()
+    strategy._has_work = True
+    while strategy._has_work:
+        strategy._has_work = False
+        if strategy._event_driven:
+            strategy.process_events()
+        else:
+            strategy.process_work()
+            time.sleep(C.DEFAULT_INTERNAL_POLL_INTERVAL)
+    cpu = time.thread_time() - cpu
+    strategy.workers.stopped = True
+    return cpu
+
+
+def main():
+    rows = []
+    for count in (100, 500, 1000):
+        for mode in ('poll', 'event'):
+            strategy = build(count, mode == 'event')
+            cpu = run(strategy)
+            latencies = sorted(strategy.latencies)
+            rows.append((
+                count, mode,
+                '{:.2f}'.format(sum(latencies) / len(latencies) * 1000),
+                '{:.2f}'.format(
+                    latencies[int(len(latencies) * 0.95)] * 1000),
+                '{:.3f}'.format(cpu)))
+    base.print_table(('hosts', 'mode', 'mean ms', 'p95 ms', 'cpu s'), rows)
+
+
+if __name__ == '__main__':
+    main()
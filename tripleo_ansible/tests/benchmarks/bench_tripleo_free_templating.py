@@ -0,0 +1,111 @@
+# Copyright 2021 Red Hat, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Templating time of the task attributes in tripleo_free._advance_host
+
+Every host templates the name, throttle, run_once and any_errors_fatal of
+every task, one task in 20 has a templated name. Like _advance_host, the
+templated name is set on the task, which is shared by the hosts.
+"""
+
+import time
+
+from ansible.module_utils._text import to_text
+from ansible.parsing.dataloader import DataLoader
+from ansible.playbook.task import Task
+from ansible.template import Templar
+
+from tripleo_ansible.ansible_plugins.strategy import tripleo_free
+from tripleo_ansible.ansible_plugins.strategy.tripleo_base import (
+    StrategyProfiler)
+from tripleo_ansible.tests.benchmarks import base
+
+HOSTS = 500
+TASKS = 2000
+
+
+def fake_tasks(count):
+    tasks = []
+    for i in range(count):
+        if i % 20 == 0:
+            name = 'Run deployment step {{ step }}'
+        else:
+            name = 'Task {} of the deployment'.format(i)
+        tasks.append(Task.load({'name': name, 'debug': {'msg': 'ok'}},
+                               loader=DataLoader()))
+    return tasks
+
+
+def fake_task_vars(host):
+    task_vars = dict(('var_{}'.format(i), 'value_{}'.format(i))
+                     for i in range(200))
+    task_vars.update(inventory_hostname=host, step=1)
+    return task_vars
+
+
+def errors_fatal(task, value):
+    return task.get_validated_value(
+        'any_errors_fatal', task._valid_attrs['any_errors_fatal'], value,
+        None)
+
+
+def legacy(loader, tasks, task_vars):
+    """What _advance_host did before, for every host"""
+    for host_vars in task_vars:
+        for task in tasks:
+            templar = Templar(loader=loader, variables=host_vars)
+            int(templar.template(task.throttle))
+            task.name = to_text(templar.template(task.name,
+                                                 fail_on_undefined=False),
+                                nonstring='empty')
+            templar.template(task.run_once)
+            errors_fatal(task, templar.template(task.any_errors_fatal))
+
+
+def cached(loader, tasks, task_vars):
+    cache = tripleo_free.TaskTemplateCache(StrategyProfiler())
+    for host_vars in task_vars:
+        for task in tasks:
+            templar = tripleo_free._LazyTemplar(loader, host_vars)
+            cache.template(task, 'throttle', templar, int)
+            task.name = cache.template(
+                task, 'name', templar,
+                lambda name: to_text(name, nonstring='empty'),
+                fail_on_undefined=False)
+            cache.template(task, 'run_once', templar)
+            cache.template(task, 'any_errors_fatal', templar,
+                           lambda value: errors_fatal(task, value))
+    return cache
+
+
+def main():
+    loader = DataLoader()
+    task_vars = [fake_task_vars('overcloud-{}'.format(i))
+                 for i in range(HOSTS)]
+    rows = []
+    start = time.perf_counter()
+    legacy(loader, fake_tasks(TASKS), task_vars)
+    rows.append(('legacy', '{:.2f}'.format(time.perf_counter() - start),
+                 '-'))
+    start = time.perf_counter()
+    cache = cached(loader, fake_tasks(TASKS), task_vars)
+    rows.append(('cached', '{:.2f}'.format(time.perf_counter() - start),
+                 '{:.1%}'.format(cache.hits / (cache.hits + cache.misses))))
+    base.print_table(('{} hosts x {} tasks'.format(HOSTS, TASKS), 'seconds',
+                      'hit rate'), rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+# Copyright 2021 Red Hat, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Queue time of tripleo_rules, ipaddr filter vs cached classification"""
+
+import mock
+
+try:
+    from ansible_collections.ansible.utils.plugins.filter import ipaddr
+except ImportError:
+    from ansible_collections.ansible.netcommon.plugins.filter import ipaddr
+
+from tripleo_ansible.ansible_plugins.action import tripleo_iptables as plugin
+from tripleo_ansible.tests.benchmarks import base
+
+SOURCES = ('172.17.1.0/24', '172.17.3.0/24', '192.168.24.0/24',
+           'fd00:fd00:fd00:2000::/64', 'fd00:fd00:fd00:3000::/64', None)
+
+
+def fake_rules(count):
+    rules = []
+    for i in range(count):
+        rule = {'proto': 'tcp', 'dport': [1000 + i % 1000]}
+        source = SOURCES[i % len(SOURCES)]
+        if source:
+            rule['source'] = source
+        rules.append({'rule_name': '{} service {}'.format(100 + i, i),
+                      'rule': rule})
+    return rules
+
+
+def ipaddr_ip_versions(rule_data):
+    """What _check_rule_data did before, for every ip version"""
+    versions = set()
+    for ipversion in plugin.IP_VERSIONS:
+        for arg in ('source', 'destination'):
+            ip_data = rule_data.get(arg)
+            if ip_data and not ipaddr.ipaddr(
+                    value=ip_data, version=int(ipversion[-1]),
+                    query=ipversion, alias=ipversion):
+                break
+        else:
+            versions.add(ipversion)
+    return versions
+
+
+def main():
+    task = mock.MagicMock()
+    task.args = {'tripleo_rules': fake_rules(5000)}
+    action = plugin.ActionModule(
+        task, mock.MagicMock(), mock.MagicMock(), mock.MagicMock(),
+        mock.MagicMock(), mock.MagicMock())
+
+    def queue():
+        action.iptables_rules = list()
+        action.iptables_rules_by_version = plugin.collections.defaultdict(
+            list)
+        action.iptables_chains = list()
+        action.queue_rules()
+
+    rows = []
+    with mock.patch.object(plugin, 'rule_ip_versions', ipaddr_ip_versions):
+        seconds = base.best_of(queue)
+        expected = action.iptables_rules
+    rows.append(('ipaddr', '{:.4f}'.format(seconds)))
+
+    def cached_queue():
+        plugin._ADDRESS_VERSIONS.clear()
+        queue()
+
+    seconds = base.best_of(cached_queue)
+    assert expected == action.iptables_rules
+    rows.append(('cached', '{:.4f}'.format(seconds)))
+    base.print_table(('5000 rules', 'seconds'), rows)
+
+
+if __name__ == '__main__':
+    main()
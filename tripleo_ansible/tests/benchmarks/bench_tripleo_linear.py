@@ -0,0 +1,147 @@
+# Copyright 2021 Red Hat, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Task selection time of tripleo_linear, full peek vs host index.
+
+Every block has BLOCK_TASKS tasks, in the rescue scenario one host out of 20
+fails the first task of every block and runs RESCUE_TASKS rescue tasks while
+the others wait. The dispatched column counts the (host, task) pairs
+returned, noop tasks included.
+"""
+
+from ansible.executor.play_iterator import PlayIterator
+
+from tripleo_ansible.ansible_plugins.strategy import tripleo_linear
+from tripleo_ansible.ansible_plugins.strategy.tripleo_base import (
+    StrategyProfiler)
+from tripleo_ansible.tests.benchmarks import base
+from tripleo_ansible.tests.plugins.strategy.test_tripleo_linear import (
+    FakeHost, FakeIterator)
+
+BLOCKS = 10
+BLOCK_TASKS = 10
+RESCUE_TASKS = 20
+
+
+class LegacyStrategy(tripleo_linear.StrategyModule):
+    """Peek every host on every wave"""
+
+    def _create_noop_task(self):
+        return None
+
+    def _get_next_tasks(self, hosts):
+        host_tasks = {}
+        task_counts = {}
+        for host in hosts:
+            with self._profiler.phase('iterator', host):
+                host_tasks[host.name] = \
+                    self._iterator.get_next_task_for_host(host, peek=True)
+        host_tasks_to_run = [(host, state_task)
+                             for host, state_task in host_tasks.items()
+                             if state_task and state_task[1]]
+        try:
+            lowest_cur_block = min(
+                (self._iterator.get_active_state(s).cur_block
+                 for h, (s, t) in host_tasks_to_run
+                 if s.run_state != PlayIterator.ITERATING_COMPLETE))
+        except ValueError:
+            lowest_cur_block = None
+        for (k, (s, t)) in host_tasks_to_run:
+            s = self._iterator.get_active_state(s)
+            if s.cur_block > lowest_cur_block:
+                continue
+            task_counts[s.run_state] = task_counts.get(s.run_state, 0) + 1
+        for state_type in [PlayIterator.ITERATING_SETUP,
+                           PlayIterator.ITERATING_TASKS,
+                           PlayIterator.ITERATING_RESCUE,
+                           PlayIterator.ITERATING_ALWAYS]:
+            if state_type in task_counts:
+                return self._legacy_advance_hosts(
+                    hosts, host_tasks, lowest_cur_block, state_type)
+        return [(host, None) for host in hosts]
+
+    def _legacy_advance_hosts(self, hosts, host_tasks, cur_block, cur_state):
+        noop_task = self._create_noop_task()
+        returns = []
+        for host in hosts:
+            (s, t) = host_tasks[host.name]
+            self._print('task: {}'.format(t))
+            s = self._iterator.get_active_state(s)
+            if t is None:
+                continue
+            self._print('task.action: {}'.format(t.action))
+            if s.run_state == cur_state and s.cur_block == cur_block:
+                with self._profiler.phase('iterator', host, t):
+                    self._iterator.get_next_task_for_host(host)
+                returns.append((host, t))
+            else:
+                returns.append((host, noop_task))
+        return returns
+
+
+def fake_steps(count, rescue):
+    steps = {}
+    for i in range(count):
+        host_steps = []
+        for block in range(BLOCKS):
+            tasks = [(block, PlayIterator.ITERATING_TASKS, 'task')]
+            if rescue and i % 20 == 0:
+                tasks.extend([(block, PlayIterator.ITERATING_RESCUE,
+                               'rescue')] * RESCUE_TASKS)
+            tasks.extend([(block, PlayIterator.ITERATING_TASKS,
+                           'task')] * (BLOCK_TASKS - 1))
+            host_steps.extend(tasks)
+        steps['overcloud-{}'.format(i)] = host_steps
+    return steps
+
+
+def build(cls, count, rescue):
+    strategy = cls.__new__(cls)
+    strategy.__dict__.update(
+        _index_iterator=None, _host_tasks={}, _host_keys={},
+        _host_buckets={}, _changed_hosts=set(), _host_order={},
+        _hosts_by_name={}, _profiler=StrategyProfiler())
+    strategy._iterator = FakeIterator(fake_steps(count, rescue))
+    strategy.hosts = [FakeHost('overcloud-{}'.format(i))
+                      for i in range(count)]
+    return strategy
+
+
+def run(strategy):
+    dispatched = 0
+    while True:
+        wave = strategy._get_next_tasks(strategy.hosts)
+        if all(task is None for _, task in wave):
+            return dispatched
+        dispatched += len(wave)
+
+
+def main():
+    rows = []
+    for count in (100, 500, 2000):
+        for rescue in (False, True):
+            for name, cls in (('legacy', LegacyStrategy),
+                              ('index', tripleo_linear.StrategyModule)):
+                dispatched = run(build(cls, count, rescue))
+                timing = base.best_of(
+                    lambda: run(build(cls, count, rescue)))
+                rows.append((count, 'rescue' if rescue else 'lockstep', name,
+                             dispatched, '{:.3f}'.format(timing)))
+    base.print_table(('hosts', 'scenario', 'mode', 'dispatched', 'wall s'),
+                     rows)
+
+
+if __name__ == '__main__':
+    main()
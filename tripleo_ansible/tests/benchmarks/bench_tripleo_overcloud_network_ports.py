@@ -0,0 +1,142 @@
+# Copyright 2021 Red Hat, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Port lookups of tripleo_overcloud_network_ports, per instance vs bulk.
+
+Every instance has a ctlplane VIF port and a port on two isolated networks,
+all of them already provisioned. The fake connection filters on the tags like
+neutron does, the listed column counts the ports it returned.
+"""
+
+import mock
+
+from tripleo_ansible.ansible_plugins.modules import (
+    tripleo_overcloud_network_ports as plugin)
+from tripleo_ansible.tests.benchmarks import base
+from tripleo_ansible.tests import stubs
+
+STACK = 'overcloud'
+ROLE = 'Compute'
+NETWORKS = ('foo', 'bar')
+
+NET_MAPS = {
+    'by_name': {
+        'ctlplane': {'id': 'ctlplane_id', 'name_upper': 'ctlplane',
+                     'subnets': {'ctlplane-subnet': 'ctlplane_subnet_id'}},
+        'foo': {'id': 'foo_id', 'name_upper': 'Foo',
+                'subnets': {'foo_subnet': 'foo_subnet_id'}},
+        'bar': {'id': 'bar_id', 'name_upper': 'Bar',
+                'subnets': {'bar_subnet': 'bar_subnet_id'}},
+    },
+    'by_id': {'ctlplane_id': 'ctlplane', 'foo_id': 'foo', 'bar_id': 'bar'},
+    'cidr_prefix_map': {'ctlplane_subnet_id': '24', 'foo_subnet_id': '24',
+                        'bar_subnet_id': '24'},
+}
+
+
+class FakeNetwork(object):
+
+    def __init__(self, ports):
+        self._ports = ports
+        self.listed = 0
+
+    def ports(self, tags):
+        tags = set(tags)
+        for port in self._ports:
+            if tags.issubset(port.tags):
+                self.listed += 1
+                yield port
+
+    def delete_port(self, port_id):
+        pass
+
+
+class FakeConnection(object):
+
+    def __init__(self, ports):
+        self.network = FakeNetwork(ports)
+
+
+class LegacyIndex(object):
+    """Let every instance list its ports"""
+
+    def get(self, hostname, default=None):
+        return None
+
+
+def build(count):
+    instances = []
+    ports = []
+    for i in range(count):
+        hostname = 'overcloud-novacompute-{}'.format(i)
+        uuid = 'uuid-{}'.format(i)
+        instances.append({'hostname': hostname, 'networks': [
+            {'network': 'ctlplane', 'vif': True}] + [
+            {'network': net} for net in NETWORKS]})
+        tags = ['tripleo_stack_name={}'.format(STACK),
+                'tripleo_ironic_uuid={}'.format(uuid),
+                'tripleo_role={}'.format(ROLE)]
+        ports.append(stubs.FakeNeutronPort(
+            id='{}-ctlplane'.format(hostname), name=hostname,
+            dns_name=hostname, network_id='ctlplane_id',
+            fixed_ips=[{'ip_address': '192.168.24.1',
+                        'subnet_id': 'ctlplane_subnet_id'}],
+            tags=tags + ['tripleo_ironic_vif_port=true']))
+        for net in NETWORKS:
+            ports.append(stubs.FakeNeutronPort(
+                id='{}-{}'.format(hostname, net),
+                name='_'.join([hostname, NET_MAPS['by_name'][net]
+                               ['name_upper']]),
+                dns_name=hostname, network_id='{}_id'.format(net),
+                fixed_ips=[{'ip_address': '172.16.0.1',
+                            'subnet_id': '{}_subnet_id'.format(net)}],
+                tags=tags))
+    uuid_by_hostname = dict((inst['hostname'], 'uuid-{}'.format(i))
+                            for i, inst in enumerate(instances))
+    role_map = dict((inst['hostname'], ROLE) for inst in instances)
+    return instances, ports, uuid_by_hostname, role_map
+
+
+def run(mode, state, instances, ports, uuid_by_hostname, role_map):
+    conn = FakeConnection(ports)
+    result = {'changed': False, 'node_port_map': {}}
+    if mode == 'legacy':
+        index = mock.patch.object(plugin, 'get_ports_by_hostname',
+                                  return_value=LegacyIndex())
+    else:
+        index = mock.patch.object(plugin, 'get_ports_by_hostname',
+                                  wraps=plugin.get_ports_by_hostname)
+    with index:
+        plugin.manage_instances_ports(result, conn, STACK, instances, 8,
+                                      state, uuid_by_hostname, role_map,
+                                      NET_MAPS)
+    return conn.network.listed
+
+
+def main():
+    rows = []
+    for count in (500, 2000):
+        data = build(count)
+        for state in ('present', 'absent'):
+            for mode in ('legacy', 'bulk'):
+                listed = run(mode, state, *data)
+                timing = base.best_of(lambda: run(mode, state, *data))
+                rows.append((count, state, mode, listed,
+                             '{:.3f}'.format(timing)))
+    base.print_table(('nodes', 'state', 'mode', 'listed', 'wall s'), rows)
+
+
+if __name__ == '__main__':
+    main()
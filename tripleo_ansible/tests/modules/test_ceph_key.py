@@ -0,0 +1,141 @@
+# Copyright 2021 Red Hat, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import json
+import os
+import shutil
+import tempfile
+
+import mock
+import yaml
+
+from tripleo_ansible.ansible_plugins.modules import ceph_key
+from tripleo_ansible.tests import base as tests_base
+
+SECRET = 'AQAin8tUUK84ExAA/QgBtI7gEMWdmnvKBzlXdQ=='
+AUTH_DUMP = {'auth_dump': [
+    {'entity': 'client.openstack', 'key': SECRET,
+     'caps': {'mon': 'profile rbd', 'osd': 'profile rbd pool=vms'}},
+    {'entity': 'client.manila', 'key': SECRET,
+     'caps': {'mon': 'allow r'}},
+]}
+
+
+class TestCephKey(tests_base.TestCase):
+
+    def setUp(self):
+        super(TestCephKey, self).setUp()
+        self.dest = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dest)
+        self.module = mock.MagicMock()
+        options = yaml.safe_load(ceph_key.DOCUMENTATION)['options']
+        self.module.params = dict((k, v.get('default'))
+                                  for k, v in options.items())
+        self.module.params.update(dest=self.dest, mode='0600')
+        self.module.load_file_common_arguments.side_effect = (
+            lambda params: {})
+        self.module.set_fs_attributes_if_different.side_effect = (
+            lambda file_args, changed: changed)
+        self.module.atomic_move.side_effect = os.rename
+        self.user_key_path = os.path.join(self.dest,
+                                          'ceph.client.admin.keyring')
+
+    def _path(self, name):
+        return os.path.join(self.dest, 'ceph.{}.keyring'.format(name))
+
+    def test_parse_keyring(self):
+        content = ceph_key.generate_keyring(
+            'client.openstack', SECRET,
+            {'osd': 'profile rbd pool=vms', 'mon': 'profile rbd', '': 'x'})
+        self.assertEqual('[client.openstack]\n'
+                         '\tkey = {}\n'
+                         '\tcaps mon = "profile rbd"\n'
+                         '\tcaps osd = "profile rbd pool=vms"\n'.format(SECRET),
+                         content)
+        self.assertEqual(
+            {'client.openstack': AUTH_DUMP['auth_dump'][0]['caps']},
+            dict((k, v['caps'])
+                 for k, v in ceph_key.parse_keyring(content).items()))
+
+    @mock.patch.object(ceph_key, 'exec_command')
+    def test_manage_keys(self, mock_exec):
+        imported = []
+
+        def exec_command(module, cmd):
+            if 'import' in cmd:
+                with open(cmd[-1]) as f:
+                    imported.append(f.read())
+                return 0, cmd, '', ''
+            return 0, cmd, json.dumps(AUTH_DUMP), ''
+
+        mock_exec.side_effect = exec_command
+        # up to date
+        with open(self._path('client.openstack'), 'w') as f:
+            f.write(ceph_key.generate_keyring(
+                'client.openstack', SECRET,
+                AUTH_DUMP['auth_dump'][0]['caps']))
+        self.module.params['keys'] = [
+            {'name': 'client.openstack', 'key': '',
+             'caps': {'mon': 'profile rbd', 'osd': 'profile rbd pool=vms'}},
+            # caps changed
+            {'name': 'client.manila', 'caps': {'mon': 'allow rw'},
+             'mode': '0640'},
+            # new key
+            {'name': 'client.radosgw', 'key': SECRET,
+             'caps': {'mon': 'allow rw'}},
+        ]
+        rc, cmd, out, err, changed, results = ceph_key.manage_keys(
+            self.module, 'ceph', 'client.admin', self.user_key_path)
+
+        self.assertEqual(0, rc)
+        self.assertTrue(changed)
+        self.assertEqual(
+            [('client.openstack', False, False),
+             ('client.manila', True, True),
+             ('client.radosgw', True, True)],
+            [(r['name'], r['imported'], r['written']) for r in results])
+        # one listing and one import of both keys
+        self.assertEqual(2, mock_exec.call_count)
+        self.assertEqual(
+            ['client.manila', 'client.radosgw'],
+            sorted(ceph_key.parse_keyring(imported[0])))
+        with open(self._path('client.manila')) as f:
+            self.assertEqual({'mon': 'allow rw'},
+                             ceph_key.parse_keyring(f.read())
+                             ['client.manila']['caps'])
+        self.assertEqual(['0600', '0640', '0600'], [
+            c[0][0]['mode'] for c in
+            self.module.set_fs_attributes_if_different.call_args_list])
+        # the import keyring was removed
+        self.assertEqual(sorted(['ceph.client.openstack.keyring',
+                                 'ceph.client.manila.keyring',
+                                 'ceph.client.radosgw.keyring']),
+                         sorted(os.listdir(self.dest)))
+
+    @mock.patch.object(ceph_key, 'exec_command')
+    def test_manage_keys_without_import(self, mock_exec):
+        with open(self._path('client.openstack'), 'w') as f:
+            f.write(ceph_key.generate_keyring(
+                'client.openstack', SECRET, {'mon': 'profile rbd'}))
+        self.module.params.update(import_key=False, keys=[
+            {'name': 'client.openstack', 'caps': {'mon': 'profile rbd'}}])
+        rc, cmd, out, err, changed, results = ceph_key.manage_keys(
+            self.module, 'ceph', 'client.admin', self.user_key_path)
+
+        # the secret of the keyring is kept
+        self.assertFalse(changed)
+        self.assertEqual([{'name': 'client.openstack', 'imported': False,
+                           'written': False, 'changed': False}], results)
+        mock_exec.assert_not_called()
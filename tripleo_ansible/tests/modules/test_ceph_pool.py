@@ -0,0 +1,104 @@
+# Copyright 2021 Red Hat, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import json
+
+import mock
+import yaml
+
+from tripleo_ansible.ansible_plugins.modules import ceph_pool
+from tripleo_ansible.tests import base as tests_base
+
+POOLS_DETAIL = [
+    {'pool_name': 'vms', 'pg_num': 32, 'pg_placement_num': 32, 'size': 3,
+     'pg_autoscale_mode': 'on', 'erasure_code_profile': '',
+     'options': {}, 'application_metadata': {'rbd': {}}},
+    {'pool_name': 'volumes', 'pg_num': 32, 'pg_placement_num': 32,
+     'size': 2, 'pg_autoscale_mode': 'on', 'erasure_code_profile': '',
+     'options': {'target_size_ratio': 0.2},
+     'application_metadata': {}},
+    {'pool_name': 'old', 'pg_num': 8, 'pg_placement_num': 8, 'size': 3,
+     'pg_autoscale_mode': 'on', 'erasure_code_profile': '',
+     'options': {}, 'application_metadata': {}},
+]
+
+
+class TestCephPool(tests_base.TestCase):
+
+    def setUp(self):
+        super(TestCephPool, self).setUp()
+        self.module = mock.MagicMock()
+        options = yaml.safe_load(ceph_pool.DOCUMENTATION)['options']
+        self.module.params = dict((k, v.get('default'))
+                                  for k, v in options.items())
+        self.module.params['pools'] = [
+            {'name': 'vms', 'application': 'rbd', 'size': 3},
+            {'name': 'volumes', 'application': 'rbd', 'size': 3,
+             'target_size_ratio': 0.2},
+            {'name': 'images', 'application': 'rbd', 'type': 'replicated',
+             'pg_autoscale_mode': True},
+            {'name': 'old', 'state': 'absent'},
+            {'name': 'missing', 'state': 'absent'},
+        ]
+
+    def test_get_running_pools(self):
+        pools = ceph_pool.get_running_pools(json.dumps(POOLS_DETAIL))
+        self.assertEqual(['old', 'vms', 'volumes'], sorted(pools))
+        self.assertEqual(('rbd', None), (pools['vms']['application'],
+                                         pools['vms']['target_size_ratio']))
+        self.assertEqual(('', 0.2),
+                         (pools['volumes']['application'],
+                          pools['volumes']['target_size_ratio']))
+
+    @mock.patch.object(ceph_pool, 'exec_command')
+    def test_manage_pools(self, mock_exec):
+        mock_exec.side_effect = lambda module, cmd: (
+            0, cmd, json.dumps(POOLS_DETAIL) if 'ls' in cmd else '', '')
+        rc, cmd, out, err, changed, results = ceph_pool.manage_pools(
+            self.module, 'ceph', 'client.admin',
+            '/etc/ceph/ceph.client.admin.keyring')
+
+        self.assertEqual(0, rc)
+        self.assertTrue(changed)
+        self.assertEqual(
+            [('vms', False), ('volumes', True), ('images', True),
+             ('old', True), ('missing', False)],
+            [(r['name'], r['changed']) for r in results])
+        commands = [c[0][1][c[0][1].index('pool') + 1:]
+                    for c in mock_exec.call_args_list]
+        # the pools are listed once
+        self.assertEqual(['ls', 'detail', '-f', 'json'], commands[0])
+        self.assertEqual(
+            [['set', 'volumes', 'size', '3'],
+             ['application', 'disable', 'volumes', ''],
+             ['application', 'enable', 'volumes', 'rbd'],
+             ['create', 'images', 'replicated', 'replicated_rule'],
+             ['application', 'enable', 'images', 'rbd'],
+             ['rm', 'old', 'old', '--yes-i-really-really-mean-it']],
+            [c[:4] for c in commands[1:]])
+
+    @mock.patch.object(ceph_pool, 'exec_command')
+    def test_manage_pools_failure(self, mock_exec):
+        mock_exec.side_effect = [
+            (0, [], json.dumps(POOLS_DETAIL), ''),
+            (1, ['set'], '', 'error'),
+        ]
+        rc, cmd, out, err, changed, results = ceph_pool.manage_pools(
+            self.module, 'ceph', 'client.admin',
+            '/etc/ceph/ceph.client.admin.keyring')
+
+        self.assertEqual((1, 'error', False), (rc, err, changed))
+        self.assertEqual(['vms', 'volumes'], [r['name'] for r in results])
+        self.assertEqual(2, mock_exec.call_count)
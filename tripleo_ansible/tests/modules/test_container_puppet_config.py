@@ -13,11 +13,96 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import json
+import os
+import shutil
+import tempfile
+
+import mock
+
 from tripleo_ansible.ansible_plugins.modules import container_puppet_config
 from tripleo_ansible.tests import base as tests_base
 
 
 class TestContainerPuppetConfig(tests_base.TestCase):
+    def setUp(self):
+        super(TestContainerPuppetConfig, self).setUp()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.config_vol_prefix = os.path.join(self.tmp_dir, 'config-data')
+        self.startup_config = os.path.join(self.tmp_dir, 'startup-config')
+        os.makedirs(os.path.join(self.startup_config, 'step_1'))
+        os.makedirs(os.path.join(self.config_vol_prefix, 'puppet-generated',
+                                 'nova'))
+        patcher = mock.patch.object(container_puppet_config,
+                                    'CONTAINER_STARTUP_CONFIG',
+                                    self.startup_config)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.manager = container_puppet_config.ContainerPuppetManager.__new__(
+            container_puppet_config.ContainerPuppetManager)
+        self.manager.module = mock.MagicMock()
+        self.manager.results = {'changed': False}
+        self.manager.config_vol_prefix = self.config_vol_prefix
+        self.manager._config_hashes = {}
+
+    def _startup_config(self, name, config):
+        path = os.path.join(self.startup_config, 'step_1', name + '.json')
+        with open(path, 'w') as f:
+            f.write(json.dumps(config, indent=2))
+        return path
+
+    def _set_hash(self, volume, config_hash):
+        path = os.path.join(self.config_vol_prefix, 'puppet-generated',
+                            volume + '.md5sum')
+        with open(path, 'w') as f:
+            f.write(config_hash + '\n')
+
     def test_run(self):
         # TODO(emilien) write actual tests
         pass
+
+    def test_update_container_config_unchanged(self):
+        path = self._startup_config('nova_api', {'image': 'nova'})
+        self.manager._update_container_config(path, {'image': 'nova'})
+        self.assertFalse(self.manager.results['changed'])
+        self.manager._update_container_config(path, {'image': 'nova:new'})
+        self.assertTrue(self.manager.results['changed'])
+        with open(path) as f:
+            self.assertEqual({'image': 'nova:new'}, json.load(f))
+        self.assertEqual(0o600, os.stat(path).st_mode & 0o777)
+        self.assertEqual(['nova_api.json'],
+                         os.listdir(os.path.dirname(path)))
+
+    def test_update_container_config_mode(self):
+        path = self._startup_config('nova_api', {'image': 'nova'})
+        os.chmod(path, 0o644)
+        self.manager._update_container_config(path, {'image': 'nova'})
+        self.assertFalse(self.manager.results['changed'])
+        self.assertEqual(0o600, os.stat(path).st_mode & 0o777)
+
+    def test_update_hashes(self):
+        volume = os.path.join(self.config_vol_prefix, 'puppet-generated',
+                              'nova')
+        nova_api = self._startup_config('nova_api', {
+            'volumes': [volume + '/etc/nova:/etc/nova:ro'],
+            'environment': {'TRIPLEO_CONFIG_HASH': 'abc'}})
+        nova_compute = self._startup_config('nova_compute', {
+            'volumes': [volume + '/etc/nova:/etc/nova:ro',
+                        volume + '/etc/ssh:/etc/ssh:ro']})
+        self._startup_config('keystone', {'volumes': ['/etc/hosts']})
+        self._set_hash('nova', 'abc')
+
+        with mock.patch.object(self.manager, '_update_container_config',
+                               wraps=self.manager._update_container_config
+                               ) as update, \
+                mock.patch.object(self.manager, '_slurp',
+                                  wraps=self.manager._slurp) as slurp:
+            self.manager._update_hashes()
+        update.assert_called_once_with(nova_compute, mock.ANY)
+        with open(nova_compute) as f:
+            self.assertEqual('abc-abc',
+                             json.load(f)['environment']['TRIPLEO_CONFIG_HASH'])
+        # the hash of the volume is read only once
+        slurp.assert_any_call(volume + '.md5sum')
+        self.assertEqual(4, slurp.call_count)
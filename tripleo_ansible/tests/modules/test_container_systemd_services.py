@@ -0,0 +1,105 @@
+# Copyright 2021 Red Hat, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import threading
+
+import mock
+
+from tripleo_ansible.ansible_plugins.modules import container_systemd_services
+from tripleo_ansible.tests import base as tests_base
+
+
+class TestContainerSystemdServices(tests_base.TestCase):
+
+    def setUp(self):
+        super(TestContainerSystemdServices, self).setUp()
+        self.module = mock.MagicMock()
+        self.module.check_mode = False
+        self.module.params = {'poll_timeout': 20}
+        self.module.get_bin_path.return_value = 'systemctl'
+        self.commands = []
+        self.lock = threading.Lock()
+        self.results = {}
+        self.module.run_command.side_effect = self._run_command
+        self.services = container_systemd_services.SystemdServices(
+            self.module)
+
+    def _run_command(self, cmd):
+        with self.lock:
+            self.commands.append(tuple(cmd[1:]))
+        if cmd[1] == 'is-enabled':
+            return 0, 'enabled\n', ''
+        if cmd[1] == 'is-active':
+            return 3, 'inactive\n', ''
+        if cmd[1] == 'show':
+            unit = cmd[-1]
+            with self.lock:
+                results = self.results.get(unit, [])
+                result = results.pop(0) if results else 'success'
+            return 0, 'Result={}\n'.format(result), ''
+        return 0, '', ''
+
+    def _service(self, name, state='started', depends_on=()):
+        return {'name': name, 'state': state, 'depends_on': list(depends_on)}
+
+    def test_manage_all(self):
+        self.services.manage_all([
+            self._service('nova_api', 'restarted', ['mysql', 'nova_api']),
+            self._service('mysql', 'restarted'),
+            self._service('keystone'),
+        ], 4)
+
+        starts = [c for c in self.commands if c[0] in ('restart', 'start')]
+        self.assertLess(starts.index(('restart', 'tripleo_mysql.service')),
+                        starts.index(('restart',
+                                      'tripleo_nova_api.service')))
+        self.assertIn(('start', 'tripleo_keystone.service'), starts)
+        self.assertEqual({'nova_api', 'mysql', 'keystone'},
+                         self.services.changed)
+        self.assertEqual(['tripleo_keystone.service',
+                          'tripleo_mysql.service',
+                          'tripleo_nova_api.service'],
+                         sorted(self.services.timings))
+
+    def test_manage_all_circular(self):
+        self.assertRaises(
+            container_systemd_services.ServiceError,
+            self.services.manage_all,
+            [self._service('a', depends_on=['b']),
+             self._service('b', depends_on=['a']),
+             self._service('c')], 4)
+        self.assertEqual(['tripleo_c.service'], list(self.services.timings))
+
+    @mock.patch('time.sleep')
+    def test_manage(self, mock_sleep):
+        self.results['tripleo_mysql.service'] = ['failed', 'failed']
+        self.services.manage('mysql', 'restarted')
+
+        # the service is only restarted once
+        self.assertEqual(
+            ['restart', 'start', 'start'],
+            [c[0] for c in self.commands if c[0] in ('restart', 'start')])
+        self.assertEqual([0.5, 1.0],
+                         [c[0][0] for c in mock_sleep.call_args_list])
+        self.assertEqual({'mysql'}, self.services.changed)
+
+    @mock.patch('time.sleep')
+    @mock.patch('time.time')
+    def test_manage_timeout(self, mock_time, mock_sleep):
+        mock_time.side_effect = [0, 5, 25, 25]
+        self.results['tripleo_mysql.service'] = ['failed'] * 3
+        self.assertRaises(container_systemd_services.ServiceError,
+                          self.services.manage, 'mysql', 'started')
+        self.assertEqual({'tripleo_mysql.service': 25}, self.services.timings)
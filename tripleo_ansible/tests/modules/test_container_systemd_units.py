@@ -0,0 +1,104 @@
+# Copyright 2021 Red Hat, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import shutil
+import tempfile
+
+import mock
+
+from tripleo_ansible.ansible_plugins.modules import container_systemd_units
+from tripleo_ansible.tests import base as tests_base
+
+
+class TestContainerSystemdUnits(tests_base.TestCase):
+
+    def setUp(self):
+        super(TestContainerSystemdUnits, self).setUp()
+        self.unit_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.unit_dir)
+        self.module = mock.MagicMock()
+        self.module.check_mode = False
+        self.module.params = {'unit_dir': self.unit_dir}
+        self.module.get_bin_path.return_value = 'systemctl'
+        self.module.run_command.return_value = (0, '', '')
+        self.module.load_file_common_arguments.side_effect = (
+            lambda args, path: args)
+        self.module.set_fs_attributes_if_different.side_effect = (
+            lambda args, changed, **kwargs: changed)
+        self.module.atomic_move.side_effect = os.rename
+        self.units = container_systemd_units.SystemdUnits(self.module)
+
+    def _write(self, filename, data=''):
+        with open(os.path.join(self.unit_dir, filename), 'w') as f:
+            f.write(data)
+
+    def test_write_units(self):
+        self._write('tripleo_keystone.service', 'keystone\n')
+        changed = self.units.write_units({'keystone': 'keystone\n',
+                                          'mysql': 'mysql\n'})
+        self.assertEqual(['mysql'], changed)
+        with open(os.path.join(self.unit_dir,
+                               'tripleo_mysql.service')) as f:
+            self.assertEqual('mysql\n', f.read())
+        self.assertTrue(self.units.changed)
+
+        self.units.daemon_reload()
+        self.module.run_command.assert_called_once_with(
+            ['systemctl', 'daemon-reload'])
+
+    def test_unchanged(self):
+        self._write('tripleo_keystone.service', 'keystone\n')
+        self.assertEqual([], self.units.write_units(
+            {'keystone': 'keystone\n'}))
+        self.units.daemon_reload()
+        self.assertFalse(self.units.changed)
+        self.module.run_command.assert_not_called()
+
+    def test_cleanup(self):
+        self._write('tripleo_keystone.requires')
+        self._write('tripleo_keystone_healthcheck.timer')
+        self._write('tripleo_keystone_healthcheck.service')
+        self.units.cleanup_requires(['keystone', 'mysql'])
+        self.assertEqual(['keystone'], self.units.cleanup_healthchecks(
+            ['keystone', 'mysql']))
+        self.assertEqual([], os.listdir(self.unit_dir))
+        self.module.run_command.assert_has_calls([
+            mock.call(['systemctl', 'stop',
+                       'tripleo_keystone_healthcheck.timer']),
+            mock.call(['systemctl', 'disable',
+                       'tripleo_keystone_healthcheck.timer'])])
+        self.assertTrue(self.units.reload)
+
+    def test_cleanup_timer_not_loaded(self):
+        self.module.run_command.return_value = (
+            5, '', 'Unit tripleo_keystone_healthcheck.timer not loaded.')
+        self._write('tripleo_keystone_healthcheck.timer')
+        self._write('tripleo_keystone_healthcheck.service')
+        self.assertEqual(['keystone'], self.units.cleanup_healthchecks(
+            ['keystone']))
+        self.assertEqual([], os.listdir(self.unit_dir))
+        self.module.fail_json.assert_not_called()
+
+    def test_check_mode(self):
+        self.module.check_mode = True
+        self._write('tripleo_keystone.requires')
+        self.units.cleanup_requires(['keystone'])
+        self.assertEqual(['mysql'], self.units.write_units(
+            {'mysql': 'mysql\n'}))
+        self.units.daemon_reload()
+        self.assertEqual(['tripleo_keystone.requires'],
+                         os.listdir(self.unit_dir))
+        self.module.run_command.assert_not_called()
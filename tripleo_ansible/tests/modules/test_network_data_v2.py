@@ -14,7 +14,12 @@
 #    under the License.
 
 import copy
+import functools
 import mock
+import os
+import shutil
+import tempfile
+import time
 import yaml
 
 import openstack
@@ -431,16 +436,25 @@ class TestNetworkDataV2(tests_base.TestCase):
     def test_create_name_id_maps(self, conn_mock):
         subnet1 = stubs.FakeNeutronSubnet(id='subnet1_id',
                                           name='subnet1',
+                                          network_id='network1_id',
                                           cidr='192.168.24.0/24')
         subnet2 = stubs.FakeNeutronSubnet(id='subnet2_id',
                                           name='subnet2',
+                                          network_id='network1_id',
                                           cidr='192.168.25.0/25')
         subnet3 = stubs.FakeNeutronSubnet(id='subnet3_id',
                                           name='subnet3',
+                                          network_id='network2_id',
                                           cidr='192.168.26.0/26')
         subnet4 = stubs.FakeNeutronSubnet(id='subnet4_id',
                                           name='subnet4',
+                                          network_id='network2_id',
                                           cidr='192.168.27.0/27')
+        # A subnet on a network not listed
+        subnet5 = stubs.FakeNeutronSubnet(id='subnet5_id',
+                                          name='subnet5',
+                                          network_id='network3_id',
+                                          cidr='192.168.28.0/28')
         network1 = stubs.FakeNeutronNetwork(
             id='network1_id',
             name='network1',
@@ -455,9 +469,10 @@ class TestNetworkDataV2(tests_base.TestCase):
         )
         conn_mock.network.networks.return_value = self.a2g([network1,
                                                             network2])
-        conn_mock.network.subnets.side_effect = [self.a2g([subnet1, subnet2]),
-                                                 self.a2g([subnet3, subnet4])]
+        conn_mock.network.subnets.return_value = self.a2g(
+            [subnet1, subnet3, subnet2, subnet4, subnet5])
         net_maps = network_data_v2.create_name_id_maps(conn_mock)
+        conn_mock.network.subnets.assert_called_once_with()
         expected_by_name_map = {
             'network1': {
                 'id': 'network1_id',
@@ -489,3 +504,50 @@ class TestNetworkDataV2(tests_base.TestCase):
         self.assertEqual(expected_by_name_map, net_maps['by_name'])
         self.assertEqual(expected_by_id_map, net_maps['by_id'])
         self.assertEqual(expected_cidr_prefix_map, net_maps['cidr_prefix_map'])
+
+    @mock.patch.object(network_data_v2, 'create_name_id_maps', autospec=True)
+    def test_get_name_id_maps(self, mock_create_maps):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        cache_dir = os.path.join(tmp_dir, 'cache')
+        net_maps = {'by_id': {'network1_id': 'network1'}, 'by_name': {},
+                    'cidr_prefix_map': {}}
+        mock_create_maps.return_value = net_maps
+        conn = mock.MagicMock()
+        conn.config.name = 'undercloud'
+        get_maps = functools.partial(network_data_v2.get_name_id_maps,
+                                     conn, ttl=60, cache_dir=cache_dir)
+
+        self.assertEqual(net_maps, get_maps('overcloud', 'run-1'))
+        self.assertEqual(net_maps, get_maps('overcloud', 'run-1'))
+        self.assertEqual(1, mock_create_maps.call_count)
+        # keyed by cloud, stack and run
+        get_maps('other', 'run-1')
+        get_maps('overcloud', 'run-2')
+        self.assertEqual(3, mock_create_maps.call_count)
+
+        # expired, and pruned with the other old runs
+        path = network_data_v2.net_maps_cache_path('undercloud', 'overcloud',
+                                                   'run-1', cache_dir)
+        os.utime(path, (time.time() - 120, time.time() - 120))
+        stale = network_data_v2.net_maps_cache_path('undercloud', 'other',
+                                                    'run-1', cache_dir)
+        os.utime(stale, (time.time() - 120, time.time() - 120))
+        get_maps('overcloud', 'run-1')
+        self.assertEqual(4, mock_create_maps.call_count)
+        self.assertFalse(os.path.exists(stale))
+
+        # disabled, without run or cloud name
+        network_data_v2.get_name_id_maps(conn, 'overcloud', 'run-1',
+                                         cache_dir=cache_dir)
+        get_maps('overcloud', None)
+        conn.config.name = None
+        with mock.patch.dict('os.environ', {'OS_CLOUD': ''}):
+            get_maps('overcloud', 'run-1')
+        self.assertEqual(7, mock_create_maps.call_count)
+        self.assertEqual(2, len(os.listdir(cache_dir)))
+
+        # the cloud name from the environment
+        with mock.patch.dict('os.environ', {'OS_CLOUD': 'undercloud'}):
+            get_maps('overcloud', 'run-1')
+        self.assertEqual(7, mock_create_maps.call_count)
@@ -0,0 +1,296 @@
+# Copyright 2021 Red Hat, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import json
+import threading
+import time
+
+import mock
+
+from tripleo_ansible.ansible_plugins.modules import (
+    tripleo_container_manage as plugin)
+from tripleo_ansible.tests import base as tests_base
+
+
+CONFIGS = {
+    'mysql_bootstrap': {'start_order': 0, 'image': 'mysql'},
+    'memcached': {'start_order': 0, 'image': 'memcached'},
+    'mysql': {'start_order': 1, 'image': 'mysql',
+              'volumes_from': ['mysql_bootstrap']},
+    'keystone': {'start_order': 2, 'image': 'keystone'},
+    'keystone_bootstrap': {'start_order': 3, 'action': 'exec',
+                           'command': ['keystone', 'keystone-manage']},
+}
+
+
+class TestTripleoContainerManage(tests_base.TestCase):
+
+    def setUp(self):
+        super(TestTripleoContainerManage, self).setUp()
+        self.module = mock.MagicMock()
+        self.module.params = {
+            'config_id': 'tripleo_step1',
+            'config_dir': '/var/lib/tripleo-config/step_1',
+            'config_patterns': '*.json',
+            'config_overrides': {},
+            'log_base_path': '/var/log/containers/stdouts',
+            'concurrency': 2,
+            'scheduler': 'start_order',
+            'debug': False,
+        }
+        self.module.fail_json.side_effect = SystemExit
+        self.order = []
+        self.lock = threading.Lock()
+        self._patch()
+
+    def _patch(self):
+        self.addCleanup(mock.patch.stopall)
+        mock.patch.object(plugin.TripleoContainerManage, '_get_configs',
+                          return_value=CONFIGS).start()
+        mock.patch.object(plugin.TripleoContainerManage, 'run_container',
+                          autospec=True,
+                          side_effect=self._run_container).start()
+
+    def _run_container(self, manager, data):
+        name, config = data
+        if name == 'memcached':
+            time.sleep(0.2)
+        with self.lock:
+            self.order.append(name)
+        manager.timings[name] = 0.3 if name == 'memcached' else 0.1
+        return (name, name != 'keystone_bootstrap')
+
+    def _run(self, scheduler):
+        self.module.params['scheduler'] = scheduler
+        results = {'changed': False}
+        self.assertRaises(SystemExit, plugin.TripleoContainerManage,
+                          self.module, results)
+        return results
+
+    def test_start_order(self):
+        results = self._run('start_order')
+        self.assertEqual(['mysql_bootstrap', 'memcached', 'mysql', 'keystone',
+                          'keystone_bootstrap'], self.order)
+        self.module.fail_json.assert_called_once_with(
+            msg='Failed containers: keystone_bootstrap')
+        self.assertEqual(0.3, results['container_timings']['memcached'])
+        self.assertEqual(
+            {'length': 0.6,
+             'containers': ['memcached', 'mysql', 'keystone',
+                            'keystone_bootstrap']},
+            results['critical_path'])
+
+    def test_dependencies(self):
+        results = self._run('dependencies')
+        # memcached does not hold the other containers back
+        self.assertEqual('memcached', self.order[-1])
+        self.assertLess(self.order.index('mysql_bootstrap'),
+                        self.order.index('mysql'))
+        self.assertLess(self.order.index('keystone'),
+                        self.order.index('keystone_bootstrap'))
+        self.assertEqual(
+            {'length': 0.3, 'containers': ['memcached']},
+            results['critical_path'])
+
+    def test_podman_calls(self):
+        with mock.patch.object(plugin.TripleoContainerManage, 'run'):
+            manager = plugin.TripleoContainerManage(self.module, {})
+        manager.module.run_command(['podman', 'ps'])
+        manager.module.run_command([b'/usr/bin/podman', b'--version'])
+        manager.module.run_command(['systemctl', 'daemon-reload'])
+        self.assertEqual(2, manager.podman_calls)
+
+    def _manage_labels(self, name, installed_labels=None):
+        with mock.patch.object(plugin.TripleoContainerManage, 'run'):
+            manager = plugin.TripleoContainerManage(self.module, {})
+        manager.normalizer = mock.MagicMock()
+        manager.snapshot.generation = 1
+        if installed_labels is not None:
+            manager.snapshot.containers[name] = {
+                'Name': name, 'Config': {'Labels': installed_labels}}
+        with mock.patch.object(plugin, 'PodmanManager'):
+            self.assertTrue(manager.manage_container(name, CONFIGS[name]))
+        labels = manager.normalizer.normalize.call_args[0][0]['label']
+        self.assertEqual(CONFIGS[name], labels['config_data'])
+        return labels
+
+    def test_manage_container_labels(self):
+        digest = plugin.container_configs.config_digest(CONFIGS['mysql'])
+        labels = self._manage_labels('mysql')
+        self.assertEqual(digest, labels['config_digest'])
+        labels = self._manage_labels('mysql', {
+            'config_data': repr(CONFIGS['mysql']), 'config_digest': 'old'})
+        self.assertEqual(digest, labels['config_digest'])
+        labels = self._manage_labels('mysql', {
+            'config_data': repr(CONFIGS['memcached'])})
+        self.assertEqual(digest, labels['config_digest'])
+
+    def test_manage_container_labels_unchanged(self):
+        # not recreated to add the label when its config did not change
+        labels = self._manage_labels('mysql', {
+            'config_data': repr(CONFIGS['mysql'])})
+        self.assertNotIn('config_digest', labels)
+
+    def test_get_dependencies(self):
+        self.module.params['scheduler'] = 'dependencies'
+        with mock.patch.object(plugin.TripleoContainerManage, 'run'):
+            manager = plugin.TripleoContainerManage(self.module, {})
+        configs = dict(CONFIGS)
+        configs['a'] = {'depends_on': ['b', 'not_managed']}
+        configs['b'] = {'depends_on': ['a']}
+        dependencies = manager.get_dependencies(configs)
+        self.assertEqual(set(['mysql_bootstrap']), dependencies['mysql'])
+        self.assertEqual(set(['keystone']),
+                         dependencies['keystone_bootstrap'])
+        self.assertEqual(set(['b']), dependencies['a'])
+        self.assertEqual(set(), dependencies['memcached'])
+        self.module.fail_json.side_effect = None
+        manager.run_scheduled(configs, dependencies)
+        self.assertNotIn('a', self.order)
+        self.assertNotIn('b', self.order)
+
+
+class TestPodmanSnapshot(tests_base.TestCase):
+
+    def _inspect(self, running):
+        return (0, json.dumps([
+            {'Name': 'keystone', 'State': {'Running': running}},
+            {'Name': 'mysql', 'State': {'Running': True}}]), '')
+
+    def test_wait_for(self):
+        module = mock.MagicMock()
+        module.run_command.side_effect = [
+            (0, 'keystone\nmysql\n', ''), self._inspect(False),
+            (0, 'keystone\nmysql\n', ''), self._inspect(True),
+        ]
+        snapshot = plugin.PodmanSnapshot(module, min_delay=0.01)
+        self.assertTrue(snapshot.wait_for(
+            'keystone', lambda data: data['State']['Running']))
+        module.run_command.assert_has_calls([
+            mock.call(['podman', 'ps', '-a', '--format', '{{.Names}}']),
+            mock.call(['podman', 'container', 'inspect', 'keystone',
+                       'mysql'])])
+        # the snapshot is shared until it is invalidated
+        self.assertTrue(snapshot.wait_for(
+            'mysql', lambda data: data['State']['Running']))
+        self.assertEqual(4, module.run_command.call_count)
+
+    def test_get(self):
+        module = mock.MagicMock()
+        module.run_command.side_effect = [
+            (0, 'keystone\nmysql\n', ''), self._inspect(False)]
+        snapshot = plugin.PodmanSnapshot(module)
+        self.assertEqual('keystone', snapshot.get('keystone')['Name'])
+        snapshot.invalidate()
+        self.assertIsNone(snapshot.get('nova'))
+        # fetched only once
+        self.assertEqual(2, module.run_command.call_count)
+
+    def test_wait_for_timeout(self):
+        module = mock.MagicMock()
+        module.run_command.return_value = (0, '', '')
+        snapshot = plugin.PodmanSnapshot(module, min_delay=0.01)
+        self.assertFalse(snapshot.wait_for(
+            'keystone', lambda data: True, timeout=0.1))
+        # backoff instead of polling continuously
+        self.assertLess(module.run_command.call_count, 10)
+
+
+def legacy_normalize(opts, spec):
+    """Container options conversion as done before ContainerOptsNormalizer"""
+    opts = dict(opts)
+    if 'volumes' in opts:
+        opts['volume'] = opts.pop('volumes')
+    if 'environment' in opts:
+        opts['env'] = opts.pop('environment')
+    if 'healthcheck' in opts and isinstance(opts['healthcheck'], dict):
+        opts['healthcheck'] = opts['healthcheck'].get('test', None)
+    if 'check_interval' in opts:
+        opts['healthcheck_interval'] = opts.pop('check_interval')
+    if 'remove' in opts:
+        opts['rm'] = opts.pop('remove')
+    if 'restart' in opts:
+        opts['restart'] = False
+    if 'stop_grace_period' in opts:
+        opts['stop_timeout'] = opts.pop('stop_grace_period')
+
+    opts_dict = {}
+    for k, v in spec.items():
+        opts_dict[k] = v['default'] if 'default' in v else None
+    aliases = {}
+    for k, v in spec.items():
+        for alias in v.get('aliases', []):
+            aliases[alias] = k
+    for k in list(opts):
+        if k in aliases:
+            opts_dict[aliases[k]] = opts.pop(k)
+    opts_dict.update(opts)
+
+    for k, v in opts_dict.items():
+        if v is None or spec.get(k) is None:
+            continue
+        opt_type = spec[k]['type']
+        if opt_type in ['raw', 'path']:
+            continue
+        if not isinstance(v, eval(opt_type)):
+            if isinstance(v, str) and opt_type == 'list':
+                opts_dict[k] = [v]
+            elif isinstance(v, str) and opt_type == 'bool':
+                opts_dict[k] = plugin.boolean(v)
+            elif isinstance(v, str) and opt_type == 'int':
+                opts_dict[k] = int(v)
+            elif isinstance(v, int) and opt_type == 'str':
+                opts_dict[k] = str(v)
+            else:
+                raise TypeError(k)
+    return opts_dict
+
+
+class TestContainerOptsNormalizer(tests_base.TestCase):
+
+    def setUp(self):
+        super(TestContainerOptsNormalizer, self).setUp()
+        self.spec = plugin.ARGUMENTS_SPEC_CONTAINER
+        self.normalizer = plugin.ContainerOptsNormalizer(self.spec)
+
+    def test_normalize(self):
+        configs = [
+            {'name': 'keystone', 'image': 'keystone', 'net': 'host',
+             'volumes': ['/etc/hosts:/etc/hosts:ro'],
+             'environment': {'KOLLA_CONFIG_STRATEGY': 'COPY_ALWAYS'},
+             'healthcheck': {'test': '/openstack/healthcheck'},
+             'check_interval': 30, 'restart': 'always',
+             'privileged': 'false', 'user': 42, 'remove': True,
+             'stop_grace_period': '10', 'start_order': 2,
+             'labels': {'foo': 'bar'}, 'dns': '10.0.0.1'},
+            {'name': 'mysql_bootstrap', 'image': 'mysql',
+             'command': ['bash', '-c', 'true'], 'detach': False,
+             'label': {'config_id': 'tripleo_step1'},
+             'ulimit': ['nofile=131072'], 'action': 'create'},
+        ]
+        for config in configs:
+            self.assertEqual(legacy_normalize(config, self.spec),
+                             self.normalizer.normalize(config))
+
+    def test_normalize_does_not_modify_config(self):
+        config = {'name': 'keystone', 'volumes': ['/a:/a'],
+                  'environment': {'A': 'B'}}
+        self.normalizer.normalize(config)
+        self.assertEqual({'name': 'keystone', 'volumes': ['/a:/a'],
+                          'environment': {'A': 'B'}}, config)
+
+    def test_normalize_wrong_type(self):
+        self.assertRaises(TypeError, self.normalizer.normalize,
+                          {'name': 'keystone', 'env': ['A=B']})
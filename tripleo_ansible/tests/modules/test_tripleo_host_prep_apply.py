@@ -0,0 +1,134 @@
+# Copyright 2021 Red Hat, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import grp
+import io
+import os
+import pwd
+import shutil
+import tarfile
+import tempfile
+
+import mock
+
+from tripleo_ansible.ansible_plugins.modules import tripleo_host_prep_apply
+from tripleo_ansible.tests import base as tests_base
+
+
+class TestTripleoHostPrepApply(tests_base.TestCase):
+
+    def setUp(self):
+        super(TestTripleoHostPrepApply, self).setUp()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.module = mock.MagicMock()
+        self.module.check_mode = False
+        self.module.params = {'groups': [], 'users': [], 'directories': [],
+                              'files': [], 'archive': None}
+        self.module.get_bin_path.side_effect = lambda cmd, required: cmd
+        self.module.run_command.return_value = (0, '', '')
+        self.module.load_file_common_arguments.side_effect = (
+            lambda args, path: args)
+        self.module.set_fs_attributes_if_different.side_effect = (
+            lambda args, changed, **kwargs: changed)
+        self.module.atomic_move.side_effect = os.rename
+        self.host_prep = tripleo_host_prep_apply.HostPrep(self.module)
+
+    def _archive(self, members):
+        path = os.path.join(self.tmp_dir, 'files.tar.gz')
+        with tarfile.open(path, mode='w:gz') as tar:
+            for name, data in members.items():
+                info = tarfile.TarInfo(name=name)
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+        self.module.params['archive'] = path
+
+    @mock.patch.object(grp, 'getgrnam')
+    def test_apply_group(self, mock_getgrnam):
+        mock_getgrnam.side_effect = KeyError
+        self.assertTrue(self.host_prep.apply_group(
+            {'name': 'nova', 'gid': 42436, 'system': True}))
+        self.module.run_command.assert_called_once_with(
+            ['groupadd', '-g', '42436', '-r', 'nova'])
+
+        mock_getgrnam.side_effect = None
+        mock_getgrnam.return_value.gr_gid = 42436
+        self.assertFalse(self.host_prep.apply_group(
+            {'name': 'nova', 'gid': 42436}))
+
+    @mock.patch.object(grp, 'getgrall', return_value=[])
+    @mock.patch.object(grp, 'getgrgid')
+    @mock.patch.object(grp, 'getgrnam')
+    @mock.patch.object(pwd, 'getpwnam')
+    def test_apply_user(self, mock_getpwnam, mock_getgrnam, mock_getgrgid,
+                        mock_getgrall):
+        mock_getpwnam.side_effect = KeyError
+        self.assertTrue(self.host_prep.apply_user(
+            {'name': 'nova', 'uid': 42436, 'group': 'nova',
+             'groups': 'libvirt,qemu', 'create_home': False}))
+        self.module.run_command.assert_called_once_with(
+            ['useradd', '-u', '42436', '-g', 'nova', '-G', 'libvirt,qemu',
+             '-M', 'nova'])
+
+        self.module.run_command.reset_mock()
+        mock_getpwnam.side_effect = None
+        mock_getpwnam.return_value = pwd.struct_passwd(
+            ('nova', 'x', 42436, 42436, '', '/var/lib/nova', '/sbin/nologin'))
+        mock_getgrnam.return_value.gr_gid = 42436
+        mock_getgrgid.return_value.gr_name = 'nova'
+        self.assertFalse(self.host_prep.apply_user(
+            {'name': 'nova', 'uid': 42436, 'group': 'nova'}))
+        self.assertTrue(self.host_prep.apply_user(
+            {'name': 'nova', 'shell': '/bin/bash', 'groups': ['nova']}))
+        self.module.run_command.assert_called_once_with(
+            ['usermod', '-s', '/bin/bash', 'nova'])
+
+    def test_apply_directory(self):
+        path = os.path.join(self.tmp_dir, 'log', 'nova')
+        self.assertTrue(self.host_prep.apply_directory(
+            {'path': path, 'mode': '0750'}))
+        self.assertTrue(os.path.isdir(path))
+        # the created parent gets the same attributes
+        self.assertEqual(
+            [os.path.join(self.tmp_dir, 'log'), path, path],
+            [c[0][0]['path'] for c in
+             self.module.set_fs_attributes_if_different.call_args_list][-3:])
+        self.assertFalse(self.host_prep.apply_directory({'path': path}))
+
+    def test_apply_file(self):
+        self._archive({'files/0': b'[DEFAULT]\n'})
+        dest = os.path.join(self.tmp_dir, 'nova.conf')
+        args = {'dest': dest, 'member': 'files/0', 'mode': '0640'}
+        self.assertTrue(self.host_prep.apply_file(args))
+        with open(dest, 'rb') as f:
+            self.assertEqual(b'[DEFAULT]\n', f.read())
+        self.assertFalse(self.host_prep.apply_file(args))
+
+    def test_apply_failure(self):
+        self._archive({'files/0': b'data'})
+        self.module.params['directories'] = [
+            {'path': os.path.join(self.tmp_dir, 'foo')}]
+        self.module.params['files'] = [
+            {'dest': os.path.join(self.tmp_dir, 'missing', 'bar'),
+             'member': 'files/0'},
+            {'dest': os.path.join(self.tmp_dir, 'foo', 'bar'),
+             'member': 'files/0'}]
+        self.assertRaises(tripleo_host_prep_apply.HostPrepFailure,
+                          self.host_prep.apply)
+        self.assertEqual([(True, False), (False, True)],
+                         [(r['changed'], r['failed'])
+                          for r in self.host_prep.results])
+        self.assertFalse(os.path.exists(
+            os.path.join(self.tmp_dir, 'foo', 'bar')))
@@ -491,6 +491,87 @@ class TestTripleoOvercloudNetworkPorts(tests_base.TestCase):
         mock_delete_ports.assert_called_with(mock_conn, [port_foo, port_bar])
         self.assertTrue(result['changed'])
 
+    @mock.patch.object(openstack.connection, 'Connection', autospec=True)
+    def test_get_ports_by_hostname(self, mock_conn):
+        port_foo = stubs.FakeNeutronPort(name='instance0_Foo',
+                                         dns_name='instance0')
+        port_bar = stubs.FakeNeutronPort(name='instance0_Bar',
+                                         dns_name='instance0')
+        port_baz = stubs.FakeNeutronPort(name='instance1_Foo',
+                                         dns_name='instance1')
+        mock_conn.network.ports.return_value = self.a2g(
+            [port_foo, port_bar, port_baz])
+        ports_by_hostname = plugin.get_ports_by_hostname(mock_conn, STACK)
+        mock_conn.network.ports.assert_called_once_with(
+            tags=['tripleo_stack_name=overcloud'])
+        self.assertEqual({'instance0': [port_foo, port_bar],
+                          'instance1': [port_baz]}, ports_by_hostname)
+
+    @mock.patch.object(plugin, 'update_ports', autospec=True)
+    @mock.patch.object(plugin, 'create_ports', autospec=True)
+    @mock.patch.object(plugin, 'pre_provisioned_ports', autospec=True)
+    @mock.patch.object(openstack.connection, 'Connection', autospec=True)
+    def test__provision_ports_hostname_ports(self, mock_conn,
+                                             mock_pre_provisioned,
+                                             mock_create_ports,
+                                             mock_update_ports):
+        port_foo = stubs.FakeNeutronPort(
+            name='instance0_Foo',
+            dns_name='instance0',
+            network_id='foo_id',
+            fixed_ips=[{'subnet_id': 'foo_subnet_id'}],
+            tags=['tripleo_stack_name=overcloud', 'tripleo_role=role'])
+        # A port of the instance in another role
+        port_bar = stubs.FakeNeutronPort(
+            name='instance0_Bar',
+            dns_name='instance0',
+            network_id='bar_id',
+            fixed_ips=[{'subnet_id': 'bar_subnet_id'}],
+            tags=['tripleo_stack_name=overcloud', 'tripleo_role=other'])
+        hostname_ports = [port_foo, port_bar]
+        plugin._provision_ports({}, mock_conn, STACK, FAKE_INSTANCE,
+                                FAKE_MAPS, {}, 'ironic_uuid', 'role',
+                                hostname_ports)
+        mock_conn.network.ports.assert_not_called()
+        mock_update_ports.assert_called_with(mock.ANY, mock_conn, mock.ANY,
+                                             [port_foo], mock.ANY, FAKE_MAPS,
+                                             mock.ANY)
+        self.assertEqual('instance0_Bar',
+                         mock_create_ports.call_args[0][2][0]['name'])
+        self.assertEqual([port_foo, port_bar], hostname_ports)
+
+    @mock.patch.object(plugin, 'delete_ports', autospec=True)
+    @mock.patch.object(openstack.connection, 'Connection', autospec=True)
+    def test__unprovision_ports_hostname_ports(self, mock_conn,
+                                               mock_delete_ports):
+        result = {'changed': False, 'instance_port_map': {}}
+        port_foo = stubs.FakeNeutronPort(
+            name='instance_foo',
+            dns_name='instance0',
+            tags=['tripleo_stack_name=overcloud',
+                  'tripleo_ironic_uuid=ironic_uuid'])
+        port_bar = stubs.FakeNeutronPort(
+            name='instance_bar',
+            dns_name='instance0',
+            tags=['tripleo_stack_name=overcloud'])
+        plugin._unprovision_ports(result, mock_conn, STACK, FAKE_INSTANCE,
+                                  'ironic_uuid', [port_foo, port_bar])
+        mock_delete_ports.assert_called_with(mock_conn, [port_foo])
+        self.assertTrue(result['changed'])
+
+        # Ports not tagged with the ironic uuid yet
+        plugin._unprovision_ports(result, mock_conn, STACK, FAKE_INSTANCE,
+                                  'other_uuid', [port_foo, port_bar])
+        mock_delete_ports.assert_called_with(mock_conn, [port_foo, port_bar])
+
+        mock_delete_ports.reset_mock()
+        result['changed'] = False
+        plugin._unprovision_ports(result, mock_conn, STACK, FAKE_INSTANCE,
+                                  'ironic_uuid', [])
+        mock_delete_ports.assert_not_called()
+        self.assertFalse(result['changed'])
+        mock_conn.network.ports.assert_not_called()
+
     def test_generate_node_port_map(self):
         result = dict(node_port_map=dict())
         ports_by_node = dict(
@@ -0,0 +1,179 @@
+# Copyright 2021 Red Hat, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+
+import mock
+
+from ansible.parsing.dataloader import DataLoader
+from ansible.template import Templar
+
+from tripleo_ansible.ansible_plugins.action import container_systemd
+from tripleo_ansible.tests import base as tests_base
+
+
+TEMPLATE = os.path.join(
+    os.path.dirname(container_systemd.__file__), '..', '..', 'roles',
+    'tripleo_container_manage', 'templates', 'systemd-service.j2')
+
+CONTAINER_CONFIG = [
+    {'keystone': {'image': 'quay.io/tripleo/keystone',
+                  'restart': 'always'}},
+    {'mysql': {'image': 'quay.io/tripleo/mysql', 'restart': 'always',
+               'stop_grace_period': 25, 'depends_on': ['foo.service'],
+               'systemd_exec_flags': {'LimitNOFILE': 4096}}},
+]
+
+
+class TestContainerSystemd(tests_base.TestCase):
+
+    def setUp(self):
+        super(TestContainerSystemd, self).setUp()
+        task = mock.MagicMock()
+        task.async_val = 0
+        task.args = {'container_config': CONTAINER_CONFIG}
+        self.task_vars = {'podman_drop_in': True}
+        self.templar = Templar(loader=DataLoader(), variables=self.task_vars)
+        self.action = container_systemd.ActionModule(
+            task, mock.MagicMock(), mock.MagicMock(), DataLoader(),
+            self.templar, mock.MagicMock())
+        with open(TEMPLATE) as f:
+            self.unit_template = f.read()
+        self.action._get_unit_template = mock.MagicMock(
+            return_value=self.unit_template)
+
+    def test_render_units(self):
+        units = self.action._render_units(CONTAINER_CONFIG)
+
+        for container in CONTAINER_CONFIG:
+            # what rendering with the full Templar gives
+            self.task_vars['container_data_unit'] = container
+            expected = self.templar.template(
+                self.unit_template, preserve_trailing_newlines=True,
+                escape_backslashes=False, convert_data=False)
+            del self.task_vars['container_data_unit']
+            for name in container:
+                self.assertEqual(expected, units[name])
+        self.assertIn('ExecStart=/usr/libexec/tripleo-start-podman-container '
+                      'mysql\n', units['mysql'])
+        self.assertIn('LimitNOFILE=4096\n', units['mysql'])
+        self.assertTrue(units['keystone'].endswith(
+            'WantedBy=multi-user.target\n'))
+
+    def test_run(self):
+        self.action._execute_module = mock.MagicMock(side_effect=[
+            {'changed': True, 'changed_units': ['mysql']},
+            {'changed': True, 'status': {'Result': 'success'}},
+            {'changed': False, 'status': {'Result': 'success'}},
+        ])
+        result = self.action.run(task_vars=self.task_vars)
+
+        self.assertTrue(result['changed'])
+        self.assertEqual(['tripleo_mysql.service'], result['restarted'])
+        calls = self.action._execute_module.call_args_list
+        self.assertEqual('container_systemd_units',
+                         calls[0][1]['module_name'])
+        self.assertEqual(['keystone', 'mysql'],
+                         sorted(calls[0][1]['module_args']['units']))
+        self.assertEqual(('restarted', 'tripleo_mysql.service'),
+                         (calls[1][1]['module_args']['state'],
+                          calls[1][1]['module_args']['name']))
+        self.assertEqual(('started', 'tripleo_keystone.service'),
+                         (calls[2][1]['module_args']['state'],
+                          calls[2][1]['module_args']['name']))
+
+
+class TestContainerSystemdConcurrency(tests_base.TestCase):
+
+    def setUp(self):
+        super(TestContainerSystemdConcurrency, self).setUp()
+        task = mock.MagicMock()
+        task.async_val = 0
+        self.action = container_systemd.ActionModule(
+            task, mock.MagicMock(), mock.MagicMock(), DataLoader(),
+            mock.MagicMock(), mock.MagicMock())
+        self.action.changed = False
+        self.action.restarted = []
+        self.action.timings = {}
+        self.action.debug = False
+        self.action.concurrency = 4
+
+    def test_get_dependencies(self):
+        container_config = [
+            {'nova_api': {'depends_on': ['tripleo_mysql.service',
+                                         'tripleo_nova_api.service',
+                                         'openvswitch.service']}},
+            {'mysql': {'depends_on': ['tripleo_memcached.service']}},
+            {'keystone': {'depends_on': None}},
+        ]
+        self.assertEqual(
+            {'nova_api': {'mysql'}, 'mysql': set(), 'keystone': set()},
+            self.action._get_dependencies(
+                container_config, ['nova_api', 'mysql', 'keystone']))
+
+    def test_manage_concurrently(self):
+        self.action._execute_module = mock.MagicMock(return_value={
+            'changed': True,
+            'restarted': ['tripleo_nova_api.service',
+                          'tripleo_mysql.service'],
+            'service_timings': {'tripleo_nova_api.service': 1.0,
+                                'tripleo_mysql.service': 2.0,
+                                'tripleo_keystone.service': 0.1}})
+        self.action._manage_concurrently(
+            [('nova_api', 'restarted'), ('mysql', 'restarted'),
+             ('keystone', 'started')],
+            {'nova_api': {'mysql'}, 'mysql': set(), 'keystone': set()},
+            {})
+
+        # a single module run manages the services on the host
+        self.action._execute_module.assert_called_once_with(
+            module_name='container_systemd_services',
+            module_args={'concurrency': 4, 'services': [
+                {'name': 'nova_api', 'state': 'restarted',
+                 'depends_on': ['mysql']},
+                {'name': 'mysql', 'state': 'restarted', 'depends_on': []},
+                {'name': 'keystone', 'state': 'started', 'depends_on': []},
+            ]},
+            task_vars={})
+        self.assertTrue(self.action.changed)
+        self.assertEqual(['tripleo_nova_api.service',
+                          'tripleo_mysql.service'], self.action.restarted)
+        self.assertEqual(['tripleo_keystone.service',
+                          'tripleo_mysql.service',
+                          'tripleo_nova_api.service'],
+                         sorted(self.action.timings))
+
+    def test_manage_concurrently_failure(self):
+        self.action._execute_module = mock.MagicMock(return_value={
+            'failed': True, 'msg': 'Service mysql has not started yet',
+            'restarted': [], 'service_timings': {}})
+        self.assertRaises(
+            container_systemd.AnsibleActionFail,
+            self.action._manage_concurrently,
+            [('mysql', 'restarted')], {'mysql': set()}, {})
+
+    def test_run_concurrently(self):
+        self.action._task.args = {'container_config': CONTAINER_CONFIG,
+                                  'concurrency': 4}
+        self.action._render_units = mock.MagicMock(return_value={})
+        self.action._write_units = mock.MagicMock(return_value=['mysql'])
+        self.action._manage_concurrently = mock.MagicMock()
+        self.action._systemd = mock.MagicMock()
+        self.action.run(task_vars={})
+
+        self.action._manage_concurrently.assert_called_once_with(
+            [('mysql', 'restarted'), ('keystone', 'started')],
+            {'mysql': set(), 'keystone': set()}, {})
+        self.action._systemd.assert_not_called()
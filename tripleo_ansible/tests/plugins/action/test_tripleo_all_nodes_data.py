@@ -0,0 +1,198 @@
+# Copyright 2020 Red Hat, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import json
+import os
+import shutil
+import tempfile
+
+import mock
+
+from tripleo_ansible.ansible_plugins.action import tripleo_all_nodes_data
+from tripleo_ansible.tests import base as tests_base
+
+
+GROUPS = {
+    'Controller': ['controller-1', 'controller-0'],
+    'Compute': ['compute-0'],
+    'keystone': ['controller-1', 'controller-0'],
+    'nova_compute': ['compute-0'],
+}
+
+HOSTVARS = {
+    'controller-0': {
+        'inventory_hostname': 'controller-0',
+        'ctlplane_ip': '192.168.24.10',
+        'ctlplane_hostname': 'controller-0.ctlplane.localdomain',
+        'internal_api_ip': '172.16.2.10',
+        'internal_api_hostname': 'controller-0.internalapi.localdomain',
+    },
+    'controller-1': {
+        'inventory_hostname': 'controller-1',
+        'ctlplane_ip': '192.168.24.11',
+        'ctlplane_hostname': 'controller-1.ctlplane.localdomain',
+        'internal_api_ip': '172.16.2.11',
+        'internal_api_hostname': 'controller-1.internalapi.localdomain',
+    },
+    'compute-0': {
+        'inventory_hostname': 'compute-0',
+        'ctlplane_ip': '192.168.24.20',
+        'ctlplane_hostname': 'compute-0.ctlplane.localdomain',
+    },
+}
+
+TASK_VARS = {
+    'service_net_map': {'keystone_network': 'internal_api'},
+    'nova_additional_cell': False,
+    'all_nodes_extra_map_data': {},
+    'net_vip_map': {},
+    'enabled_services': ['nova_compute', 'keystone'],
+    'primary_role_name': 'Controller',
+    'deploy_identifier': '1234',
+    'container_cli': 'podman',
+}
+
+
+class TestTripleoAllNodesData(tests_base.TestCase):
+
+    def setUp(self):
+        super(TestTripleoAllNodesData, self).setUp()
+        task = mock.MagicMock()
+        task.args = {}
+        var_manager = task.get_variable_manager.return_value
+        var_manager._inventory.get_groups_dict.return_value = GROUPS
+        var_manager.get_vars.return_value = {'hostvars': HOSTVARS}
+        self.action = tripleo_all_nodes_data.ActionModule(
+            task, mock.MagicMock(), mock.MagicMock(), mock.MagicMock(),
+            mock.MagicMock(), mock.MagicMock())
+
+    def _compute(self, **kwargs):
+        task_vars = dict(TASK_VARS)
+        task_vars['enabled_services'] = list(TASK_VARS['enabled_services'])
+        task_vars.update(kwargs)
+        all_nodes = {}
+        self.action.compute_all_nodes(all_nodes, task_vars)
+        return all_nodes
+
+    def test_compute_all_nodes(self):
+        all_nodes = self._compute()
+        self.assertEqual(['keystone', 'nova_compute'],
+                         all_nodes['enabled_services'])
+        self.assertTrue(all_nodes['keystone_enabled'])
+        self.assertEqual(['172.16.2.11', '172.16.2.10'],
+                         all_nodes['keystone_node_ips'])
+        self.assertEqual(['controller-1.internalapi.localdomain',
+                          'controller-0.internalapi.localdomain'],
+                         all_nodes['keystone_node_names'])
+        self.assertEqual(['controller-1', 'controller-0'],
+                         all_nodes['keystone_short_node_names'])
+        self.assertEqual('controller-0',
+                         all_nodes['keystone_short_bootstrap_node_name'])
+        self.assertEqual('172.16.2.11',
+                         all_nodes['keystone_bootstrap_node_ip'])
+        self.assertEqual(['192.168.24.20'],
+                         all_nodes['nova_compute_node_ips'])
+        self.assertEqual('internal_api', all_nodes['keystone_network'])
+        self.assertEqual('192.168.24.11,192.168.24.10',
+                         all_nodes['controller_node_ips'])
+        self.assertEqual('controller-1,controller-0',
+                         all_nodes['controller_node_names'])
+        # The inventory groups must not be modified
+        self.assertEqual(['controller-1', 'controller-0'], GROUPS['keystone'])
+
+    def test_compute_all_nodes_extra_map_data(self):
+        extra = {
+            'enabled_services': ['glance_api'],
+            'keystone_node_ips': ['172.16.2.10', '172.16.2.50'],
+            'keystone_short_node_names': ['central-0'],
+            'keystone_short_bootstrap_node_name': 'central-0',
+            'glance_api_node_ips': ['172.16.2.60'],
+            'glance_api_bootstrap_node_ip': '172.16.2.60',
+        }
+        all_nodes = self._compute(all_nodes_extra_map_data=extra)
+        self.assertEqual(['172.16.2.11', '172.16.2.10', '172.16.2.50'],
+                         all_nodes['keystone_node_ips'])
+        self.assertEqual(['controller-1', 'controller-0', 'central-0'],
+                         all_nodes['keystone_short_node_names'])
+        self.assertEqual('central-0',
+                         all_nodes['keystone_short_bootstrap_node_name'])
+        self.assertEqual(['172.16.2.60'], all_nodes['glance_api_node_ips'])
+        self.assertEqual('172.16.2.60',
+                         all_nodes['glance_api_bootstrap_node_ip'])
+
+    def test_compute_all_nodes_additional_cell(self):
+        all_nodes = self._compute(nova_additional_cell=True)
+        self.assertNotIn('keystone_node_names', all_nodes)
+        self.assertEqual(['controller-1.internalapi.localdomain',
+                          'controller-0.internalapi.localdomain'],
+                         all_nodes['keystone_cell_node_names'])
+
+    def test_compute_all_nodes_missing_network(self):
+        all_nodes = self._compute(
+            service_net_map={'nova_compute_network': 'internal_api'})
+        self.assertTrue(all_nodes['nova_compute_enabled'])
+        self.assertNotIn('nova_compute_node_ips', all_nodes)
+        self.assertEqual(['192.168.24.11', '192.168.24.10'],
+                         all_nodes['keystone_node_ips'])
+
+    def _run(self, **kwargs):
+        task_vars = dict(TASK_VARS)
+        task_vars['enabled_services'] = list(TASK_VARS['enabled_services'])
+        task_vars.update(kwargs)
+        task_vars['playbook_dir'] = self.playbook_dir
+        return self.action.run(task_vars=task_vars)
+
+    def _setup_playbook_dir(self):
+        self.playbook_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.playbook_dir)
+        os.mkdir(os.path.join(self.playbook_dir, 'group_vars'))
+        return os.path.join(self.playbook_dir, 'group_vars', 'overcloud.json')
+
+    def test_run_unchanged(self):
+        all_nodes_path = self._setup_playbook_dir()
+        self.assertTrue(self._run()['changed'])
+        with open(all_nodes_path) as f:
+            content = f.read()
+        self.assertFalse(self._run()['changed'])
+        with open(all_nodes_path) as f:
+            self.assertEqual(content, f.read())
+
+    def test_run_changed_service(self):
+        all_nodes_path = self._setup_playbook_dir()
+        self._run()
+        with mock.patch.object(self.action, 'compute_service',
+                               wraps=self.action.compute_service) as compute:
+            result = self._run(service_net_map={})
+        self.assertTrue(result['changed'])
+        compute.assert_called_once_with('keystone', mock.ANY)
+        with open(all_nodes_path) as f:
+            all_nodes = json.load(f)
+        self.assertEqual(['192.168.24.11', '192.168.24.10'],
+                         all_nodes['keystone_node_ips'])
+        self.assertEqual(['192.168.24.20'],
+                         all_nodes['nova_compute_node_ips'])
+        self.assertNotIn('keystone_network', all_nodes)
+
+    def test_run_compact(self):
+        all_nodes_path = self._setup_playbook_dir()
+        self._run()
+        self.action._task.args = {'compact': True}
+        self.assertTrue(self._run()['changed'])
+        with open(all_nodes_path) as f:
+            content = f.read()
+        self.assertNotIn('\n', content)
+        self.assertEqual(['192.168.24.20'],
+                         json.loads(content)['nova_compute_node_ips'])
+        self.assertFalse(self._run()['changed'])
@@ -0,0 +1,142 @@
+# Copyright 2021 Red Hat, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import io
+import tarfile
+
+import mock
+
+from tripleo_ansible.ansible_plugins.action import tripleo_host_prep
+from tripleo_ansible.tests import base as tests_base
+
+
+HOST_PREP_DATA = {
+    'nova': {
+        'groups': {'nova': {'gid': 42436}},
+        'users': {'nova': {'uid': 42436, 'group': 'nova'}},
+        'directories': {
+            '/var/log/containers/nova': {'setype': 'container_file_t',
+                                         'mode': '0750'},
+            '/var/lib/nova': {'recurse': True},
+        },
+        'files': {
+            '/etc/nova/nova.conf': {'content': '[DEFAULT]\n',
+                                    'mode': '0640'},
+        },
+        'seboolean': {'virt_sandbox_use_netlink': {'state': True}},
+    },
+    'neutron': {
+        'directories': {
+            '/var/log/containers/nova': {'setype': 'container_file_t',
+                                         'mode': '0750'},
+            '/var/log/containers/neutron': {},
+        },
+    },
+}
+
+
+class TestTripleoHostPrep(tests_base.TestCase):
+
+    def setUp(self):
+        super(TestTripleoHostPrep, self).setUp()
+        task = mock.MagicMock()
+        task.async_val = 0
+        task.args = {'host_prep_data': HOST_PREP_DATA, 'bundled': True}
+        play_context = mock.MagicMock()
+        play_context.check_mode = False
+        connection = mock.MagicMock()
+        connection._shell.tmpdir = '/tmp/ansible-tmp'
+        connection._shell.join_path.side_effect = lambda *p: '/'.join(p)
+        self.action = tripleo_host_prep.ActionModule(
+            task, connection, play_context, mock.MagicMock(),
+            mock.MagicMock(), mock.MagicMock())
+        self.action._make_tmp_path = mock.MagicMock(
+            return_value='/tmp/ansible-tmp')
+        self.action._remove_tmp_path = mock.MagicMock()
+        self.action._fixup_perms2 = mock.MagicMock()
+        self.action._transfer_data = mock.MagicMock(
+            side_effect=lambda remote_path, data: remote_path)
+        self.module_args = []
+        self.action._execute_module = mock.MagicMock(
+            side_effect=self._execute_module)
+
+    def _execute_module(self, module_name, module_args, task_vars):
+        self.module_args.append((module_name, dict(module_args)))
+        if module_name == 'tripleo_host_prep_apply':
+            return {'changed': True, 'results': [
+                {'type': 'groups', 'name': 'nova', 'changed': True,
+                 'failed': False}]}
+        return {'changed': False}
+
+    def test_run_bundled(self):
+        result = self.action.run(task_vars={})
+
+        self.assertTrue(result['changed'])
+        self.assertEqual(['tripleo_host_prep_apply', 'file',
+                          'tripleo_host_prep_apply',
+                          'ansible.posix.seboolean'],
+                         [name for name, _ in self.module_args])
+        first = self.module_args[0][1]
+        self.assertEqual([{'name': 'nova', 'gid': 42436}], first['groups'])
+        self.assertEqual([{'name': 'nova', 'uid': 42436, 'group': 'nova'}],
+                         first['users'])
+        self.assertEqual(['/var/log/containers/nova'],
+                         [d['path'] for d in first['directories']])
+        self.assertNotIn('archive', first)
+        self.assertEqual({'recurse': True, 'path': '/var/lib/nova',
+                          'state': 'directory'}, self.module_args[1][1])
+
+        second = self.module_args[2][1]
+        self.assertEqual(['/var/log/containers/neutron'],
+                         [d['path'] for d in second['directories']])
+        self.assertEqual([{'dest': '/etc/nova/nova.conf', 'mode': '0640',
+                           'member': 'files/0'}], second['files'])
+        self.assertEqual('/tmp/ansible-tmp/host_prep_files.tar.gz',
+                         second['archive'])
+        data = self.action._transfer_data.call_args[1]['data']
+        with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+            self.assertEqual(b'[DEFAULT]\n',
+                             tar.extractfile('files/0').read())
+        self.assertEqual(2, len(result['results']))
+
+    def test_run_bundled_order(self):
+        self.action._task.args['host_prep_data'] = {'nova': {'directories': {
+            '/var/lib/nova/instances': {'owner': 'nova'},
+            '/var/lib/nova': {'recurse': True, 'owner': 'root'},
+            '/var/lib/nova/instances/locks': {'owner': 'nova'},
+        }}}
+        self.action.run(task_vars={})
+
+        # the fallback item is applied between the bundled ones
+        self.assertEqual(['tripleo_host_prep_apply', 'file',
+                          'tripleo_host_prep_apply'],
+                         [name for name, _ in self.module_args])
+        self.assertEqual(['/var/lib/nova/instances'],
+                         [d['path'] for d in
+                          self.module_args[0][1]['directories']])
+        self.assertEqual('/var/lib/nova', self.module_args[1][1]['path'])
+        self.assertEqual(['/var/lib/nova/instances/locks'],
+                         [d['path'] for d in
+                          self.module_args[2][1]['directories']])
+
+    def test_run_bundled_failure(self):
+        failure = {'failed': True, 'msg': 'Failed to apply groups nova'}
+        self.action._execute_module.side_effect = None
+        self.action._execute_module.return_value = failure
+        result = self.action.run(task_vars={})
+        self.assertEqual(failure, result)
+        self.action._execute_module.assert_called_once()
+        self.action._remove_tmp_path.assert_called_once_with(
+            '/tmp/ansible-tmp')
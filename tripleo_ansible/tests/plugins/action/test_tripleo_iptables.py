@@ -0,0 +1,154 @@
+# Copyright 2021 Red Hat, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from tripleo_ansible.ansible_plugins.action import tripleo_iptables
+from tripleo_ansible.tests import base as tests_base
+
+
+IPTABLES_SAVE = """# Generated by iptables-save v1.8.4 on Tue Mar  2 10:00:00 2021
+*filter
+:INPUT ACCEPT [0:0]
+:FORWARD ACCEPT [0:0]
+:OUTPUT ACCEPT [0:0]
+-A INPUT -m conntrack --ctstate RELATED,ESTABLISHED -m comment --comment "000 accept related established rules ipv4" -j ACCEPT
+-A INPUT -p tcp -m tcp --dport 22 -m conntrack --ctstate NEW -m comment --comment "003 accept ssh ipv4" -j ACCEPT
+-A INPUT -p tcp -m tcp --dport 8080 -m conntrack --ctstate NEW -m comment --comment "004 old service ipv4" -j ACCEPT
+-A INPUT -m conntrack --ctstate NEW -m comment --comment "999 drop all ipv4" -j DROP
+COMMIT
+# Completed on Tue Mar  2 10:00:00 2021
+"""
+
+RULES = [
+    {'rule_name': '000 accept related established rules',
+     'rule': {'proto': 'all', 'state': ['ESTABLISHED', 'RELATED'],
+              'ipversion': 'ipv4'}},
+    {'rule_name': '003 accept ssh',
+     'rule': {'proto': 'tcp', 'dport': 22, 'ipversion': 'ipv4'}},
+    {'rule_name': '004 old service',
+     'rule': {'dport': 8080, 'ipversion': 'ipv4',
+              'extras': {'ensure': 'absent'}}},
+    {'rule_name': '120 iscsi initiator',
+     'rule': {'dport': 3260, 'source': '192.168.24.1'}},
+    {'rule_name': '130 custom chain',
+     'rule': {'dport': '9000-9010', 'chain': 'CUSTOM',
+              'ipversion': 'ipv4'}},
+    {'rule_name': '999 drop all',
+     'rule': {'proto': 'all', 'action': 'drop', 'ipversion': 'ipv4'}},
+]
+
+
+class TestTripleoIptables(tests_base.TestCase):
+
+    def setUp(self):
+        super(TestTripleoIptables, self).setUp()
+        task = mock.MagicMock()
+        task.args = {'tripleo_rules': RULES, 'compiled': True}
+        self.play_context = mock.MagicMock()
+        self.play_context.check_mode = False
+        self.play_context.diff = False
+        self.action = tripleo_iptables.ActionModule(
+            task, mock.MagicMock(), self.play_context, mock.MagicMock(),
+            mock.MagicMock(), mock.MagicMock())
+        self.commands = []
+        self.action._low_level_execute_command = mock.MagicMock(
+            side_effect=self._execute)
+
+    def _execute(self, cmd, in_data=None, **kwargs):
+        self.commands.append((cmd, in_data))
+        if cmd == 'iptables-save':
+            return {'rc': 0, 'stdout': IPTABLES_SAVE, 'stderr': ''}
+        return {'rc': 0, 'stdout': '', 'stderr': ''}
+
+    def test_rule_ip_versions(self):
+        self.assertEqual('ipv4',
+                         tripleo_iptables.address_version('172.17.1.0/24'))
+        self.assertEqual('ipv6',
+                         tripleo_iptables.address_version('fe80::/64'))
+        self.assertIsNone(tripleo_iptables.address_version('controller-0'))
+        self.assertEqual({'ipv4', 'ipv6'},
+                         tripleo_iptables.rule_ip_versions({}))
+        self.assertEqual({'ipv6'}, tripleo_iptables.rule_ip_versions(
+            {'destination': 'fe80::/64'}))
+        self.assertEqual(set(), tripleo_iptables.rule_ip_versions(
+            {'source': '172.17.1.10', 'destination': 'fe80::/64'}))
+        self.assertFalse(tripleo_iptables.ActionModule._check_rule_data(
+            {'source': 'controller-0'}, 'ipv4'))
+
+    def test_parse_ruleset(self):
+        tables = tripleo_iptables.parse_ruleset(
+            '*filter\n:INPUT ACCEPT [0:0]\n:CUSTOM - [0:0]\n'
+            '-A CUSTOM -s 10.0.0.0/8 -p udp -m udp --sport 53 -m comment '
+            '--comment "010 \\"dns\\" ipv4" -j ACCEPT\nCOMMIT\n', 'ipv4')
+        self.assertEqual({'INPUT', 'CUSTOM'}, tables['filter']['chains'])
+        options, spec = tripleo_iptables.compile_rule({
+            'protocol': 'udp', 'jump': 'ACCEPT', 'source': '10.0.0.0/8',
+            'source_port': 53, 'comment': '010 "dns" ipv4'})
+        self.assertEqual(
+            '-p udp -s 10.0.0.0/8 -j ACCEPT --sport 53 -m comment '
+            '--comment "010 \\"dns\\" ipv4"', spec)
+        key = ('CUSTOM', tripleo_iptables._rule_key(options, 'ipv4'))
+        self.assertEqual(1, tables['filter']['rules'][key])
+
+    def test_run_compiled(self):
+        result = self.action.run(task_vars={})
+
+        self.assertTrue(result['changed'])
+        self.assertEqual(['iptables-save', 'iptables-restore --noflush'],
+                         [cmd for cmd, _ in self.commands])
+        self.assertEqual(
+            '*filter\n'
+            ':CUSTOM - [0:0]\n'
+            '-D INPUT -p tcp -j ACCEPT --dport 8080 -m conntrack '
+            '--ctstate NEW -m comment --comment "004 old service ipv4"\n'
+            '-I INPUT 1 -p tcp -s 192.168.24.1 -j ACCEPT --dport 3260 '
+            '-m conntrack --ctstate NEW -m comment '
+            '--comment "120 iscsi initiator ipv4"\n'
+            '-I CUSTOM 1 -p tcp -j ACCEPT --dport 9000:9010 -m conntrack '
+            '--ctstate NEW -m comment --comment "130 custom chain ipv4"\n'
+            'COMMIT\n', self.commands[1][1])
+        self.assertEqual(
+            [('delete', '004 old service ipv4'),
+             ('insert', '120 iscsi initiator ipv4'),
+             ('create chain', None),
+             ('insert', '130 custom chain ipv4')],
+            [(i['change'], i.get('rule')) for i in result['rule_diffs']])
+        self.assertIn('read', result['timings'])
+
+    def test_run_compiled_unchanged(self):
+        self.action._task.args['tripleo_rules'] = RULES[:3]
+        self.action._task.args['tripleo_rules'][2] = {
+            'rule_name': '004 old service',
+            'rule': {'port': 8080, 'ipversion': 'ipv4'}}
+        result = self.action.run(task_vars={})
+        self.assertFalse(result['changed'])
+        self.assertEqual([], result['rule_diffs'])
+        self.assertEqual([('iptables-save', None)], self.commands)
+
+    def test_run_compiled_check_mode(self):
+        self.play_context.check_mode = True
+        self.play_context.diff = True
+        result = self.action.run(task_vars={})
+        self.assertTrue(result['changed'])
+        self.assertEqual([('iptables-save', None)], self.commands)
+        self.assertIn('-I INPUT 1', result['diff']['prepared'])
+
+    def test_run_compiled_failure(self):
+        self.action._low_level_execute_command.side_effect = None
+        self.action._low_level_execute_command.return_value = {
+            'rc': 1, 'stdout': '', 'stderr': 'Permission denied'}
+        result = self.action.run(task_vars={})
+        self.assertTrue(result['failed'])
@@ -16,6 +16,7 @@
 from ansible import errors
 
 from tripleo_ansible.ansible_plugins.filter import helpers
+from tripleo_ansible.ansible_plugins.module_utils import container_configs
 from tripleo_ansible.tests import base as tests_base
 
 
@@ -731,6 +732,74 @@ class TestHelperFilters(tests_base.TestCase):
                                            config_id='tripleo_step1')
         self.assertEqual(result, expected_list)
 
+    def test_needs_delete_duplicates(self):
+        data = [
+            {
+                'Name': 'heat',
+                'Config': {
+                    'Labels': {
+                        'managed_by': 'tripleo_ansible',
+                        'config_id': 'tripleo_step1',
+                        'config_data': "{'start_order': 1}"
+                    }
+                }
+            },
+            {
+                'Name': 'heat',
+                'Config': {
+                    'Labels': {
+                        'managed_by': 'tripleo_ansible',
+                        'config_id': 'tripleo_step1',
+                        'config_data': "{'start_order': 0}"
+                    }
+                }
+            },
+            {
+                'Name': 'broken',
+                'Config': {
+                    'Labels': {
+                        'managed_by': 'tripleo_ansible',
+                        'config_id': 'tripleo_step1'
+                    }
+                }
+            },
+        ]
+        config = {'heat': {'start_order': 1}}
+        helpers._parse_config_data.cache_clear()
+        for _ in range(2):
+            result = self.filters.needs_delete(container_infos=data,
+                                               config=config,
+                                               config_id='tripleo_step1',
+                                               clean_orphans=True)
+            self.assertEqual(['broken', 'heat', 'broken'], result)
+        # the labels are only parsed once
+        self.assertEqual(2, helpers._parse_config_data.cache_info().misses)
+        self.assertEqual(2, helpers._parse_config_data.cache_info().hits)
+
+    def test_needs_delete_config_digest(self):
+        digest = container_configs.config_digest({'start_order': 1})
+        data = [
+            {
+                'Name': name,
+                'Config': {
+                    'Labels': {
+                        'managed_by': 'tripleo_ansible',
+                        'config_id': 'tripleo_step1',
+                        # not parsed when there is a digest
+                        'config_data': 'invalid',
+                        'config_digest': digest
+                    }
+                }
+            } for name in ('heat', 'nova')
+        ]
+        config = {'heat': {'start_order': 1}, 'nova': {'start_order': 2}}
+        helpers._parse_config_data.cache_clear()
+        result = self.filters.needs_delete(container_infos=data,
+                                           config=config,
+                                           config_id='tripleo_step1')
+        self.assertEqual(['nova'], result)
+        self.assertEqual(0, helpers._parse_config_data.cache_info().misses)
+
     def test_get_key_from_dict(self):
         data = {
            'nova_api': {
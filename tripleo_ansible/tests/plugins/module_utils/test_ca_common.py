@@ -0,0 +1,108 @@
+# Copyright 2021 Red Hat, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from tripleo_ansible.tests import base
+
+from tripleo_ansible.ansible_plugins.module_utils import ca_common  # noqa
+
+IMAGE = 'quay.io/ceph/ceph:v16'
+
+
+class TestExecCommand(base.TestCase):
+
+    def setUp(self):
+        super(TestExecCommand, self).setUp()
+        self.module = mock.MagicMock()
+        self.module.run_command.return_value = (0, 'out', '')
+        env = mock.patch.dict('os.environ',
+                              {'CEPH_CONTAINER_BINARY': 'podman'})
+        env.start()
+        self.addCleanup(env.stop)
+        stats = mock.patch.dict(ca_common.CLI_STATS, container_starts=0,
+                                commands=0, cli_time=0.0)
+        stats.start()
+        self.addCleanup(stats.stop)
+        sessions = mock.patch.object(ca_common, '_exec_sessions', {})
+        sessions.start()
+        self.addCleanup(sessions.stop)
+
+    def _ceph_cmd(self, args, spec_path=None, interactive=False):
+        return ca_common.generate_ceph_cmd(
+            ['osd', 'pool'], args, spec_path, container_image=IMAGE,
+            interactive=interactive)
+
+    def test_run(self):
+        cmd = self._ceph_cmd(['ls'])
+        for _ in range(2):
+            rc, _cmd, out, err = ca_common.exec_command(self.module, cmd)
+        self.assertEqual((0, cmd, 'out'), (rc, _cmd, out))
+        self.module.run_command.assert_called_with(
+            cmd, data=None, binary_data=False)
+        self.assertEqual(2, self.module.run_command.call_count)
+        self.assertEqual({'container_starts': 2, 'commands': 2},
+                         {k: v for k, v in ca_common.cli_stats().items()
+                          if k != 'cli_time'})
+
+    @mock.patch.dict('os.environ', {'CEPH_CONTAINER_EXEC_SESSION': 'True'})
+    @mock.patch('atexit.register')
+    def test_session(self, mock_register):
+        cmd = self._ceph_cmd(['ls'])
+        ca_common.exec_command(self.module, cmd)
+        rc, _cmd, out, err = ca_common.exec_command(
+            self.module, self._ceph_cmd(['create', 'vms'], interactive=True),
+            stdin='data')
+
+        session = list(ca_common._exec_sessions.values())[0]
+        calls = [c[0][0] for c in self.module.run_command.call_args_list]
+        self.assertEqual(3, len(calls))
+        self.assertEqual(['podman', 'run', '--detach', '--rm', '--name',
+                          session.name, '--net=host'], calls[0][:7])
+        self.assertEqual(['--entrypoint=sleep', IMAGE, '600'], calls[0][-3:])
+        self.assertEqual(['podman', 'exec', session.name, 'ceph', '-n',
+                          'client.admin'], calls[1][:6])
+        self.assertEqual(['podman', 'exec', '--interactive', session.name,
+                          'ceph'], calls[2][:5])
+        self.assertEqual(['create', 'vms'], calls[2][-2:])
+        self.assertEqual('data',
+                         self.module.run_command.call_args[1]['data'])
+        self.assertEqual(1, ca_common.cli_stats()['container_starts'])
+        self.assertEqual(2, ca_common.cli_stats()['commands'])
+        # the original command line is returned
+        self.assertEqual('run', _cmd[1])
+
+        mock_register.assert_called_once_with(session.stop)
+        session.stop()
+        self.module.run_command.assert_called_with(
+            ['podman', 'kill', session.name])
+
+    @mock.patch.dict('os.environ', {'CEPH_CONTAINER_EXEC_SESSION': 'True'})
+    def test_session_fallback(self):
+        # the session fails to start
+        self.module.run_command.side_effect = [(125, '', 'error'),
+                                               (0, 'out', '')]
+        cmd = self._ceph_cmd(['ls'])
+        ca_common.exec_command(self.module, cmd)
+        self.module.run_command.assert_called_with(
+            cmd, data=None, binary_data=False)
+        self.assertEqual(2, ca_common.cli_stats()['container_starts'])
+
+        # other volumes than the session ones are needed
+        self.module.run_command.side_effect = None
+        cmd = self._ceph_cmd(['ls'], spec_path='/home/ceph_spec.yaml')
+        session = ca_common.get_exec_session(self.module, cmd)
+        session.running = True
+        self.assertIsNone(session.exec_cmd(cmd))
@@ -0,0 +1,81 @@
+# Copyright 2021 Red Hat, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import json
+import os
+import shutil
+import tempfile
+
+from tripleo_ansible.tests import base
+
+from tripleo_ansible.ansible_plugins.module_utils import container_configs  # noqa
+
+
+class TestConfigDigest(base.TestCase):
+
+    def test_config_digest(self):
+        digest = container_configs.config_digest(
+            {'image': 'keystone', 'volumes': ['/a:/a'], 'start_order': 1})
+        self.assertEqual(64, len(digest))
+        self.assertEqual(digest, container_configs.config_digest(
+            {'start_order': 1, 'volumes': ['/a:/a'], 'image': 'keystone'}))
+        self.assertNotEqual(digest, container_configs.config_digest(
+            {'image': 'keystone', 'volumes': ['/a:/a'], 'start_order': 2}))
+
+    def test_parse_config_data(self):
+        config = {'image': 'mysql', 'privileged': True, 'start_order': 1}
+        self.assertEqual(config,
+                         container_configs.parse_config_data(repr(config)))
+        self.assertIsNone(container_configs.parse_config_data('invalid'))
+        self.assertIsNone(container_configs.parse_config_data(None))
+
+
+class TestConfigLoader(base.TestCase):
+
+    def setUp(self):
+        super(TestConfigLoader, self).setUp()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.config_dir = os.path.join(self.tmp_dir, 'step_1')
+        os.mkdir(self.config_dir)
+        self._write('haproxy', {'image': 'haproxy', 'start_order': 0})
+        self._write('keystone', {'image': 'keystone', 'start_order': 1})
+
+    def _write(self, name, config):
+        path = os.path.join(self.config_dir, name + '.json')
+        with open(path, 'w') as f:
+            json.dump(config, f)
+
+    def _loader(self, **kwargs):
+        return container_configs.ConfigLoader(self.config_dir, **kwargs)
+
+    def test_get_configs(self):
+        loader = self._loader()
+        configs = loader.get_configs({'keystone': {'image': 'keystone:new'},
+                                      'nova': {'image': 'nova'}})
+        self.assertEqual({
+            'haproxy': {'image': 'haproxy', 'start_order': 0},
+            'keystone': {'image': 'keystone:new', 'start_order': 1},
+        }, configs)
+        self.assertEqual(2, loader.parsed)
+        # overrides do not leak into the configs
+        self.assertEqual('keystone', self._loader().get_configs()[
+            'keystone']['image'])
+
+    def test_get_configs_pattern(self):
+        loader = container_configs.ConfigLoader(self.config_dir,
+                                                'haproxy.json')
+        self.assertEqual(['haproxy'], list(
+            name for name, _ in loader.iter_configs()))
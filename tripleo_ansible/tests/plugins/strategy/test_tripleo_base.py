@@ -0,0 +1,377 @@
+# Copyright 2021 Red Hat, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import json
+import os
+import shutil
+import tempfile
+
+import mock
+
+from tripleo_ansible.ansible_plugins.strategy import tripleo_base
+from tripleo_ansible.tests import base as tests_base
+
+
+class TestStrategyProfiler(tests_base.TestCase):
+
+    def test_disabled(self):
+        profiler = tripleo_base.StrategyProfiler()
+        self.assertIs(tripleo_base.NOOP_PHASE,
+                      profiler.phase('templating', 'host-0'))
+        with profiler.phase('templating', 'host-0'):
+            pass
+        self.assertEqual({}, profiler.profile()['totals'])
+
+    def test_dump(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, 'profile.json')
+        profiler = tripleo_base.StrategyProfiler(path)
+        task = mock.MagicMock()
+        task.get_name.return_value = 'Run puppet'
+        profiler.add('templating', 0.25, 'host-0', task)
+        profiler.add('templating', 0.5, 'host-1', task)
+        profiler.add('results', 1.0)
+        with profiler.phase('iterator', 'host-0'):
+            pass
+
+        profiler.dump('Deploy step 1')
+        profiler.dump('Deploy step 2')
+
+        with open(path) as f:
+            profiles = [json.loads(line) for line in f]
+        self.assertEqual(2, len(profiles))
+        profile = profiles[0]
+        self.assertEqual('Deploy step 1', profile['play'])
+        self.assertEqual(0.75, profile['totals']['templating'])
+        self.assertEqual(2, profile['counts']['templating'])
+        self.assertEqual(1, profile['counts']['iterator'])
+        self.assertEqual(0.5, profile['hosts']['host-1']['templating'])
+        self.assertEqual({'templating': 0.75},
+                         profile['tasks']['Run puppet'])
+        with open(path + '.folded') as f:
+            folded = f.read().splitlines()
+        self.assertIn('Deploy_step_1;host-0;templating 250000', folded)
+        self.assertIn('Deploy_step_1;results 1000000', folded)
+
+
+def _include(filename, hosts, args=None, task_uuid='task-1'):
+    include = mock.MagicMock()
+    include._filename = filename
+    include._args = args or {}
+    include._vars = {}
+    include._is_role = False
+    include._task._uuid = task_uuid
+    include._task._parent._uuid = 'block-1'
+    include._hosts = hosts
+    return include
+
+
+class TestIncludeCache(tests_base.TestCase):
+
+    def test_get_set(self):
+        cache = tripleo_base.IncludeCache(size=2)
+        step1 = _include('step1.yaml', ['host-0'])
+        self.assertIsNone(cache.get(step1))
+        cache.set(step1, ['block'])
+        # other hosts reaching the same include share its blocks
+        self.assertEqual(['block'],
+                         cache.get(_include('step1.yaml', ['host-1'])))
+        self.assertIsNone(cache.get(
+            _include('step1.yaml', ['host-1'], args={'step': 2})))
+        self.assertIsNone(cache.get(
+            _include('step1.yaml', ['host-1'], task_uuid='task-2')))
+        self.assertEqual((1, 3), (cache.hits, cache.misses))
+
+    def test_size(self):
+        cache = tripleo_base.IncludeCache(size=2)
+        for name in ('step1.yaml', 'step2.yaml', 'step3.yaml'):
+            cache.set(_include(name, []), [name])
+        self.assertIsNone(cache.get(_include('step1.yaml', [])))
+        self.assertEqual(['step3.yaml'],
+                         cache.get(_include('step3.yaml', [])))
+
+
+class TestProcessIncludes(tests_base.TestCase):
+
+    def setUp(self):
+        super(TestProcessIncludes, self).setUp()
+        tripleo_base.INCLUDE_CACHE.clear()
+        self.addCleanup(tripleo_base.INCLUDE_CACHE.clear)
+        self.strategy = tripleo_base.TripleoBase.__new__(
+            tripleo_base.TripleoBase)
+        self.strategy._profiler = tripleo_base.StrategyProfiler()
+        self.strategy._iterator = mock.MagicMock()
+        self.strategy._tqm = mock.MagicMock()
+        self.strategy._loader = mock.MagicMock()
+        self.strategy._variable_manager = mock.MagicMock()
+        self.strategy._has_hosts_cache = False
+        self.strategy._has_hosts_cache_all = False
+        self.strategy._failures_iterator = None
+        self.strategy._tqm._failed_hosts = {}
+        self.hosts = [mock.MagicMock() for _ in range(3)]
+        for i, host in enumerate(self.hosts):
+            host.get_name.return_value = 'host-{}'.format(i)
+        self.strategy._hosts_left = self.hosts
+        self.block = mock.MagicMock()
+        self.strategy._load_included_file = mock.MagicMock(
+            return_value=[self.block])
+
+    @mock.patch.object(tripleo_base.IncludedFile, 'process_include_results')
+    def test_process_includes(self, mock_results):
+        mock_results.side_effect = [
+            [_include('step1.yaml', self.hosts[:1])],
+            [_include('step1.yaml', self.hosts[1:])],
+        ]
+        self.assertTrue(self.strategy._process_includes([]))
+        self.assertTrue(self.strategy._process_includes([]))
+
+        self.strategy._load_included_file.assert_called_once()
+        self.block.filter_tagged_tasks.assert_called_once()
+        final_block = self.block.filter_tagged_tasks.return_value
+        add_tasks = self.strategy._iterator.add_tasks
+        add_tasks.assert_any_call(self.hosts[0], [final_block])
+        add_tasks.assert_any_call(self.hosts[2], [final_block])
+        self.strategy._tqm.send_callback.assert_called_once_with(
+            'v2_playbook_on_include', mock.ANY)
+        self.assertEqual({'include_cache_hits': 1,
+                          'include_cache_misses': 1},
+                         dict(self.strategy._profiler.counters))
+
+    @mock.patch.object(tripleo_base.IncludedFile, 'process_include_results')
+    def test_process_includes_failed_load(self, mock_results):
+        mock_results.side_effect = [
+            [_include('step1.yaml', self.hosts[:1])],
+            [_include('step1.yaml', self.hosts[1:2])],
+        ]
+
+        def load_failed(include, iterator):
+            for host in include._hosts:
+                self.strategy._tqm._failed_hosts[host.get_name()] = True
+            return []
+
+        self.strategy._load_included_file.side_effect = load_failed
+        with mock.patch.object(self.strategy,
+                               '_update_failures') as update_failures:
+            self.strategy._process_includes([])
+            self.strategy._process_includes([])
+        self.assertEqual(2, self.strategy._load_included_file.call_count)
+        update_failures.assert_called_with(self.hosts[1:2])
+
+    @mock.patch.object(tripleo_base.IncludedFile, 'process_include_results')
+    def test_process_includes_empty(self, mock_results):
+        mock_results.side_effect = [
+            [_include('step1.yaml', self.hosts[:1])],
+            [_include('step1.yaml', self.hosts[1:2])],
+        ]
+        self.strategy._load_included_file.return_value = []
+        with mock.patch.object(self.strategy,
+                               '_update_failures') as update_failures:
+            self.assertTrue(self.strategy._process_includes([]))
+            self.assertTrue(self.strategy._process_includes([]))
+        # a valid empty include is cached and fails no host
+        self.strategy._load_included_file.assert_called_once()
+        update_failures.assert_called_with([])
+        self.strategy._iterator.add_tasks.assert_any_call(self.hosts[1], [])
+        # and is not accounted when served from the cache
+        self.strategy._tqm._stats.increment.assert_not_called()
+        self.strategy._tqm.send_callback.assert_not_called()
+
+    @mock.patch.object(tripleo_base.IncludedFile, 'process_include_results')
+    def test_process_includes_role(self, mock_results):
+        role = _include('r', self.hosts[:1])
+        role._is_role = True
+        mock_results.side_effect = [[role], [role]]
+        with mock.patch.object(self.strategy, '_compile_include',
+                               return_value=[self.block]) as compile_include:
+            self.strategy._process_includes([])
+            self.strategy._process_includes([])
+        # roles are loaded again to register their handlers
+        self.assertEqual(2, compile_include.call_count)
+        self.assertEqual((0, 0), (tripleo_base.INCLUDE_CACHE.hits,
+                                  tripleo_base.INCLUDE_CACHE.misses))
+
+
+class FakeHost(object):
+
+    def __init__(self, name):
+        self.name = name
+
+    def __hash__(self):
+        return hash(self.name)
+
+    def __eq__(self, other):
+        return self.name == other.name
+
+
+class TestFailures(tests_base.TestCase):
+
+    def setUp(self):
+        super(TestFailures, self).setUp()
+        self.strategy = tripleo_base.TripleoBase.__new__(
+            tripleo_base.TripleoBase)
+        self.strategy._fail_cache = {}
+        self.strategy._failures_iterator = None
+        self.strategy._groups_dict = None
+        self.strategy._group_sizes = {}
+        self.hosts = dict(
+            (name, FakeHost(name)) for name in (
+                'controller-0', 'controller-1', 'compute-0', 'compute-1',
+                'compute-2', 'compute-3'))
+        self.groups = {
+            'Controller': ['controller-0', 'controller-1'],
+            'Compute': ['compute-0', 'compute-1', 'compute-2', 'compute-3'],
+        }
+        self.failed = set()
+        self.strategy._tqm = mock.MagicMock()
+        self.strategy._tqm._failed_hosts = {}
+        self.strategy._iterator = mock.MagicMock()
+        self.strategy._iterator.get_failed_hosts.side_effect = (
+            lambda: dict((name, True) for name in self.failed))
+        self.strategy._iterator.is_failed.side_effect = (
+            lambda host: host.name in self.failed)
+        self.strategy._inventory = mock.MagicMock()
+        self.strategy._inventory.get_host.side_effect = self.hosts.get
+        self.strategy._inventory.get_groups_dict.side_effect = (
+            lambda: self.groups)
+        self.strategy._variable_manager = mock.MagicMock()
+        self.strategy._variable_manager.get_vars.side_effect = (
+            lambda play, host, task: {
+                'max_fail_percentage': 30,
+                'tripleo_role_name': ('Controller'
+                                      if host.name.startswith('controller')
+                                      else 'Compute')})
+
+    def _fail(self, *names):
+        self.failed.update(names)
+        self.strategy._update_failures(self.hosts[n] for n in names)
+
+    def test_get_current_failures(self):
+        self.failed.add('compute-0')
+        self.assertEqual({'Compute': 1},
+                         self.strategy._get_current_failures())
+        self._fail('controller-0', 'compute-1')
+        self.assertEqual({'Compute': 2, 'Controller': 1},
+                         self.strategy._get_current_failures())
+        # counted from the iterator only once
+        self.strategy._iterator.get_failed_hosts.assert_called_once()
+
+        # recovered
+        self.failed.discard('controller-0')
+        self.strategy._update_failures([self.hosts['controller-0']])
+        self.assertEqual({'Compute': 2},
+                         self.strategy._get_current_failures())
+
+        # e.g. clear_host_errors
+        self.failed.clear()
+        self.strategy._reset_failures()
+        self.assertEqual({}, self.strategy._get_current_failures())
+
+    def _result(self, name, run_once=False):
+        result = mock.MagicMock()
+        result._host = self.hosts[name]
+        result._task.run_once = run_once
+        result._task.ignore_errors = False
+        result.is_failed.return_value = name in self.failed
+        return result
+
+    def test_run_once_failure(self):
+        self._fail('compute-0')
+        self.assertEqual({'Compute': 1},
+                         self.strategy._get_current_failures())
+        # a failed run_once task marks every host of the play failed
+        self.failed.update(self.hosts)
+        self.strategy._update_result_failures(
+            [self._result('controller-0', run_once=True)])
+        self.assertEqual({'Compute': 4, 'Controller': 2},
+                         self.strategy._get_current_failures())
+        self.assertEqual(2, self.strategy._iterator.get_failed_hosts
+                         .call_count)
+
+    def test_failed_hosts_changed(self):
+        self.assertEqual({}, self.strategy._get_current_failures())
+        self.failed.update(['compute-0', 'compute-1', 'controller-0'])
+        self.strategy._tqm._failed_hosts.update(
+            dict((name, True) for name in self.failed))
+        # more hosts failed than got a result
+        self.strategy._update_result_failures([self._result('compute-0')])
+        self.assertEqual({'Compute': 2, 'Controller': 1},
+                         self.strategy._get_current_failures())
+
+        self.failed.add('compute-2')
+        self.strategy._tqm._failed_hosts['compute-2'] = True
+        self.strategy._update_result_failures([self._result('compute-2')])
+        self.assertEqual({'Compute': 3, 'Controller': 1},
+                         self.strategy._get_current_failures())
+        self.assertEqual(2, self.strategy._iterator.get_failed_hosts
+                         .call_count)
+
+    def test_check_fail_percent(self):
+        compute = self.hosts['compute-0']
+        self._fail('compute-0')
+        failures = self.strategy._get_current_failures()
+        self.assertFalse(self.strategy._check_fail_percent(compute, failures))
+        self._fail('compute-1')
+        self.assertTrue(self.strategy._check_fail_percent(compute, failures))
+        self.strategy._inventory.get_groups_dict.assert_called_with()
+        self.assertEqual({'Compute': 4}, self.strategy._group_sizes)
+
+        # the inventory changed
+        self.groups = dict(self.groups)
+        self.groups['Compute'] = self.groups['Compute'] + ['compute-4',
+                                                           'compute-5',
+                                                           'compute-6']
+        self.assertFalse(self.strategy._check_fail_percent(compute, failures))
+
+
+ROLE_PLAY = """
+- hosts: all
+  gather_facts: false
+  serial: 1
+  strategy: {}
+  tasks:
+    - include_role:
+        name: notifier
+"""
+
+
+class TestRoleHandlersPlay(tests_base.PlaybookTestCase):
+
+    def setUp(self):
+        super(TestRoleHandlersPlay, self).setUp()
+        self.write_file('roles/notifier/tasks/main.yml', (
+            '- debug:\n'
+            '    msg: notify\n'
+            '  changed_when: true\n'
+            '  notify: notifier handler\n'))
+        self.write_file('roles/notifier/handlers/main.yml', (
+            '- name: notifier handler\n'
+            '  debug:\n'
+            '    msg: handled\n'))
+
+    def _run(self, strategy):
+        stats = self.run_playbook(ROLE_PLAY.format(strategy),
+                                  ['host-0', 'host-1'])
+        # the handler of the role is found in every serial batch
+        self.assertEqual(['host-0', 'host-1'], sorted(stats))
+        for host_stats in stats.values():
+            self.assertEqual(2, host_stats['ok'])
+            self.assertEqual(0, host_stats['failures'])
+
+    def test_linear(self):
+        self._run('tripleo_linear')
+
+    def test_free(self):
+        self._run('tripleo_free')
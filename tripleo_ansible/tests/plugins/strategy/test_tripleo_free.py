@@ -0,0 +1,199 @@
+# Copyright 2021 Red Hat, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import threading
+
+import mock
+
+from tripleo_ansible.ansible_plugins.strategy import tripleo_free
+from tripleo_ansible.ansible_plugins.strategy.tripleo_base import (
+    StrategyProfiler)
+from tripleo_ansible.tests import base as tests_base
+
+
+class TestResultsQueue(tests_base.TestCase):
+
+    def test_append_notifies(self):
+        condition = threading.Condition(threading.Lock())
+        results = tripleo_free._ResultsQueue(condition)
+        timer = threading.Timer(0.01, self._append, (condition, results))
+        with condition:
+            timer.start()
+            self.assertTrue(condition.wait(5))
+        self.assertEqual(['result'], list(results))
+
+    def _append(self, condition, results):
+        with condition:
+            results.append('result')
+
+
+class TestTaskTemplateCache(tests_base.TestCase):
+
+    def setUp(self):
+        super(TestTaskTemplateCache, self).setUp()
+        self.profiler = StrategyProfiler()
+        self.cache = tripleo_free.TaskTemplateCache(self.profiler)
+        self.task = mock.MagicMock()
+        self.task._uuid = 'task-1'
+        self.task.name = 'Run step 1'
+        self.task.run_once = '{{ inventory_hostname == "host-0" }}'
+        self.task.throttle = 0
+
+    def test_is_static(self):
+        self.assertTrue(tripleo_free._is_static('Run step 1'))
+        self.assertTrue(tripleo_free._is_static(None))
+        self.assertTrue(tripleo_free._is_static(True))
+        self.assertTrue(tripleo_free._is_static(5))
+        self.assertFalse(tripleo_free._is_static('Run step {{ step }}'))
+        self.assertFalse(tripleo_free._is_static('{% if x %}a{% endif %}'))
+        self.assertFalse(tripleo_free._is_static(['a']))
+
+    def test_static(self):
+        templar = mock.MagicMock()
+        for _ in range(3):
+            self.assertEqual('Run step 1', self.cache.template(
+                self.task, 'name', templar, fail_on_undefined=False))
+            self.assertEqual(0, self.cache.template(
+                self.task, 'throttle', templar, int))
+        templar.template.assert_not_called()
+        self.assertEqual((4, 2), (self.cache.hits, self.cache.misses))
+        self.assertEqual({'template_cache_hits': 4,
+                          'template_cache_misses': 2},
+                         dict(self.profiler.counters))
+
+        # the raw value changed
+        self.task.name = 'Run step 2'
+        self.assertEqual('Run step 2', self.cache.template(
+            self.task, 'name', templar))
+
+    def test_templated(self):
+        templar = mock.MagicMock()
+        templar.template.side_effect = [True, False]
+        self.assertTrue(self.cache.template(self.task, 'run_once', templar))
+        self.assertFalse(self.cache.template(self.task, 'run_once', templar))
+        self.assertEqual(2, templar.template.call_count)
+        self.assertEqual((0, 0), (self.cache.hits, self.cache.misses))
+
+    @mock.patch.object(tripleo_free, 'Templar')
+    def test_lazy_templar(self, mock_templar):
+        templar = tripleo_free._LazyTemplar('loader', {'step': 1})
+        self.cache.template(self.task, 'name', templar)
+        mock_templar.assert_not_called()
+        self.cache.template(self.task, 'run_once', templar)
+        self.cache.template(self.task, 'run_once', templar)
+        mock_templar.assert_called_once_with(loader='loader',
+                                             variables={'step': 1})
+
+
+class TestProcessEvents(tests_base.TestCase):
+
+    def setUp(self):
+        super(TestProcessEvents, self).setUp()
+        self.hosts = [mock.MagicMock() for _ in range(3)]
+        for i, host in enumerate(self.hosts):
+            host.get_name.return_value = 'host-{}'.format(i)
+        strategy = tripleo_free.StrategyModule.__new__(
+            tripleo_free.StrategyModule)
+        strategy._tqm = mock.MagicMock()
+        strategy._tqm.RUN_OK = 0
+        strategy._tqm._unreachable_hosts = {}
+        strategy._iterator = mock.MagicMock()
+        strategy._profiler = StrategyProfiler()
+        strategy._hosts_left = self.hosts
+        strategy._host_pinned = False
+        strategy._workers_free = 10
+        strategy._blocked_hosts = {}
+        strategy._pending_results = 0
+        strategy._results_lock = threading.Condition(threading.Lock())
+        strategy._results = tripleo_free._ResultsQueue(
+            strategy._results_lock)
+        strategy._event_driven = True
+        strategy._ready_hosts = collections.deque()
+        strategy._ready_set = set()
+        strategy._has_work = False
+        strategy._advance_host = mock.MagicMock(
+            side_effect=self._advance_host)
+        strategy._process_pending_results = mock.MagicMock(return_value=[])
+        strategy._check_failures = mock.MagicMock(return_value=False)
+        strategy.update_active_connections = mock.MagicMock()
+        self.strategy = strategy
+
+    def _advance_host(self, host, task):
+        self.strategy._blocked_hosts[host.get_name()] = True
+        self.strategy._pending_results += 1
+        self.strategy._workers_free -= 1
+
+    def test_only_ready_hosts(self):
+        self.strategy._iterator.get_next_task_for_host.return_value = (
+            None, 'task')
+        self.strategy._set_ready(self.hosts[1])
+        self.strategy._set_ready(self.hosts[1])
+        result = mock.MagicMock()
+        result._host = self.hosts[1]
+        self.strategy._process_pending_results.return_value = [result]
+        with mock.patch.object(self.strategy, '_wait_for_results',
+                               return_value=True) as mock_wait:
+            self.strategy.process_events()
+
+        self.strategy._advance_host.assert_called_once_with(
+            self.hosts[1], 'task')
+        mock_wait.assert_called_once_with(tripleo_free.EVENT_TIMEOUT)
+        self.assertTrue(self.strategy._has_work)
+        self.assertEqual([self.hosts[1]],
+                         list(self.strategy._ready_hosts))
+        self.assertEqual([result], self.strategy._strat_results)
+        self.assertEqual(10, self.strategy._workers_free)
+
+    def test_no_more_tasks(self):
+        self.strategy._iterator.get_next_task_for_host.return_value = (
+            None, None)
+        for host in self.hosts:
+            self.strategy._set_ready(host)
+        self.strategy.process_events()
+        self.strategy._advance_host.assert_not_called()
+        self.assertFalse(self.strategy._has_work)
+        self.assertEqual(0, len(self.strategy._ready_hosts))
+
+    def test_wait_timeout(self):
+        self.strategy._pending_results = 1
+        self.strategy._iterator.get_next_task_for_host.return_value = (
+            None, 'task')
+        with mock.patch.object(tripleo_free, 'EVENT_TIMEOUT', 0.01):
+            self.strategy.process_events()
+        # all the hosts are looked at again after the timeout
+        self.assertEqual(self.hosts, list(self.strategy._ready_hosts))
+
+
+PLAY = """
+- hosts: all
+  gather_facts: false
+  strategy: tripleo_free
+  tasks:
+    - debug:
+        msg: step 1
+    - debug:
+        msg: step 2
+"""
+
+
+class TestEventPlay(tests_base.PlaybookTestCase):
+
+    def test_run(self):
+        stats = self.run_playbook(PLAY, ['host-0', 'host-1'],
+                                  env={tripleo_free.WAKEUP_ENV: 'event'})
+        self.assertEqual(['host-0', 'host-1'], sorted(stats))
+        for host_stats in stats.values():
+            self.assertEqual(2, host_stats['ok'])
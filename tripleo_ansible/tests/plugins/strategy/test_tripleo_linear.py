@@ -0,0 +1,169 @@
+# Copyright 2021 Red Hat, Inc.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+
+import mock
+
+from ansible.executor.play_iterator import PlayIterator
+
+from tripleo_ansible.ansible_plugins.strategy import tripleo_linear
+from tripleo_ansible.ansible_plugins.strategy.tripleo_base import (
+    StrategyProfiler)
+from tripleo_ansible.tests import base as tests_base
+
+TASKS = PlayIterator.ITERATING_TASKS
+RESCUE = PlayIterator.ITERATING_RESCUE
+COMPLETE = PlayIterator.ITERATING_COMPLETE
+
+State = collections.namedtuple('State', ['cur_block', 'run_state'])
+
+
+class FakeHost(object):
+
+    def __init__(self, name):
+        self.name = name
+
+    def get_name(self):
+        return self.name
+
+
+class FakeTask(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.action = 'command'
+
+    def __repr__(self):
+        return self.name
+
+
+class FakeIterator(object):
+    """Iterate over the (cur_block, run_state, task name) steps of hosts"""
+
+    def __init__(self, steps):
+        self.steps = steps
+        self.position = dict((name, 0) for name in steps)
+        self.peeks = collections.Counter()
+
+    def get_next_task_for_host(self, host, peek=False):
+        position = self.position[host.name]
+        if peek:
+            self.peeks[host.name] += 1
+        else:
+            self.position[host.name] += 1
+        if position >= len(self.steps[host.name]):
+            return (State(len(self.steps[host.name]), COMPLETE), None)
+        cur_block, run_state, task = self.steps[host.name][position]
+        return (State(cur_block, run_state), FakeTask(task))
+
+    def get_active_state(self, state):
+        return state
+
+
+class TestGetNextTasks(tests_base.TestCase):
+
+    def setUp(self):
+        super(TestGetNextTasks, self).setUp()
+        self.strategy = tripleo_linear.StrategyModule.__new__(
+            tripleo_linear.StrategyModule)
+        self.strategy.__dict__.update(
+            _index_iterator=None, _host_tasks={}, _host_keys={},
+            _host_buckets={}, _changed_hosts=set(), _host_order={},
+            _hosts_by_name={}, _profiler=StrategyProfiler())
+        self.hosts = [FakeHost('host-{}'.format(i)) for i in range(3)]
+
+    def _waves(self):
+        waves = []
+        while True:
+            wave = [(host.name, task and task.name) for host, task in
+                    self.strategy._get_next_tasks(self.hosts)]
+            if all(task is None for _, task in wave):
+                return waves
+            waves.append(wave)
+
+    def test_waves(self):
+        self.strategy._iterator = FakeIterator({
+            'host-0': [(0, TASKS, 'a'), (0, TASKS, 'b'), (1, TASKS, 'c')],
+            'host-1': [(0, TASKS, 'a'), (0, RESCUE, 'r'), (1, TASKS, 'c')],
+            'host-2': [(1, TASKS, 'c')],
+        })
+        self.assertEqual([
+            [('host-0', 'a'), ('host-1', 'a')],
+            [('host-0', 'b')],
+            [('host-1', 'r')],
+            [('host-0', 'c'), ('host-1', 'c'), ('host-2', 'c')],
+        ], self._waves())
+        # host-2 only got peeked again after running its task
+        self.assertEqual(2, self.strategy._iterator.peeks['host-2'])
+        self.assertEqual({}, self.strategy._host_buckets)
+
+    def test_reset(self):
+        steps = {'host-0': [(0, TASKS, 'a'), (0, TASKS, 'b')],
+                 'host-1': [(0, TASKS, 'a'), (0, TASKS, 'b')],
+                 'host-2': [(0, TASKS, 'a'), (0, TASKS, 'b')]}
+        self.strategy._iterator = FakeIterator(steps)
+        self.strategy._get_next_tasks(self.hosts)
+        # a meta task moved host-2 without running its task
+        self.strategy._iterator.position['host-2'] = 2
+        self.strategy._reset_host_index()
+        self.assertEqual([[('host-0', 'b'), ('host-1', 'b')]], self._waves())
+
+        # a new iterator for the next play
+        self.strategy._iterator = FakeIterator(steps)
+        self.assertEqual(2, len(self._waves()))
+
+    def test_run_once_failure(self):
+        steps = {'host-0': [(0, TASKS, 'a'), (0, TASKS, 'b')],
+                 'host-1': [(0, TASKS, 'a'), (0, TASKS, 'b')],
+                 'host-2': [(1, TASKS, 'c')]}
+        self.strategy._iterator = FakeIterator(steps)
+        self.strategy._tqm = mock.MagicMock()
+        self.strategy._pending_results = 0
+        self.strategy._hosts_left = self.hosts
+        self.strategy.update_active_connections = mock.MagicMock()
+        result = mock.MagicMock()
+        result._task.run_once = True
+        result._task.ignore_errors = False
+        result.is_failed.return_value = True
+
+        def process_host_tasks(host, task):
+            # the run_once task failed, every host goes to its rescue
+            for name in steps:
+                position = self.strategy._iterator.position[name]
+                steps[name][position:] = [(0, RESCUE, 'r')]
+            return [result]
+
+        self.strategy._process_host_tasks = mock.MagicMock(
+            side_effect=process_host_tasks)
+        self.strategy.process_work()
+        self.assertEqual([('host-0', 'a'), ('host-1', 'a')], [
+            (c[0][0].name, c[0][1].name) for c in
+            self.strategy._process_host_tasks.call_args_list])
+
+        self.assertEqual([[('host-0', 'r'), ('host-1', 'r'),
+                           ('host-2', 'r')]], self._waves())
+
+    def test_host_left(self):
+        self.strategy._iterator = FakeIterator({
+            'host-0': [(0, TASKS, 'a'), (0, TASKS, 'b')],
+            'host-1': [(0, TASKS, 'a'), (0, TASKS, 'b')],
+            'host-2': [(0, TASKS, 'a'), (0, TASKS, 'b')],
+        })
+        self.strategy._get_next_tasks(self.hosts)
+        # host-1 became unreachable
+        del self.hosts[1]
+        self.assertEqual([[('host-0', 'b'), ('host-2', 'b')]], self._waves())
+        self.assertNotIn('host-1', self.strategy._host_tasks)